@@ -16,6 +16,40 @@ if PROJECT_ROOT not in sys.path:
 from conf import GlobalConfig
 
 
+def register_metrics(app: Flask) -> None:
+    """注册 /metrics 接口、请求耗时统计和瞬时值采集回调"""
+    import time
+    from flask import Response, g, request
+    from core.metrics import HTTP_REQUESTS, HTTP_LATENCY, make_task_collector, make_pipeline_collector
+    from core.report_pipeline import get_report_pipeline
+    from app.routes.test import test_tasks
+    from util.log_util import TempLog
+    from util.metrics_util import metrics_registry, CONTENT_TYPE
+
+    log = TempLog()
+    metrics_registry.register_collector(make_task_collector(lambda: list(test_tasks.values())))
+    metrics_registry.register_collector(make_pipeline_collector(get_report_pipeline))
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start_time = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start_time = g.pop("request_start_time", None)
+        # 使用路由规则作为标签（/api/report/files/<task_id>/...），避免路径参数导致标签无限增长
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+        if start_time is not None:
+            HTTP_LATENCY.observe(time.perf_counter() - start_time, method=request.method, endpoint=endpoint)
+        return response
+
+    @app.get(GlobalConfig["metrics"].get("path", "/metrics"))
+    def metrics():
+        body = metrics_registry.render(on_error=lambda e: log.warning(f"指标采集失败：{str(e)}"))
+        return Response(body, content_type=CONTENT_TYPE)
+
+
 def create_app():
     # 初始化 Flask 应用（指定模板文件夹路径，确保能找到 templates/index.html）
     app = Flask(
@@ -29,20 +63,64 @@ def create_app():
     app.config["REPORT_ROOT_DIR"] = GlobalConfig["path"]["report_root_dir"]
     app.config["SCHEDULER_API_ENABLED"] = False
 
+    # 模拟adb与设备集合（需在任何adb调用之前启动）
+    sim_config = GlobalConfig.get("device_sim", {})
+    if sim_config.get("enabled", False):
+        from core.device_sim import start_device_sim
+        from util.log_util import TempLog
+        server = start_device_sim(sim_config)
+        TempLog().warning(f"已启用模拟设备：{len(server.farm.devices)}台（{server.url}），adb 指向模拟客户端")
+
     # 初始化 APScheduler
     scheduler = APScheduler()
     scheduler.init_app(app)
     scheduler.start()
     app.config["SCHEDULER"] = scheduler
 
+    # 后台报告索引（趋势看板数据），启动后立即执行一次
+    index_config = GlobalConfig.get("report_index", {})
+    if index_config.get("enabled", False):
+        from datetime import datetime
+        from core.report_index import scan_report_index
+        scheduler.add_job(
+            id="report_index",
+            func=scan_report_index,
+            trigger="interval",
+            seconds=index_config.get("interval", 60),
+            next_run_time=datetime.now(),
+            max_instances=1,
+            coalesce=True
+        )
+
+    # 报告/日志保留策略（正在执行或生成报告的任务不会被清理）
+    retention_config = GlobalConfig.get("retention", {})
+    if retention_config.get("enabled", False):
+        from core.retention import init_retention_service, run_retention
+        from app.routes.test import get_active_task_ids, get_active_device_ids
+        init_retention_service(get_active_task_ids, get_active_device_ids)
+        scheduler.add_job(
+            id="retention",
+            func=run_retention,
+            trigger="interval",
+            seconds=retention_config.get("interval", 3600),
+            max_instances=1,
+            coalesce=True
+        )
+
     # 注册路由蓝图
     from app.routes.device import device_bp
     from app.routes.test import test_bp
     from app.routes.report import report_bp
+    from app.routes.logs import logs_bp
 
     app.register_blueprint(device_bp, url_prefix="/api/device")
     app.register_blueprint(test_bp, url_prefix="/api/test")
     app.register_blueprint(report_bp, url_prefix="/api/report")
+    app.register_blueprint(logs_bp, url_prefix="/api/logs")
+
+    # 运行指标（Prometheus 文本格式）
+    if GlobalConfig.get("metrics", {}).get("enabled", False):
+        register_metrics(app)
 
     # 修复：首页路由指向 templates/index.html（使用 render_template 渲染）
     @app.route("/")
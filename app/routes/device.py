@@ -1,9 +1,12 @@
 # @Time     : 2025/9/15 18:00
 # @Author   : zyli3
 # -*- coding: utf-8 -*-
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from core.device_manager import DeviceManager
+from core.device_sim import get_device_sim
+from core.duration_store import DurationStore
 from util.log_util import TempLog
+from util.timing_util import timing_registry
 
 device_bp = Blueprint("device", __name__)
 log = TempLog()
@@ -57,4 +60,73 @@ def get_device_status(device_id: str):
             "code": 400,
             "msg": error_msg,
             "data": None
-        })
\ No newline at end of file
+        })
+
+
+@device_bp.get("/<device_id>/trend")
+def get_device_trend(device_id: str):
+    """获取设备用例耗时变慢趋势（degrading=True 表示设备性能退化）"""
+    try:
+        log.info(f"收到设备{device_id}耗时趋势查询请求")
+        trend = DurationStore().get_device_trend(device_id)
+        return jsonify({
+            "code": 200,
+            "msg": "设备性能退化，请检查设备" if trend["degrading"] else "获取设备耗时趋势成功",
+            "data": trend
+        })
+    except Exception as e:
+        error_msg = f"获取设备{device_id}耗时趋势失败：{str(e)}"
+        log.error(error_msg)
+        return jsonify({
+            "code": 400,
+            "msg": error_msg,
+            "data": None
+        })
+
+
+@device_bp.get("/timings")
+def get_device_timings():
+    """
+    获取设备操作/任务阶段耗时直方图（进程启动以来的汇总）
+    查询参数：device_id（可选）、prefix（可选，ui. 为设备操作，stage. 为任务阶段）
+    """
+    try:
+        device_id = request.args.get("device_id") or None
+        prefix = request.args.get("prefix") or None
+        log.info(f"收到耗时统计查询请求（设备：{device_id or '全部'}，前缀：{prefix or '全部'}）")
+        return jsonify({
+            "code": 200,
+            "msg": "获取耗时统计成功",
+            "data": timing_registry.snapshot(device_id=device_id, prefix=prefix)
+        })
+    except Exception as e:
+        error_msg = f"获取耗时统计失败：{str(e)}"
+        log.error(error_msg)
+        return jsonify({
+            "code": 400,
+            "msg": error_msg,
+            "data": None
+        })
+
+
+@device_bp.get("/sim")
+def get_device_sim_stats():
+    """获取模拟设备服务状态（调用次数、失败/注入失败次数、按命令统计），未启用时 data.enabled 为 false"""
+    try:
+        server = get_device_sim()
+        data = {"enabled": False}
+        if server is not None:
+            data = {"enabled": True, "url": server.url, **server.farm.get_stats()}
+        return jsonify({
+            "code": 200,
+            "msg": "获取模拟设备状态成功",
+            "data": data
+        })
+    except Exception as e:
+        error_msg = f"获取模拟设备状态失败：{str(e)}"
+        log.error(error_msg)
+        return jsonify({
+            "code": 400,
+            "msg": error_msg,
+            "data": None
+        })
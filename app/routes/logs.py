@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Optional
+from flask import Blueprint, jsonify, request
+from conf import GlobalConfig
+from util.log_index import search_logs
+from util.log_util import TempLog
+from util.path_util import safe_join
+
+logs_bp = Blueprint("logs", __name__)
+log = TempLog()
+SEARCH_MAX_LIMIT = 2000
+
+
+def _parse_time(value: Optional[str], end_of_day: bool = False) -> Optional[float]:
+    """
+    时间参数：支持 "YYYY-mm-dd HH:MM:SS"、"YYYY-mm-dd" 或时间戳（秒）
+    :param end_of_day: 只有日期时取当天最后时刻（用于结束时间，包含当天全天）
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            timestamp = datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+        return timestamp + 24 * 3600 - 0.001 if end_of_day and fmt == "%Y-%m-%d" else timestamp
+    raise ValueError(f"时间格式错误：{value}（支持 YYYY-mm-dd HH:MM:SS / YYYY-mm-dd / 时间戳）")
+
+
+@logs_bp.get("/search")
+def search_structured_logs():
+    """
+    查询结构化日志
+    参数：device_id、task_id、level（最低级别）、event、start、end、keyword、limit
+    """
+    try:
+        log_root = GlobalConfig["path"]["log_root_dir"]
+        device_id = request.args.get("device_id")
+        task_id = request.args.get("task_id")
+        # 设备ID/任务ID用于拼接目录和文件名，防止路径穿越
+        for value in (device_id, task_id):
+            if value:
+                safe_join(log_root, value)
+        result = search_logs(
+            log_root,
+            device_id=device_id,
+            task_id=task_id,
+            min_level=request.args.get("level"),
+            event=request.args.get("event"),
+            start_ts=_parse_time(request.args.get("start")),
+            end_ts=_parse_time(request.args.get("end"), end_of_day=True),
+            keyword=request.args.get("keyword"),
+            limit=min(request.args.get("limit", 200, type=int), SEARCH_MAX_LIMIT)
+        )
+        return jsonify({
+            "code": 200,
+            "msg": f"查询到{len(result['records'])}条日志",
+            "data": result
+        })
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": str(e), "data": None})
+    except Exception as e:
+        error_msg = f"日志查询失败：{str(e)}"
+        log.error(error_msg, exc_info=True)
+        return jsonify({"code": 400, "msg": error_msg, "data": None})
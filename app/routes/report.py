@@ -1,12 +1,71 @@
 # @Time     : 2025/9/15 18:00
 # @Author   : zyli3
 # -*- coding: utf-8 -*-
+import glob
+import mimetypes
 import os
-from flask import Blueprint, jsonify, send_from_directory, abort
+import stat
+from functools import lru_cache
+from typing import Optional
+from flask import Blueprint, jsonify, send_file, abort, current_app, request, Response, stream_with_context
 from app.routes.test import test_tasks
+from conf import GlobalConfig
+from core.process_profiler import PROFILE_SUFFIXES
+from core.report_index import ReportIndex
+from core.retention import get_retention_service
+from core.report_static import get_static_root, get_referenced_static_dirs, SHARED_STATIC_DIRNAME
+from util.allure_util import load_json_file
+from util.archive_util import stream_archive, get_archive_extension, ARCHIVE_MIMETYPES
 from util.path_util import safe_join
+from util.precompress_util import select_variant, is_precompressed_variant
 
 report_bp = Blueprint("report", __name__)
+# 共享静态资源按版本号分目录，内容不可变，可长期缓存
+STATIC_CACHE_MAX_AGE = 365 * 24 * 3600
+# 报告入口页和执行中报告的数据会变化，浏览器每次用ETag协商
+REVALIDATE_CACHE_CONTROL = "no-cache"
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={STATIC_CACHE_MAX_AGE}, immutable"
+# 报告目录索引：任务ID -> 报告目录绝对路径（避免每次请求重复解析任务和路径）
+_report_dir_index: dict[str, str] = {}
+# 在线打包下载支持的内容（html：HTML报告，raw：Allure原始结果，logs：任务日志）
+ARCHIVE_PARTS = ("html", "raw", "logs")
+
+
+@report_bp.get("/trends")
+def get_report_trends():
+    """
+    跨任务趋势：按用例文件+设备+日期聚合的通过率、耗时，以及不稳定用例
+    参数：suite（用例文件名或路径）、device_id、days（最近N天）
+    """
+    try:
+        days = request.args.get("days", type=int)
+        data = ReportIndex().get_trends(
+            suite=request.args.get("suite"),
+            device_id=request.args.get("device_id"),
+            days=days
+        )
+        return jsonify({"code": 200, "msg": "获取报告趋势成功", "data": data})
+    except Exception as e:
+        return jsonify({"code": 400, "msg": f"获取报告趋势失败：{str(e)}", "data": None})
+
+
+@report_bp.get("/retention")
+def get_retention_status():
+    """保留策略状态：最近一次执行结果与最近删除记录（参数：limit）"""
+    service = get_retention_service()
+    if service is None:
+        return jsonify({"code": 404, "msg": "保留策略未启用", "data": None})
+    try:
+        return jsonify({
+            "code": 200,
+            "msg": "获取保留策略状态成功",
+            "data": {
+                "last_run": service.last_run,
+                "removed": service.get_removed(request.args.get("limit", 100, type=int))
+            }
+        })
+    except Exception as e:
+        return jsonify({"code": 400, "msg": f"获取保留策略状态失败：{str(e)}", "data": None})
 
 
 @report_bp.get("/<task_id>")
@@ -33,29 +92,213 @@ def get_report_info(task_id: str):
     })
 
 
+def _get_report_dir(task_id: str) -> Optional[str]:
+    """从报告目录索引获取任务报告目录（首次访问时从任务状态建立索引，目录被清理后移除）"""
+    report_dir = _report_dir_index.get(task_id)
+    if report_dir is None:
+        task = test_tasks.get(task_id)
+        if not task or not task.get("report_path"):
+            return None
+        report_dir = os.path.abspath(task["report_path"])
+        _report_dir_index[task_id] = report_dir
+    elif not os.path.isdir(report_dir):
+        _report_dir_index.pop(task_id, None)
+        return None
+    return report_dir
+
+
+@lru_cache(maxsize=4096)
+def _resolve_file(base_dir: str, filename: str) -> Optional[str]:
+    """安全拼接文件路径（纯路径计算，结果缓存；路径穿越返回None）"""
+    try:
+        return safe_join(base_dir, filename)
+    except ValueError:
+        return None
+
+
+def _is_report_final(task: dict) -> bool:
+    """报告是否已生成完毕（之后内容不再变化）"""
+    if "report_status" in task:
+        return task["report_status"] in ("done", "failed")
+    return task.get("status") not in ("pending", "running", "reporting")
+
+
+def _send_cached_file(file_path: str, cache_control: str):
+    """
+    发送静态文件：按 Accept-Encoding 返回预压缩文件，带强ETag（文件修改时间+大小+编码），
+    If-None-Match 命中时返回304
+    """
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(stat_result.st_mode):
+        return None
+    send_path, encoding, send_stat = select_variant(
+        file_path, stat_result, request.headers.get("Accept-Encoding")
+    )
+    etag = f"{send_stat.st_mtime_ns:x}-{send_stat.st_size:x}" + (f"-{encoding}" if encoding else "")
+    mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    response = send_file(
+        send_path, mimetype=mimetype, etag=etag, conditional=True, last_modified=stat_result.st_mtime
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
 @report_bp.get("/files/<task_id>/<path:filename>")
 def get_report_file(task_id: str, filename: str):
-    """获取报告静态文件（HTML/CSS/JS/图片）"""
-    # 1. 校验任务和报告目录
-    task = test_tasks.get(task_id)
-    if not task or "report_path" not in task:
+    """获取报告静态文件（HTML/CSS/JS/图片），支持预压缩和协商缓存"""
+    # 1. 从索引获取报告目录
+    report_dir = _get_report_dir(task_id)
+    if report_dir is None:
         abort(404, description=f"任务{task_id}报告不存在")
 
-    report_dir = task["report_path"]
-
     # 2. 安全拼接路径（防止路径穿越）
+    file_path = _resolve_file(report_dir, filename)
+    if file_path is None:
+        abort(403, description="非法文件访问（路径穿越）")
+    if is_precompressed_variant(file_path):
+        abort(404, description=f"报告文件不存在：{filename}")
+
+    # 3. 报告生成完成后除入口页外内容不再变化，可长期缓存
+    task = test_tasks.get(task_id, {})
+    if _is_report_final(task) and not filename.endswith(".html"):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = REVALIDATE_CACHE_CONTROL
+
+    response = _send_cached_file(file_path, cache_control)
+    if response is None:
+        abort(404, description=f"报告文件不存在：{filename}")
+    return response
+
+
+@report_bp.get("/_static/<version>/<path:filename>")
+def get_shared_static_file(version: str, filename: str):
+    """获取报告共享前端资源（带版本号，长期缓存）"""
+    static_root = get_static_root(current_app.config["REPORT_ROOT_DIR"])
+    version_dir = _resolve_file(os.path.abspath(static_root), version)
+    file_path = _resolve_file(version_dir, filename) if version_dir else None
+    if file_path is None:
+        abort(403, description="非法文件访问（路径穿越）")
+
+    response = _send_cached_file(file_path, IMMUTABLE_CACHE_CONTROL)
+    if response is None:
+        abort(404, description=f"共享资源不存在：{version}/{filename}")
+    return response
+
+
+def _get_archive_sources(task_id: str, task_dir: str, device_id: str, parts: list) -> list:
+    """
+    在线打包的文件来源，压缩包内保持 <task_id>/ 与 _static/ 的目录结构（与 result/ 一致），
+    HTML报告引用的共享资源相对路径解压后仍然有效
+    :return: [(源路径, 压缩包内路径前缀), ...]
+    """
+    report_root = current_app.config["REPORT_ROOT_DIR"]
+    sources = []
+    if "html" in parts:
+        html_dir = os.path.join(task_dir, "allure_html")
+        sources.append((html_dir, f"{task_id}/allure_html"))
+        for static_dir in get_referenced_static_dirs(html_dir, report_root):
+            sources.append((static_dir, f"{SHARED_STATIC_DIRNAME}/{os.path.basename(static_dir)}"))
+    if "raw" in parts:
+        sources.append((os.path.join(task_dir, "allure_raw"), f"{task_id}/allure_raw"))
+    if "logs" in parts:
+        # 任务目录下的日志与元数据 + 设备日志目录中的任务日志（logs/<设备ID>/<日期>/<任务ID>.log）
+        for name in os.listdir(task_dir):
+            if name.endswith((".log", ".json", *PROFILE_SUFFIXES.values())):
+                sources.append((os.path.join(task_dir, name), f"{task_id}/{name}"))
+        if device_id:
+            pattern = os.path.join(GlobalConfig["path"]["log_root_dir"], glob.escape(device_id), "*", f"{glob.escape(task_id)}.log")
+            for log_path in glob.glob(pattern):
+                date_str = os.path.basename(os.path.dirname(log_path))
+                sources.append((log_path, f"{task_id}/device_logs/{date_str}/{task_id}.log"))
+    return sources
+
+
+@report_bp.get("/<task_id>/archive")
+def download_report_archive(task_id: str):
+    """
+    在线打包下载报告（边读边压缩边输出，不生成临时文件）
+    参数：format=zip|tar|tar.gz|tar.zst（默认zip），include=html,raw,logs（默认全部）
+    """
+    fmt = request.args.get("format", "zip")
+    parts = [p.strip() for p in request.args.get("include", ",".join(ARCHIVE_PARTS)).split(",") if p.strip()]
+    try:
+        extension = get_archive_extension(fmt)
+    except ValueError as e:
+        return jsonify({"code": 400, "msg": str(e), "data": None})
+    invalid_parts = [p for p in parts if p not in ARCHIVE_PARTS]
+    if not parts or invalid_parts:
+        return jsonify({
+            "code": 400,
+            "msg": f"include参数无效：{invalid_parts}（支持：{list(ARCHIVE_PARTS)}）",
+            "data": None
+        })
+
+    report_root = current_app.config["REPORT_ROOT_DIR"]
     try:
-        file_path = safe_join(report_dir, filename)
+        task_dir = safe_join(report_root, task_id)
     except ValueError:
         abort(403, description="非法文件访问（路径穿越）")
+    # task_id 为 "." 等时会解析到报告根目录本身，不允许打包整个根目录
+    if os.path.normcase(task_dir) == os.path.normcase(os.path.abspath(report_root)):
+        abort(403, description="非法文件访问（路径穿越）")
+    if task_id.startswith("_") or not os.path.isdir(task_dir):
+        return jsonify({"code": 404, "msg": f"任务{task_id}报告目录不存在", "data": None})
+
+    device_id = test_tasks.get(task_id, {}).get("device_id")
+    chunks = stream_archive(
+        _get_archive_sources(task_id, task_dir, device_id, parts),
+        fmt=fmt,
+        level=GlobalConfig["test"].get("report_compress_level"),
+        workers=GlobalConfig["test"].get("report_compress_threads"),
+        exclude=is_precompressed_variant
+    )
+    response = Response(stream_with_context(chunks), mimetype=ARCHIVE_MIMETYPES[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="report_{task_id}{extension}"'
+    response.headers["X-Accel-Buffering"] = "no"  # 反向代理不缓冲，边生成边下发
+    return response
 
-    # 3. 校验文件存在性
-    if not file_path or not os.path.exists(file_path):
-        abort(404, description=f"报告文件不存在：{filename}")
 
-    # 4. 处理HTML文件的MIME类型
-    if filename.endswith('.html'):
-        return send_from_directory(report_dir, filename, as_attachment=False, mimetype='text/html')
+def _get_profile_path(task_id: str, kind: str) -> Optional[str]:
+    """资源画像产物路径（与 task_<id>.log 同目录，路径穿越返回None）"""
+    try:
+        return safe_join(current_app.config["REPORT_ROOT_DIR"], task_id, f"task_{task_id}{PROFILE_SUFFIXES[kind]}")
+    except ValueError:
+        return None
+
 
-    # 5. 返回其他静态文件
-    return send_from_directory(report_dir, filename, as_attachment=False)
\ No newline at end of file
+@report_bp.get("/<task_id>/profile")
+def get_task_profile(task_id: str):
+    """
+    获取Pytest子进程资源画像：汇总、产物下载地址、时间序列
+    参数：samples=0 时不返回时间序列
+    """
+    profile_path = _get_profile_path(task_id, "summary")
+    data = load_json_file(profile_path) if profile_path else None
+    if not data:
+        return jsonify({"code": 404, "msg": f"任务{task_id}未采集资源画像", "data": None})
+    data["artifact_urls"] = {
+        kind: f"/api/report/{task_id}/profile/{kind}" for kind in data.get("artifacts", {})
+    }
+    if request.args.get("samples", "1") == "0":
+        data.pop("samples", None)
+    return jsonify({"code": 200, "msg": "获取资源画像成功", "data": data})
+
+
+@report_bp.get("/<task_id>/profile/<kind>")
+def download_task_profile(task_id: str, kind: str):
+    """下载资源画像产物（kind：summary/pstats/text/flame）"""
+    if kind not in PROFILE_SUFFIXES:
+        return jsonify({"code": 400, "msg": f"不支持的画像产物：{kind}（支持：{list(PROFILE_SUFFIXES)}）", "data": None})
+    profile_path = _get_profile_path(task_id, kind)
+    if profile_path is None:
+        abort(403, description="非法文件访问（路径穿越）")
+    if not os.path.isfile(profile_path):
+        return jsonify({"code": 404, "msg": f"任务{task_id}画像产物不存在：{kind}", "data": None})
+    return send_file(profile_path, as_attachment=kind in ("pstats", "summary"))
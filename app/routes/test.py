@@ -2,13 +2,19 @@
 # @Author   : zyli3
 # -*- coding: utf-8 -*-
 import os
+import time
 import traceback
 import uuid
 from flask import Blueprint, jsonify, request, current_app
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Optional
 from threading import Thread
 from core.test_executor import TestExecutor
 from core.device_manager import DeviceManager
+from core.duration_store import DurationStore
+from core.metrics import TASKS_STARTED, TASKS_FINISHED, REPORT_LATENCY, classify_task_status
+from core.report_pipeline import ReportJob, get_report_pipeline
+from conf import GlobalConfig
 from util.log_util import TempLog
 from util.path_util import safe_join
 
@@ -58,26 +64,124 @@ def get_test_suites() -> list[dict]:
         return []
 
 
-def run_task_background(task_id: str, device_id: str, suite_abs_path: str) -> None:
-    """后台执行测试任务（独立线程）"""
+def _fill_task_eta(task_id: str, device_id: str, suite_abs_path: str) -> None:
+    """根据用例耗时历史预估任务耗时和结束时间（无历史时不填写）"""
+    try:
+        eta_seconds = DurationStore().estimate_suite_seconds(suite_abs_path, device_id)
+    except Exception as e:
+        log.warning(f"任务{task_id}耗时预估失败：{str(e)}")
+        return
+    if eta_seconds is None:
+        return
+    test_tasks[task_id]["eta_seconds"] = eta_seconds
+    test_tasks[task_id]["expected_end_time"] = (
+        datetime.now() + timedelta(seconds=eta_seconds)
+    ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def get_active_task_ids() -> set:
+    """正在执行或报告未生成完的任务（保留策略不清理这些任务目录）"""
+    return {
+        task_id for task_id, task in list(test_tasks.items())
+        if task.get("status") in ("pending", "running", "reporting")
+        or task.get("report_status") in ("queued", "generating", "compressing")
+    }
+
+
+def get_active_device_ids() -> set:
+    """有任务正在执行的设备（保留策略不删除这些设备的日志目录）"""
+    return {
+        task.get("device_id") for task in list(test_tasks.values())
+        if task.get("status") in ("pending", "running")
+    }
+
+
+def _record_task_finished(task_id: str) -> None:
+    """任务结束（测试与报告均已完成）时计数"""
+    task = test_tasks.get(task_id) or {}
+    TASKS_FINISHED.inc(device_id=task.get("device_id", ""), result=classify_task_status(task.get("status")))
+
+
+def _merge_task_result(task_id: str, fields: dict) -> None:
+    """合并字段到任务状态（任务已被用户停止时保留 stopped 状态，只更新报告等字段）"""
+    task = test_tasks[task_id]
+    if task.get("status") == "stopped":
+        fields = {key: value for key, value in fields.items() if key != "status"}
+    task.update(fields)
+
+
+def _update_task(task_id: str, fields: dict) -> None:
+    """报告流水线状态回调：合并字段到任务状态"""
+    if task_id in test_tasks:
+        _merge_task_result(task_id, fields)
+        if "status" in fields and fields.get("report_status") in ("done", "failed"):
+            _record_task_finished(task_id)
+
+
+def _submit_report_job(executor: TestExecutor, pytest_result: dict) -> None:
+    """提交报告生成到异步流水线（队列满超时则在当前线程同步生成）"""
+    pipeline = get_report_pipeline()
+    job = ReportJob(executor, pytest_result, _update_task)
+    submit_timeout = GlobalConfig.get("report_pipeline", {}).get("submit_timeout", 30)
+    if pipeline.submit(job, timeout=submit_timeout):
+        return
+
+    log.warning(f"报告流水线队列已满，任务{executor.task_id}改为同步生成报告")
+    test_tasks[executor.task_id]["report_status"] = "generating"
+    report_result = executor.generate_allure_report()
+    task_result = executor.build_task_result(pytest_result, report_result)
+    task_result["report_status"] = "done" if report_result["status"] == "success" else "failed"
+    REPORT_LATENCY.observe(time.time() - job.submit_time, result=task_result["report_status"])
+    _merge_task_result(executor.task_id, task_result)
+    _record_task_finished(executor.task_id)
+    executor.close()
+
+
+def run_task_background(task_id: str, device_id: str, suite_abs_path: str, profile: Optional[bool] = None) -> None:
+    """
+    后台执行测试任务（独立线程）
+    :param profile: 是否采集Pytest子进程资源画像（None 表示按配置）
+    """
     # 更新任务状态为"running"
     test_tasks[task_id]["status"] = "running"
     test_tasks[task_id]["start_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _fill_task_eta(task_id, device_id, suite_abs_path)
 
     try:
         # 1. 获取设备实例（确保初始化成功）
         DeviceManager.get_uiautomator_instance(device_id, task_id)
 
         # 2. 执行测试
-        executor = TestExecutor(task_id, device_id, suite_abs_path)
-        task_result = executor.execute()
-
-        # 3. 更新任务结果
-        test_tasks[task_id].update(task_result)
+        executor = TestExecutor(task_id, device_id, suite_abs_path, profile=profile)
+        if executor.incremental_report:
+            # 增量报告：执行期间即可访问部分结果
+            test_tasks[task_id]["report_path"] = executor.allure_html_dir
+
+        if get_report_pipeline() is None:
+            # 未启用报告流水线：同步执行测试并生成报告
+            with executor:
+                test_tasks[task_id].update(executor.execute())
+            _record_task_finished(task_id)
+            return
+
+        try:
+            pytest_result = executor.run_tests()
+        except Exception as e:
+            with executor:
+                _merge_task_result(task_id, executor.handle_exception(e))
+            _record_task_finished(task_id)
+            return
+        test_tasks[task_id]["pytest_returncode"] = pytest_result["pytest_returncode"]
+        # Pytest已结束、设备即将释放，任务进入报告阶段（不再允许停止）
+        if test_tasks[task_id]["status"] == "running":
+            test_tasks[task_id]["status"] = "reporting"
     finally:
-        # 4. 释放设备实例（无论成功失败）
+        # 3. 释放设备实例（无论成功失败，Pytest结束即释放）
         DeviceManager.release_device(device_id)
 
+    # 4. 报告生成/压缩交给异步流水线
+    _submit_report_job(executor, pytest_result)
+
 
 # ------------------- 接口定义 -------------------
 @test_bp.get("/suites")
@@ -109,12 +213,15 @@ def start_test():
         req_data = request.get_json() or {}
         device_id = req_data.get("device_id")
         suite_id = req_data.get("suite_id")
+        profile = req_data.get("profile")  # 可选：是否采集资源画像（不传按配置）
 
         # 2. 参数校验
         if not device_id:
             return jsonify({"code": 400, "msg": "请指定设备ID", "data": None})
         if suite_id is None:
             return jsonify({"code": 400, "msg": "请指定用例ID", "data": None})
+        if profile is not None and not isinstance(profile, bool):
+            return jsonify({"code": 400, "msg": "profile参数必须为布尔值", "data": None})
 
         # 3. 获取用例路径
         suites = get_test_suites()
@@ -128,16 +235,17 @@ def start_test():
             "task_id": task_id,
             "device_id": device_id,
             "suite_info": suite_info,
-            "status": "pending",  # pending/running/success/failed
+            "status": "pending",  # pending/running/reporting（报告流水线处理中）/success/failed/stopped
             "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
 
         # 5. 后台启动任务（避免阻塞Web请求）
         Thread(
             target=run_task_background,
-            args=(task_id, device_id, suite_info["abs_path"]),
+            args=(task_id, device_id, suite_info["abs_path"], profile),
             daemon=True  # 守护线程，Web服务退出时自动结束
         ).start()
+        TASKS_STARTED.inc(device_id=device_id)
 
         log.info(f"任务{task_id}创建成功（设备：{device_id}，用例：{suite_info['name']}）")
         return jsonify({
@@ -186,6 +294,19 @@ def get_task_status(task_id: str):
         })
 
 
+@test_bp.get("/report_pipeline")
+def get_report_pipeline_status():
+    """查询报告流水线状态（队列深度、运行中阶段、累计处理数）"""
+    pipeline = get_report_pipeline()
+    if pipeline is None:
+        return jsonify({"code": 200, "msg": "报告流水线未启用", "data": None})
+    return jsonify({
+        "code": 200,
+        "msg": "查询报告流水线状态成功",
+        "data": pipeline.status()
+    })
+
+
 @test_bp.get("/running")
 def get_running_tasks():
     """获取所有运行中任务"""
@@ -221,7 +342,7 @@ def stop_test_task(task_id: str):
                 "data": None
             })
 
-        if task["status"] != "running":
+        if task["status"] != "running" or task.get("pytest_returncode") is not None:
             return jsonify({
                 "code": 400,
                 "msg": f"任务{task_id}不在运行中，状态：{task['status']}",
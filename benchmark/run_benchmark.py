@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+框架自身基准测试（无需真机）：启动模拟设备服务 + adb 替身，在临时工作目录中测量
+- 设备操作吞吐（click/press，次/秒）
+- 层级查询延迟（check_text_exists，按不同层级节点数）
+- 设备列表延迟（DeviceManager.get_device_list，按设备数）
+- 任务启动延迟（POST /api/test/start，需要Flask；只测接口，不真正执行Pytest）
+- 报告生成耗时（进程内报告生成器，合成的Allure原始结果）
+结果写入JSON，可用 --baseline 与历史结果对比
+
+adb 替身每次调用都会启动一个Python解释器（约数十毫秒，远高于真实adb客户端），
+因此先测量替身的单次调用开销（模拟延迟置0），设备操作/层级查询同时输出扣除该开销后的 net_avg_ms，
+即“adb客户端零开销”时的耗时（含模拟的设备延迟与框架自身开销）
+
+用法（项目根目录）：
+    python -m benchmark.run_benchmark --devices 20 --latency-ms 5 --hierarchy-nodes 200,2000
+    python -m benchmark.run_benchmark --baseline benchmark/results/bench_20250101_120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from conf import GlobalConfig  # noqa: E402
+
+DEFAULT_OUTPUT_DIR = os.path.join(PROJECT_ROOT, "benchmark", "results")
+# 与基线对比时，这些指标越大越好（其余耗时类指标越小越好）
+HIGHER_IS_BETTER = ("per_second",)
+
+
+# ------------------- 工具 -------------------
+def summarize(durations: list[float]) -> dict:
+    """耗时统计（输入秒，输出毫秒）"""
+    if not durations:
+        return {"count": 0}
+    values = sorted(d * 1000 for d in durations)
+
+    def _pct(q: float) -> float:
+        return round(values[min(int(q * len(values)), len(values) - 1)], 3)
+
+    return {
+        "count": len(values),
+        "avg_ms": round(sum(values) / len(values), 3),
+        "p50_ms": _pct(0.5),
+        "p95_ms": _pct(0.95),
+        "p99_ms": _pct(0.99),
+        "max_ms": round(values[-1], 3)
+    }
+
+
+def measure(func: Callable[[], object], iterations: int) -> list[float]:
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def get_git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=5
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def setup_workspace(workspace: str) -> None:
+    """报告/日志/历史库指向临时目录，关闭后台任务，不影响正式数据"""
+    GlobalConfig["path"]["report_root_dir"] = os.path.join(workspace, "result")
+    GlobalConfig["path"]["log_root_dir"] = os.path.join(workspace, "logs")
+    GlobalConfig["path"]["history_db"] = os.path.join(workspace, "result", "history.db")
+    for section in ("report_index", "retention", "device_perf"):
+        GlobalConfig.setdefault(section, {})["enabled"] = False
+    os.makedirs(GlobalConfig["path"]["report_root_dir"], exist_ok=True)
+
+
+def create_uiautomator(device_id: str, log):
+    """
+    创建 Uiautomator 实例（不执行 uiautomator2 init：该步骤安装设备端APK，与adb调用开销无关）
+    """
+    from core.uiautomator import Uiautomator
+    return Uiautomator(device_id, log_util=log, install_agent=False)
+
+
+def measure_adb_client(farm, iterations: int) -> dict:
+    """
+    adb 替身单次调用开销（进程启动 + 本地HTTP往返）：模拟延迟与抖动临时置0，执行 `adb shell echo`
+    :return: 耗时统计（毫秒）
+    """
+    adb_path = GlobalConfig["device"]["adb_path"]
+    cmd = [adb_path, "-s", next(iter(farm.devices)), "shell", "echo"]
+    latency, jitter = farm.latency_ms, farm.jitter_ms
+    farm.latency_ms, farm.jitter_ms = 0, 0
+    try:
+        return summarize(measure(lambda: subprocess.run(cmd, capture_output=True), iterations))
+    finally:
+        farm.latency_ms, farm.jitter_ms = latency, jitter
+
+
+def measure_operation(farm, func: Callable[[], object], iterations: int, client_ms: float) -> dict:
+    """
+    测量一项设备操作，并按实际adb调用次数扣除替身开销
+    :param client_ms: adb 替身单次调用平均开销（毫秒）
+    """
+    calls_before = farm.stats["calls"]
+    start = time.perf_counter()
+    durations = measure(func, iterations)
+    elapsed = time.perf_counter() - start
+    stats = summarize(durations)
+    calls_per_op = (farm.stats["calls"] - calls_before) / iterations
+    return {
+        **stats,
+        "per_second": round(iterations / elapsed, 2),
+        "adb_calls_per_op": round(calls_per_op, 2),
+        "net_avg_ms": round(max(stats["avg_ms"] - calls_per_op * client_ms, 0), 3)
+    }
+
+
+# ------------------- 基准项 -------------------
+def bench_actions(farm, iterations: int, log, client_ms: float) -> dict:
+    device = create_uiautomator(next(iter(farm.devices)), log)
+    return {
+        name: measure_operation(farm, func, iterations, client_ms)
+        for name, func in (("click", lambda: device.click(100, 200)), ("press", lambda: device.press("home")))
+    }
+
+
+def bench_hierarchy(farm, node_counts: list[int], iterations: int, log, client_ms: float) -> dict:
+    device = create_uiautomator(next(iter(farm.devices)), log)
+    results = {}
+    for nodes in node_counts:
+        farm.hierarchy_nodes = nodes
+        size = len(farm.get_hierarchy())
+        results[str(nodes)] = {
+            **measure_operation(farm, lambda: device.check_text_exists("相机"), iterations, client_ms),
+            "xml_bytes": size
+        }
+    return results
+
+
+def bench_device_list(iterations: int) -> dict:
+    from core.device_manager import DeviceManager
+    devices = []
+    durations = measure(lambda: devices.append(len(DeviceManager.get_device_list())), iterations)
+    return {**summarize(durations), "devices": devices[-1] if devices else 0}
+
+
+def bench_task_start(farm, iterations: int) -> dict:
+    """任务启动接口延迟（后台执行函数替换为只标记运行中，不启动Pytest）"""
+    try:
+        from app import create_app
+        import app.routes.test as test_routes
+    except ImportError as e:
+        return {"skipped": f"Web依赖未安装：{str(e)}"}
+
+    def _mark_running(task_id: str, device_id: str, suite_abs_path: str, profile=None) -> None:
+        test_routes.test_tasks[task_id]["status"] = "running"
+
+    original = test_routes.run_task_background
+    test_routes.run_task_background = _mark_running
+    try:
+        client = create_app().test_client()
+        device_id = next(iter(farm.devices))
+        status_durations, responses = [], []
+
+        def _start() -> None:
+            start = time.perf_counter()
+            response = client.post("/api/test/start", json={"device_id": device_id, "suite_id": 0})
+            task_id = (response.get_json().get("data") or {}).get("task_id")
+            responses.append(response.get_json().get("code"))
+            if task_id:
+                while test_routes.test_tasks[task_id]["status"] != "running":
+                    time.sleep(0.0005)
+                status_durations.append(time.perf_counter() - start)
+
+        start_durations = measure(_start, iterations)
+        return {
+            "request": summarize(start_durations),
+            "until_running": summarize(status_durations),
+            "ok": responses.count(200)
+        }
+    finally:
+        test_routes.run_task_background = original
+        test_routes.test_tasks.clear()
+
+
+def write_raw_results(raw_dir: str, test_count: int, attachment_every: int = 5) -> None:
+    """合成Allure原始结果（状态按 通过/失败/跳过 分布，部分用例带文本附件）"""
+    os.makedirs(raw_dir, exist_ok=True)
+    now_ms = int(time.time() * 1000)
+    statuses = ["passed"] * 8 + ["failed", "skipped"]
+    for i in range(test_count):
+        result_uuid = str(uuid.uuid4())
+        attachments = []
+        if i % attachment_every == 0:
+            source = f"{uuid.uuid4()}-attachment.txt"
+            with open(os.path.join(raw_dir, source), "w", encoding="utf-8") as f:
+                f.write(f"benchmark log {i}\n" * 50)
+            attachments.append({"name": "log", "source": source, "type": "text/plain"})
+        result = {
+            "name": f"test_case{i:05d}",
+            "status": statuses[i % len(statuses)],
+            "steps": [{"name": "step", "status": "passed", "start": now_ms, "stop": now_ms + 5}],
+            "attachments": attachments,
+            "start": now_ms + i * 10,
+            "stop": now_ms + i * 10 + 8,
+            "uuid": result_uuid,
+            "historyId": uuid.uuid4().hex,
+            "fullName": f"test_suite.benchmark#test_case{i:05d}",
+            "labels": [
+                {"name": "suite", "value": f"benchmark_{i % 10}"},
+                {"name": "feature", "value": "基准测试"},
+                {"name": "severity", "value": "normal"}
+            ]
+        }
+        with open(os.path.join(raw_dir, f"{result_uuid}-result.json"), "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+
+
+def bench_report(workspace: str, test_counts: list[int], rounds: int, log) -> dict:
+    from core.report_builder import AllureReportBuilder
+    from core.report_static import precompress_report_assets
+    report_root = GlobalConfig["path"]["report_root_dir"]
+    results = {}
+    for count in test_counts:
+        task_dir = os.path.join(report_root, f"bench_{count}")
+        raw_dir, html_dir = os.path.join(task_dir, "allure_raw"), os.path.join(task_dir, "allure_html")
+        write_raw_results(raw_dir, count)
+        build_durations, precompress_durations = [], []
+        for _ in range(rounds):
+            builder = AllureReportBuilder(raw_dir, html_dir, title="benchmark", log=log, report_root=report_root)
+            start = time.perf_counter()
+            builder.build(clean=True)
+            build_durations.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            precompress_report_assets(html_dir)
+            precompress_durations.append(time.perf_counter() - start)
+        results[str(count)] = {"build": summarize(build_durations), "precompress": summarize(precompress_durations)}
+        shutil.rmtree(task_dir, ignore_errors=True)
+    return results
+
+
+# ------------------- 对比 -------------------
+def flatten(data: dict, prefix: str = "") -> dict:
+    items = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[path] = value
+    return items
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """
+    与基线结果对比（只比较 avg/p50/p95/net_avg/per_second）
+    :return: {指标路径: {"baseline", "current", "change_percent", "regression"}}
+    """
+    base_items = flatten(baseline.get("results", {}))
+    diff = {}
+    for path, value in flatten(current["results"]).items():
+        metric = path.rsplit(".", 1)[-1]
+        if metric not in ("avg_ms", "p50_ms", "p95_ms", "net_avg_ms", "per_second") or path not in base_items:
+            continue
+        base = base_items[path]
+        if not base:
+            continue
+        change = round((value - base) / base * 100, 2)
+        higher_better = metric in HIGHER_IS_BETTER
+        diff[path] = {
+            "baseline": base,
+            "current": value,
+            "change_percent": change,
+            "regression": change < -10 if higher_better else change > 10
+        }
+    return diff
+
+
+# ------------------- 入口 -------------------
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="自动化框架基准测试（模拟设备）")
+    parser.add_argument("--devices", type=int, default=10, help="模拟设备数")
+    parser.add_argument("--latency-ms", type=float, default=5, help="每次adb调用的模拟延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟随机抖动上限（毫秒）")
+    parser.add_argument("--hierarchy-nodes", default="200,2000", help="层级节点数（逗号分隔）")
+    parser.add_argument("--iterations", type=int, default=50, help="每项测量次数")
+    parser.add_argument("--report-tests", default="100,1000", help="报告生成的用例数（逗号分隔）")
+    parser.add_argument("--report-rounds", type=int, default=3, help="报告生成重复次数")
+    parser.add_argument("--only", default="", help="只运行指定项（actions,hierarchy,device_list,task_start,report）")
+    parser.add_argument("--output", help="结果JSON路径（默认 benchmark/results/bench_<时间>.json）")
+    parser.add_argument("--baseline", help="对比的基线结果JSON")
+    return parser.parse_args(argv)
+
+
+def run(args: argparse.Namespace) -> dict:
+    from core.device_sim import DeviceFarm, start_device_sim, stop_device_sim
+
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    workspace = tempfile.mkdtemp(prefix="uitest_bench_")
+    farm = DeviceFarm(args.devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    start_device_sim({}, farm=farm)
+    setup_workspace(workspace)
+
+    from util.log_util import LogUtil
+    log = LogUtil(device_id="benchmark", task_id="benchmark", logger_name="benchmark")
+    results = {}
+    adb_client = measure_adb_client(farm, max(args.iterations // 2, 5))
+    client_ms = adb_client["avg_ms"]
+    benches = {
+        "actions": lambda: bench_actions(farm, args.iterations, log, client_ms),
+        "hierarchy": lambda: bench_hierarchy(
+            farm, [int(n) for n in args.hierarchy_nodes.split(",")], args.iterations, log, client_ms
+        ),
+        "device_list": lambda: bench_device_list(max(args.iterations // 10, 3)),
+        "task_start": lambda: bench_task_start(farm, args.iterations),
+        "report": lambda: bench_report(
+            workspace, [int(n) for n in args.report_tests.split(",")], args.report_rounds, log
+        )
+    }
+    try:
+        for name, bench in benches.items():
+            if only and name not in only:
+                continue
+            print(f"[benchmark] {name} ...", flush=True)
+            start = time.perf_counter()
+            results[name] = bench()
+            print(f"[benchmark] {name} 完成（{time.perf_counter() - start:.2f}秒）", flush=True)
+    finally:
+        log.close()
+        stop_device_sim()
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "meta": {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "git_commit": get_git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "adb_calls": farm.stats["calls"],
+            "adb_client": adb_client
+        },
+        "results": results
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_args(argv)
+    report = run(args)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+        regressions = {k: v for k, v in report["comparison"].items() if v["regression"]}
+        for path, item in regressions.items():
+            print(f"[regression] {path}: {item['baseline']} -> {item['current']}（{item['change_percent']:+.2f}%）")
+
+    output = args.output or os.path.join(
+        DEFAULT_OUTPUT_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[benchmark] 结果已保存：{output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
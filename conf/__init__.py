@@ -30,6 +30,7 @@ def load_config() -> dict:
         "REPORT_ROOT_DIR", config["path"]["report_root_dir"]
     )
     config["web"]["port"] = int(os.getenv("WEB_PORT", config["web"]["port"]))
+    config["device"]["adb_path"] = os.getenv("ADB_PATH", config["device"]["adb_path"])
 
     # 标准化路径（处理相对路径为绝对路径，基于项目根目录）
     PROJECT_ROOT = os.path.dirname(CONF_DIR)  # 项目根目录 = conf的父目录
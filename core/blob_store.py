@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+附件去重存储：按内容哈希保存到 <report_root>/_blobs/<前2位>/<sha256>，
+各任务 allure_raw / allure_html 中的附件以硬链接指向同一份数据（文件系统不支持硬链接时退化为复制）
+- 相同截图/层级XML/日志只写一次磁盘
+- 保留策略删除任务目录后，链接数为1的数据文件即无人引用，由 gc 清理
+"""
+import hashlib
+import importlib.metadata
+import os
+import shutil
+import uuid
+from typing import Optional
+from conf import GlobalConfig
+
+BLOB_DIRNAME = "_blobs"
+ATTACHMENT_MARK = "-attachment"
+HASH_CHUNK_SIZE = 1024 * 1024
+# attach_bytes 使用 allure-pytest 的私有接口（plugin.allure_logger / AllureReporter._attach），
+# 只在验证过的版本上启用（与 requirement/common.txt 的固定版本一致），其他版本退化为公开的 allure.attach
+ALLURE_PRIVATE_API_VERSIONS = ("2.13.",)
+
+
+def _link_or_copy_new(src: str, dest: str) -> bool:
+    try:
+        os.link(src, dest)
+        return True
+    except OSError:
+        shutil.copyfile(src, dest)
+        return False
+
+
+def link_or_copy(src: str, dest: str) -> bool:
+    """
+    硬链接文件（目标已存在时覆盖），文件系统不支持硬链接时复制
+    :return: 是否为硬链接
+    """
+    tmp_path = f"{dest}.{uuid.uuid4().hex[:8]}.tmp"
+    linked = _link_or_copy_new(src, tmp_path)
+    os.replace(tmp_path, dest)
+    return linked
+
+
+class BlobStore:
+    """内容寻址存储（sha256）"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.path.join(GlobalConfig["path"]["report_root_dir"], BLOB_DIRNAME)
+
+    def get_blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _store(self, digest: str, write_func) -> str:
+        """数据不存在时写入（临时文件 + 重命名，并发写入同一内容时保留先完成的）"""
+        blob_path = self.get_blob_path(digest)
+        if os.path.exists(blob_path):
+            return blob_path
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, blob_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return blob_path
+
+    def put_bytes(self, data: bytes) -> str:
+        """保存数据，返回数据文件路径（内容已存在时不写磁盘）"""
+        digest = hashlib.sha256(data).hexdigest()
+
+        def _write(tmp_path: str) -> None:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        return self._store(digest, _write)
+
+    def put_file(self, path: str) -> tuple[str, bool]:
+        """
+        将已有文件纳入存储并替换为指向数据文件的硬链接
+        :return: (数据文件路径, 是否与已有内容重复)
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        blob_path = self.get_blob_path(digest.hexdigest())
+        duplicate = os.path.exists(blob_path)
+        if not duplicate:
+            self._store(digest.hexdigest(), lambda tmp_path: _link_or_copy_new(path, tmp_path))
+        elif not os.path.samefile(path, blob_path):
+            link_or_copy(blob_path, path)
+        return blob_path, duplicate
+
+    def dedup_dir(self, dir_path: str, name_mark: str = ATTACHMENT_MARK) -> dict:
+        """
+        对目录下的附件文件去重（文件名包含 name_mark，如 Allure 的 <uuid>-attachment.png；传空字符串处理全部文件）
+        :return: {"files": 处理文件数, "duplicates": 重复文件数, "saved_bytes": 节省字节数}
+        """
+        stats = {"files": 0, "duplicates": 0, "saved_bytes": 0}
+        if not os.path.isdir(dir_path):
+            return stats
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if name_mark not in entry.name or not entry.is_file(follow_symlinks=False):
+                    continue
+                stat_result = entry.stat()
+                if stat_result.st_nlink > 1:
+                    continue  # 已经是数据文件的硬链接
+                size = stat_result.st_size
+                _, duplicate = self.put_file(entry.path)
+                stats["files"] += 1
+                if duplicate:
+                    stats["duplicates"] += 1
+                    stats["saved_bytes"] += size
+        return stats
+
+    def gc(self) -> dict:
+        """清理无人引用的数据文件（硬链接数为1，即只剩存储自身）"""
+        stats = {"removed": 0, "freed_bytes": 0}
+        if not os.path.isdir(self.root):
+            return stats
+        with os.scandir(self.root) as buckets:
+            for bucket in buckets:
+                if not bucket.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(bucket.path) as blobs:
+                    for blob in blobs:
+                        if blob.name.endswith(".tmp"):
+                            continue  # 正在写入
+                        stat_result = blob.stat(follow_symlinks=False)
+                        if stat_result.st_nlink <= 1:
+                            os.remove(blob.path)
+                            stats["removed"] += 1
+                            stats["freed_bytes"] += stat_result.st_size
+        return stats
+
+
+# ------------------- Pytest进程内的附件接口 -------------------
+_allure_dir: Optional[str] = None
+
+
+def set_allure_dir(allure_dir: Optional[str]) -> None:
+    """记录本次Pytest的 --alluredir（conftest 的 pytest_configure 中调用）"""
+    global _allure_dir
+    _allure_dir = os.path.abspath(allure_dir) if allure_dir else None
+
+
+def _get_allure_reporter():
+    """获取 allure-pytest 当前的 AllureReporter（未启用allure或版本未经验证时返回None）"""
+    try:
+        version = importlib.metadata.version("allure-pytest")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+    if not version.startswith(ALLURE_PRIVATE_API_VERSIONS):
+        return None
+    import allure_commons
+    for plugin in allure_commons.plugin_manager.get_plugins():
+        reporter = getattr(plugin, "allure_logger", None)
+        if reporter is not None and hasattr(reporter, "_attach"):
+            return reporter
+    return None
+
+
+def attach_bytes(data: bytes, name: str, attachment_type=None, extension: Optional[str] = None) -> None:
+    """
+    添加Allure附件（去重存储）：内容写入数据文件（已存在则跳过），再硬链接到 allure_raw
+    未启用去重或allure插件接口不可用时，退化为 allure.attach
+    :param attachment_type: allure.attachment_type 成员或MIME类型字符串
+    """
+    import allure
+    reporter = _get_allure_reporter() if _allure_dir and GlobalConfig["test"].get("dedup_attachments", False) else None
+    if reporter is None:
+        allure.attach(data, name=name, attachment_type=attachment_type, extension=extension)
+        return
+    store = BlobStore()
+    blob_path = store.put_bytes(data)
+    try:
+        file_name = reporter._attach(uuid.uuid4(), name=name, attachment_type=attachment_type, extension=extension)
+    except (TypeError, AttributeError):
+        # 私有接口签名变化：退化为公开接口（不去重）
+        allure.attach(data, name=name, attachment_type=attachment_type, extension=extension)
+        return
+    try:
+        link_or_copy(blob_path, os.path.join(_allure_dir, file_name))
+    except FileNotFoundError:
+        # 数据文件恰好被gc清理，重新写入
+        link_or_copy(store.put_bytes(data), os.path.join(_allure_dir, file_name))
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import subprocess
+import time
 import weakref
+from core.metrics import observe_adb, DEVICE_INIT_LATENCY, DEVICE_INIT_FAILURES
 from core.uiautomator import Uiautomator
 from util.log_util import TempLog
 from conf import GlobalConfig
@@ -19,6 +21,7 @@ class DeviceManager:
                 [GlobalConfig["device"]["adb_path"], "devices"],
                 capture_output=True, text=True, encoding="utf-8"
             )
+            observe_adb("devices", result.returncode != 0)
             if result.returncode != 0:
                 log.error(f"ADB查询设备失败：{result.stderr}")
                 return []
@@ -41,6 +44,7 @@ class DeviceManager:
             log.info(f"获取在线设备{len(devices)}个：{[d['device_id'] for d in devices]}")
             return devices
         except Exception as e:
+            observe_adb("devices", True)
             log.error(f"获取设备列表失败：{str(e)}", exc_info=True)
             return []
 
@@ -53,8 +57,10 @@ class DeviceManager:
                  "shell", "/data/local/tmp/atx-agent", "version"],
                 capture_output=True, text=True, encoding="utf-8", timeout=5
             )
+            observe_adb("atx_version", result.returncode != 0)
             return result.stdout.strip() if result.returncode == 0 else "unknown"
         except:
+            observe_adb("atx_version", True)
             return "unknown"
 
     @staticmethod
@@ -76,7 +82,18 @@ class DeviceManager:
 
         # 2. 新建实例（带日志）
         log_util = LogUtil(device_id=device_id, task_id=task_id, logger_name=f"device_{device_id}")
-        instance = Uiautomator(device_id=device_id, log_util=log_util)
+        start_time = time.perf_counter()
+        try:
+            # 模拟设备（device_sim.enabled）不安装设备端服务，由配置决定而不是由运行环境推断
+            instance = Uiautomator(
+                device_id=device_id, log_util=log_util,
+                install_agent=not GlobalConfig.get("device_sim", {}).get("enabled", False)
+            )
+        except Exception:
+            DEVICE_INIT_FAILURES.inc(device_id=device_id)
+            log_util.close()
+            raise
+        DEVICE_INIT_LATENCY.observe(time.perf_counter() - start_time, device_id=device_id)
 
         # 3. 加入缓存
         DEVICE_CACHE[device_id] = instance
@@ -88,4 +105,7 @@ class DeviceManager:
         if device_id in DEVICE_CACHE:
             instance = DEVICE_CACHE[device_id]
             instance.log.info(f"释放设备{device_id}实例")
-            del DEVICE_CACHE[device_id]
\ No newline at end of file
+            del DEVICE_CACHE[device_id]
+            # 关闭设备日志处理器（TempLog 无需关闭）
+            if hasattr(instance.log, "close"):
+                instance.log.close()
\ No newline at end of file
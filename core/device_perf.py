@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+设备侧性能采集（Pytest进程内）：
+- 独立的常驻 adb shell 连接（不复用用例的 adb 命令），固定间隔一次往返取回：
+  /proc/stat（整机CPU）、dumpsys meminfo（前台/指定应用PSS）、dumpsys gfxinfo（帧数、卡顿帧、帧耗时分位）
+- 时间序列以紧凑行格式保存在内存，按用例切片后以 JSON + SVG 图表附加到 Allure
+"""
+import json
+import queue
+import re
+import subprocess
+import threading
+import time
+import uuid
+from typing import Optional
+from conf import GlobalConfig
+
+# 行格式：[时间戳, 整机CPU%, 应用PSS(MB), 区间帧数, 区间卡顿帧, 帧耗时P90(ms), 应用包名]
+PERF_COLUMNS = ["ts", "cpu_percent", "pss_mb", "frames", "janky_frames", "frame_p90_ms", "package"]
+# 前台应用包名（未配置 package 时在设备端解析，避免额外一次往返）
+FOREGROUND_PACKAGE_CMD = (
+    "dumpsys activity activities | grep -m1 -E 'mResumedActivity|topResumedActivity' "
+    "| sed -E 's/.* ([^ /]+)\\/.*/\\1/'"
+)
+MEMINFO_PATTERN = re.compile(r"TOTAL(?: PSS:)?\s+(\d+)")
+FRAMES_PATTERN = re.compile(r"Total frames rendered:\s*(\d+)")
+JANKY_PATTERN = re.compile(r"Janky frames:\s*(\d+)")
+P90_PATTERN = re.compile(r"90th percentile:\s*(\d+)ms")
+
+
+class PersistentAdbShell:
+    """
+    常驻 adb shell：命令写入stdin，输出读到结束标记为止
+    超时或连接断开时结束进程，下次调用自动重连
+    """
+
+    def __init__(self, device_id: str):
+        self.cmd = [GlobalConfig["device"]["adb_path"], "-s", device_id, "shell"]
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: Optional[queue.Queue] = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self) -> None:
+        if self._process is not None and self._process.poll() is None:
+            return
+        self._process = subprocess.Popen(
+            self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding="utf-8", errors="replace", bufsize=1
+        )
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read_output, args=(self._process, self._lines), name="adb-perf-shell", daemon=True
+        ).start()
+
+    @staticmethod
+    def _read_output(process: subprocess.Popen, lines: queue.Queue) -> None:
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)  # 进程已退出
+
+    def run(self, command: str, timeout: float = 10) -> str:
+        """执行一条shell命令（可用 ; 组合多条），返回输出"""
+        with self._lock:
+            self._ensure_process()
+            marker = f"__PERF_END_{uuid.uuid4().hex[:8]}__"
+            self._process.stdin.write(f"{command}; echo {marker}\n")
+            self._process.stdin.flush()
+            output = []
+            deadline = time.time() + timeout
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    self.close()
+                    raise TimeoutError(f"adb shell 命令超时（{timeout}秒）：{command[:100]}")
+                if line is None:
+                    self.close()
+                    raise ConnectionError("adb shell 连接已断开")
+                if line.strip() == marker:
+                    return "".join(output)
+                output.append(line)
+
+    def close(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def parse_cpu_times(line: str) -> Optional[tuple[int, int]]:
+    """解析 /proc/stat 首行，返回 (总jiffies, 空闲jiffies)"""
+    parts = line.split()
+    if not parts or parts[0] != "cpu":
+        return None
+    values = [int(v) for v in parts[1:]]
+    idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+    return sum(values), idle
+
+
+def parse_perf_output(output: str) -> dict:
+    """解析一次采样的组合输出（CPU:/PKG:/MEM:/GFX: 前缀分段）"""
+    result = {"cpu_times": None, "package": None, "pss_kb": None, "frames": None, "janky": None, "p90_ms": None}
+    section = None
+    for line in output.splitlines():
+        if line.startswith(("CPU:", "PKG:", "MEM:", "GFX:")):
+            section, line = line[:3], line[4:]
+            if section == "CPU":
+                result["cpu_times"] = parse_cpu_times(line)
+                continue
+            if section == "PKG":
+                result["package"] = line.strip() or None
+                continue
+        if section == "MEM" and result["pss_kb"] is None:
+            match = MEMINFO_PATTERN.search(line)
+            if match:
+                result["pss_kb"] = int(match.group(1))
+        elif section == "GFX":
+            for key, pattern in (("frames", FRAMES_PATTERN), ("janky", JANKY_PATTERN), ("p90_ms", P90_PATTERN)):
+                match = pattern.search(line)
+                if match and result[key] is None:
+                    result[key] = int(match.group(1))
+    return result
+
+
+class DevicePerfSampler:
+    """
+    后台按固定间隔采样设备性能（整机CPU、应用PSS、帧信息）
+    :param package: 采集的应用包名（为空时每次采样取前台应用）
+    """
+
+    def __init__(self, device_id: str, package: Optional[str] = None, interval: float = 2.0,
+                 command_timeout: float = 10, max_samples: int = 20000, log=None):
+        self.device_id = device_id
+        self.package = package
+        self.interval = max(interval, 0.5)
+        self.command_timeout = command_timeout
+        self.max_samples = max_samples
+        self.log = log
+        self.samples: list[list] = []
+        self.errors = 0
+        self._shell = PersistentAdbShell(device_id)
+        self._prev_cpu: Optional[tuple[int, int]] = None
+        self._prev_frames: Optional[tuple[str, int, int]] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"device-perf-{device_id}", daemon=True)
+
+    def _build_command(self) -> str:
+        pkg = self.package if self.package else f"$({FOREGROUND_PACKAGE_CMD})"
+        # 设备端先过滤，只回传需要的行
+        return (
+            f"pkg={pkg}; echo CPU:$(head -1 /proc/stat); echo PKG:$pkg; "
+            "echo MEM:; [ -n \"$pkg\" ] && dumpsys meminfo $pkg | grep -m1 -E 'TOTAL'; "
+            "echo GFX:; [ -n \"$pkg\" ] && dumpsys gfxinfo $pkg "
+            "| grep -m3 -E 'Total frames rendered|Janky frames|90th percentile'"
+        )
+
+    def sample_once(self) -> Optional[list]:
+        ts = time.time()
+        parsed = parse_perf_output(self._shell.run(self._build_command(), self.command_timeout))
+
+        cpu_percent = None
+        if parsed["cpu_times"]:
+            if self._prev_cpu:
+                total = parsed["cpu_times"][0] - self._prev_cpu[0]
+                idle = parsed["cpu_times"][1] - self._prev_cpu[1]
+                cpu_percent = round((1 - idle / total) * 100, 1) if total > 0 else None
+            self._prev_cpu = parsed["cpu_times"]
+
+        # gfxinfo 为应用启动以来的累计值，取与上次采样的差值（应用切换/重启后重新计数）
+        frames = janky = None
+        package = parsed["package"]
+        if package and parsed["frames"] is not None:
+            prev = self._prev_frames
+            if prev and prev[0] == package and parsed["frames"] >= prev[1]:
+                frames = parsed["frames"] - prev[1]
+                janky = max((parsed["janky"] or 0) - prev[2], 0)
+            self._prev_frames = (package, parsed["frames"], parsed["janky"] or 0)
+
+        row = [
+            round(ts, 2), cpu_percent,
+            round(parsed["pss_kb"] / 1024, 1) if parsed["pss_kb"] is not None else None,
+            frames, janky, parsed["p90_ms"], package
+        ]
+        with self._lock:
+            self.samples.append(row)
+            if len(self.samples) > self.max_samples:
+                del self.samples[:len(self.samples) - self.max_samples]
+        return row
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.errors += 1
+                if self.log and self.errors <= 3:
+                    self.log.warning(f"设备{self.device_id}性能采样失败：{str(e)[:200]}")
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> "DevicePerfSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.command_timeout + 1)
+        self._shell.close()
+
+    def get_samples(self, start_ts: float, end_ts: Optional[float] = None) -> list[list]:
+        """时间范围内的采样行"""
+        end_ts = end_ts or time.time()
+        with self._lock:
+            return [row for row in self.samples if start_ts <= row[0] <= end_ts]
+
+
+# ------------------- 汇总与图表 -------------------
+def summarize_samples(rows: list[list]) -> dict:
+    def _values(index: int) -> list:
+        return [row[index] for row in rows if row[index] is not None]
+
+    cpu, pss, p90 = _values(1), _values(2), _values(5)
+    frames, janky = sum(_values(3)), sum(_values(4))
+    return {
+        "samples": len(rows),
+        "avg_cpu_percent": round(sum(cpu) / len(cpu), 1) if cpu else None,
+        "max_cpu_percent": max(cpu) if cpu else None,
+        "max_pss_mb": max(pss) if pss else None,
+        "pss_growth_mb": round(pss[-1] - pss[0], 1) if len(pss) > 1 else None,
+        "frames": frames,
+        "janky_frames": janky,
+        "janky_percent": round(janky / frames * 100, 2) if frames else None,
+        "max_frame_p90_ms": max(p90) if p90 else None,
+        "packages": sorted({row[6] for row in rows if row[6]})
+    }
+
+
+def _svg_panel(title: str, unit: str, points: list[tuple[float, float]], top: int, width: int,
+               height: int, duration: float, color: str) -> list[str]:
+    """单个折线图面板（x：相对秒，y：数值，按最大值自动缩放）"""
+    left, plot_w, plot_h = 50, width - 60, height - 35
+    y_max = max((v for _, v in points), default=0) or 1
+    parts = [
+        f'<text x="{left}" y="{top + 14}" font-size="12" font-weight="bold">{title}</text>',
+        f'<rect x="{left}" y="{top + 20}" width="{plot_w}" height="{plot_h}" fill="none" stroke="#ccc"/>',
+        f'<text x="{left - 4}" y="{top + 30}" font-size="10" text-anchor="end">{y_max:g}{unit}</text>',
+        f'<text x="{left - 4}" y="{top + 20 + plot_h}" font-size="10" text-anchor="end">0</text>'
+    ]
+    if points:
+        coords = " ".join(
+            f"{left + (t / duration if duration else 0) * plot_w:.1f},{top + 20 + plot_h - v / y_max * plot_h:.1f}"
+            for t, v in points
+        )
+        parts.append(f'<polyline fill="none" stroke="{color}" stroke-width="1.5" points="{coords}"/>')
+    else:
+        parts.append(f'<text x="{left + plot_w / 2}" y="{top + 20 + plot_h / 2}" font-size="11" '
+                     f'text-anchor="middle" fill="#999">无数据</text>')
+    return parts
+
+
+def render_perf_svg(rows: list[list], start_ts: float, width: int = 640) -> str:
+    """渲染性能时间序列图表（CPU、PSS、卡顿率三个面板，纯SVG，无绘图依赖）"""
+    duration = max((row[0] - start_ts for row in rows), default=0)
+    panel_height = 130
+    panels = [
+        ("整机CPU", "%", [(row[0] - start_ts, row[1]) for row in rows if row[1] is not None], "#e4572e"),
+        ("应用PSS", "MB", [(row[0] - start_ts, row[2]) for row in rows if row[2] is not None], "#17bebb"),
+        ("卡顿帧占比", "%", [
+            (row[0] - start_ts, round(row[4] / row[3] * 100, 1))
+            for row in rows if row[3] and row[4] is not None
+        ], "#4e5d6c")
+    ]
+    height = panel_height * len(panels) + 20
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="sans-serif">',
+        f'<text x="{width - 10}" y="{height - 5}" font-size="10" text-anchor="end">时长：{duration:.1f}秒</text>'
+    ]
+    for i, (title, unit, points, color) in enumerate(panels):
+        parts.extend(_svg_panel(title, unit, points, i * panel_height, width, panel_height, duration, color))
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+def build_perf_attachments(rows: list[list], start_ts: float) -> tuple[bytes, bytes]:
+    """
+    生成用例的性能附件
+    :return: (JSON时间序列, SVG图表)
+    """
+    data = {
+        "summary": summarize_samples(rows),
+        "columns": PERF_COLUMNS,
+        # 时间戳改为相对用例开始的秒数，减小体积
+        "rows": [[round(row[0] - start_ts, 2)] + row[1:] for row in rows]
+    }
+    return (
+        json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        render_perf_svg(rows, start_ts).encode("utf-8")
+    )
+
+
+# ------------------- Pytest进程内的采样器管理 -------------------
+_samplers: dict[str, DevicePerfSampler] = {}
+
+
+def start_device_perf_sampler(device_id: str, log=None) -> Optional[DevicePerfSampler]:
+    """按配置启动设备性能采样（device_perf.enabled 为 false 时返回None）"""
+    config = GlobalConfig.get("device_perf", {})
+    if not config.get("enabled", False):
+        return None
+    if device_id in _samplers:
+        return _samplers[device_id]
+    sampler = DevicePerfSampler(
+        device_id,
+        package=config.get("package"),
+        interval=config.get("interval", 2.0),
+        command_timeout=config.get("command_timeout", 10),
+        log=log
+    ).start()
+    _samplers[device_id] = sampler
+    return sampler
+
+
+def get_device_perf_sampler(device_id: str) -> Optional[DevicePerfSampler]:
+    return _samplers.get(device_id)
+
+
+def stop_device_perf_sampler(device_id: str) -> None:
+    sampler = _samplers.pop(device_id, None)
+    if sampler:
+        sampler.stop()
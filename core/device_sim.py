@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+"""
+模拟设备（无真机时的压测/基准测试）：
+- DeviceFarm：N 台模拟设备的状态（亮屏、文件、层级XML、截图），按 adb 参数返回与真实 adb 相同格式的输出，
+  支持按命令配置延迟、按概率注入失败
+- DeviceSimServer：本地HTTP服务（线程池并发处理），模拟延迟在服务端等待，多台设备/多个调用方互不阻塞
+- 客户端为 core/fake_adb.py（替代 adb 可执行文件，参数与 adb 一致）
+- start_device_sim：按配置启动服务，并通过环境变量 ADB_PATH / DEVICE_SIM_URL 让本进程与Pytest子进程都使用模拟adb
+"""
+import base64
+import json
+import os
+import random
+import re
+import shlex
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+from xml.sax.saxutils import quoteattr
+from conf import GlobalConfig
+from core.fake_adb import SIM_URL_ENV
+from util.image_util import encode_png
+
+# 模拟层级中固定出现的文本（与示例用例一致，便于用例在模拟设备上通过）
+SIM_TEXTS = ("相机", "QQ", "微信", "设置", "图库", "浏览器")
+ATX_AGENT_VERSION = "0.10.0"
+# 覆盖 device.adb_path 的环境变量（conf 加载配置时读取，Pytest子进程同样生效）
+ADB_PATH_ENV = "ADB_PATH"
+VARIABLE_PATTERN = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+# 模拟的前台应用（dumpsys activity/meminfo/gfxinfo 输出）
+SIM_PACKAGE = "com.sim.launcher"
+
+# 当前进程启动的模拟服务（start_device_sim 创建）及启动前的 adb 路径
+_sim_server: Optional["DeviceSimServer"] = None
+_original_adb_path: Optional[str] = None
+
+
+def build_hierarchy_xml(node_count: int, seed: int = 0) -> bytes:
+    """生成 uiautomator dump 格式的层级XML（节点数约为 node_count）"""
+    rng = random.Random(seed)
+    lines = ["<?xml version='1.0' encoding='UTF-8' standalone='yes' ?><hierarchy rotation=\"0\">"]
+    depth = 0
+    for i in range(max(node_count, 1)):
+        text = SIM_TEXTS[i % len(SIM_TEXTS)] if i < len(SIM_TEXTS) * 2 else f"item_{i}"
+        x, y = rng.randint(0, 1000), rng.randint(0, 2200)
+        attrs = (
+            f'index="{i}" text={quoteattr(text)} resource-id="com.sim:id/node_{i}" '
+            f'class="android.widget.TextView" package="com.sim" content-desc="" clickable="true" '
+            f'bounds="[{x},{y}][{x + 80},{y + 60}]"'
+        )
+        # 每隔几个节点嵌套一层，形成有深度的树
+        if i % 5 == 0 and depth < 20:
+            lines.append(f"<node {attrs}>")
+            depth += 1
+        else:
+            lines.append(f"<node {attrs} />")
+    lines.extend(["</node>"] * depth)
+    lines.append("</hierarchy>")
+    return "".join(lines).encode("utf-8")
+
+
+def build_screen_raw(width: int, height: int, frame: int = 0, screen_on: bool = True) -> bytes:
+    """
+    生成模拟截图的 screencap 原始格式（12字节头 + RGBA像素；纵向渐变 + 随 frame 移动的色块，不同帧内容不同）
+    :param frame: 帧序号（设备每执行一次操作加1）
+    :param screen_on: 熄屏时返回全黑
+    """
+    rows = []
+    band_top = (frame * 97) % max(height - 80, 1)
+    for y in range(height):
+        if not screen_on:
+            color = b"\x00\x00\x00\xff"
+        elif band_top <= y < band_top + 80:
+            color = bytes(((frame * 53) % 256, 120, 200, 255))
+        else:
+            color = bytes((30, (y * 255 // max(height - 1, 1)), 90, 255))
+        rows.append(color * width)
+    return struct.pack("<III", width, height, 1) + b"".join(rows)  # 像素格式1 = RGBA_8888
+
+
+def _find_closing_paren(text: str, start: int) -> int:
+    """从 start 开始查找与 $( 匹配的右括号位置（忽略引号内的括号），未找到返回文本末尾"""
+    depth, quote = 1, None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text)
+
+
+def _split_sed_expression(expression: str) -> list[str]:
+    """拆分 sed 替换表达式 s/a/b/flags（方括号内与转义的分隔符不拆分，转义的分隔符还原）"""
+    delimiter, parts, current, bracket = expression[1], [], [], False
+    chars = iter(expression[2:])
+    for char in chars:
+        if char == "\\":
+            following = next(chars, "")
+            current.append(following if following == delimiter else char + following)
+        elif char == delimiter and not bracket:
+            parts.append("".join(current))
+            current = []
+        else:
+            if char == "[":
+                bracket = True
+            elif char == "]":
+                bracket = False
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def split_shell(text: str, sep: str) -> list[str]:
+    """按分隔符（; && |）拆分命令行，忽略引号内与 $(...) 内的分隔符"""
+    parts, start, i, quote, depth = [], 0, 0, None, 0
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif text.startswith("$(", i):
+            depth += 1
+            i += 2
+            continue
+        elif char == ")" and depth:
+            depth -= 1
+        elif depth == 0 and text.startswith(sep, i) and not (sep == "|" and text.startswith("||", i)):
+            parts.append(text[start:i])
+            i += len(sep)
+            start = i
+            continue
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+class SimDevice:
+    """单台模拟设备的状态"""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.screen_on = True
+        self.files: dict[str, bytes] = {}
+        self.action_count = 0
+        self.cpu_jiffies = 0
+        self.frames = 0
+        self.foreground = SIM_PACKAGE
+        self.running_packages = {SIM_PACKAGE}
+        self.activities: dict[str, str] = {}  # 包名 -> 最近启动的Activity
+        self.lock = threading.Lock()
+
+
+class DeviceFarm:
+    """
+    模拟设备集合
+    :param device_count: 设备数量（ID 为 {prefix}0001 ...）
+    :param latency_ms: 每次adb调用的基础延迟（毫秒）
+    :param jitter_ms: 延迟随机抖动上限（毫秒）
+    :param hierarchy_nodes: uiautomator dump 的层级节点数
+    :param failure_rate: 失败注入概率（0~1，失败时返回码1、输出 "error: closed"，与连接中断一致）
+    :param failure_commands: 只对这些命令注入失败（如 ["input", "uiautomator"]，为空表示全部）
+    :param command_latency_ms: 按命令覆盖基础延迟（如 {"uiautomator": 800, "screencap": 300}）
+    :param screen_size: 截图尺寸（宽, 高）
+    :param app_start_ms: 应用启动耗时（冷启动, 热启动），am start -W 额外等待并按此输出 TotalTime
+    :param seed: 随机种子（抖动与失败注入可复现）
+    """
+
+    def __init__(self, device_count: int = 4, prefix: str = "SIM", latency_ms: float = 5,
+                 jitter_ms: float = 0, hierarchy_nodes: int = 200, failure_rate: float = 0,
+                 failure_commands: Optional[list] = None, command_latency_ms: Optional[dict] = None,
+                 screen_size: tuple = (720, 1280), app_start_ms: tuple = (600, 150), seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.hierarchy_nodes = hierarchy_nodes
+        self.failure_rate = failure_rate
+        self.failure_commands = set(failure_commands or [])
+        self.command_latency_ms = dict(command_latency_ms or {})
+        self.screen_size = tuple(screen_size)
+        self.app_start_ms = tuple(app_start_ms)
+        self.devices = {
+            f"{prefix}{i + 1:04d}": SimDevice(f"{prefix}{i + 1:04d}") for i in range(device_count)
+        }
+        self._rng = random.Random(seed)
+        self._hierarchy_cache: dict[int, bytes] = {}
+        self._screen_cache: dict[tuple, tuple] = {}
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "injected_failures": 0, "commands": {}}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DeviceFarm":
+        """按配置项（device_sim 段）创建"""
+        return cls(
+            device_count=config.get("device_count", 10),
+            prefix=config.get("prefix", "SIM"),
+            latency_ms=config.get("latency_ms", 20),
+            jitter_ms=config.get("jitter_ms", 0),
+            hierarchy_nodes=config.get("hierarchy_nodes", 200),
+            failure_rate=config.get("failure_rate", 0),
+            failure_commands=config.get("failure_commands"),
+            command_latency_ms=config.get("command_latency_ms"),
+            screen_size=config.get("screen_size", (720, 1280)),
+            app_start_ms=config.get("app_start_ms", (600, 150)),
+            seed=config.get("seed")
+        )
+
+    def get_hierarchy(self) -> bytes:
+        nodes = self.hierarchy_nodes
+        if nodes not in self._hierarchy_cache:
+            self._hierarchy_cache[nodes] = build_hierarchy_xml(nodes)
+        return self._hierarchy_cache[nodes]
+
+    def get_screen(self, device: SimDevice, png: bool = False) -> bytes:
+        """当前屏幕截图（原始格式或PNG；按 操作次数/亮屏状态 缓存，帧序号取模限制缓存数量）"""
+        key = (device.action_count % 16, device.screen_on)
+        if key not in self._screen_cache:
+            raw = build_screen_raw(*self.screen_size, frame=key[0], screen_on=key[1])
+            width, height = self.screen_size
+            self._screen_cache[key] = (raw, encode_png(memoryview(raw)[12:], width, height, 4, level=1))
+        return self._screen_cache[key][1 if png else 0]
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return {**self.stats, "commands": dict(self.stats["commands"]), "devices": len(self.devices)}
+
+    @staticmethod
+    def _command_name(args: list[str]) -> str:
+        """统计/延迟/失败注入使用的命令名（shell/exec-out 取设备端程序名）"""
+        if len(args) >= 2 and args[0] == "-s":
+            args = args[2:]
+        if not args:
+            return ""
+        if args[0] in ("shell", "exec-out") and len(args) > 1:
+            program = args[1].split()[0] if args[1].strip() else ""
+            return "sh" if "=" in program else os.path.basename(program)
+        return args[0]
+
+    def _sleep(self, command: str) -> None:
+        delay = self.command_latency_ms.get(command, self.latency_ms)
+        if self.jitter_ms:
+            delay += self._rng.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _should_fail(self, command: str) -> bool:
+        if self.failure_rate <= 0 or command == "devices":
+            return False
+        if self.failure_commands and command not in self.failure_commands:
+            return False
+        return self._rng.random() < self.failure_rate
+
+    def handle(self, args: list[str]) -> dict:
+        """
+        执行一条adb命令
+        :param args: adb 参数（不含 adb 本身），如 ["-s", "SIM0001", "shell", "input", "tap", "1", "2"]
+        :return: {"returncode", "stdout"(bytes), "stderr"(str), "pull"(可选：{"local", "data"})}
+        """
+        command = self._command_name(args)
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["commands"][command] = self.stats["commands"].get(command, 0) + 1
+        self._sleep(command)
+        if self._should_fail(command):
+            with self._stats_lock:
+                self.stats["errors"] += 1
+                self.stats["injected_failures"] += 1
+            return self._result(1, stderr="error: closed")
+        result = self._dispatch(list(args))
+        if result["returncode"] != 0:
+            with self._stats_lock:
+                self.stats["errors"] += 1
+        return result
+
+    @staticmethod
+    def _result(returncode: int = 0, stdout: bytes = b"", stderr: str = "", **extra) -> dict:
+        return {"returncode": returncode, "stdout": stdout, "stderr": stderr, **extra}
+
+    def _dispatch(self, args: list[str]) -> dict:
+        device_id = None
+        if len(args) >= 2 and args[0] == "-s":
+            device_id, args = args[1], args[2:]
+        if not args:
+            return self._result(1, stderr="adb: no command specified")
+        command, rest = args[0], args[1:]
+
+        if command == "devices":
+            lines = ["List of devices attached"] + [f"{d}\tdevice" for d in self.devices]
+            return self._result(stdout=("\n".join(lines) + "\n\n").encode())
+
+        if device_id is None:
+            if len(self.devices) != 1:
+                return self._result(1, stderr="adb: more than one device/emulator")
+            device_id = next(iter(self.devices))
+        device = self.devices.get(device_id)
+        if device is None:
+            return self._result(1, stderr=f"adb: device '{device_id}' not found")
+
+        if command == "get-state":
+            return self._result(stdout=b"device\n")
+        if command in ("shell", "exec-out"):
+            if not rest:
+                return self._result(1, stderr="interactive shell is not supported by the simulator")
+            # adb shell 会把多个参数拼成一条命令行
+            return self._shell_line(device, " ".join(rest))
+        if command == "pull" and len(rest) >= 2:
+            data = device.files.get(rest[0])
+            if data is None:
+                return self._result(1, stderr=f"adb: error: failed to stat remote object '{rest[0]}': No such file or directory")
+            return self._result(stdout=f"{rest[0]}: 1 file pulled.\n".encode(), pull={"local": rest[1], "data": data})
+        return self._result(1, stderr=f"adb: unknown command {command}")
+
+    def _shell_line(self, device: SimDevice, line: str, env: Optional[dict] = None) -> dict:
+        """
+        执行一行shell命令：支持 ; && | 组合、$(...) 命令替换、变量赋值与 $var 展开，
+        管道后可接 grep/sed/head 过滤（足够覆盖框架自身发出的命令，不是完整的shell）
+        """
+        env = {} if env is None else env
+        stdout, stderr, returncode = [], [], 0
+        for statement in split_shell(line, ";"):
+            for i, part in enumerate(split_shell(statement, "&&")):
+                if i and returncode != 0:
+                    break
+                result = self._pipeline(device, part, env)
+                stdout.append(result["stdout"])
+                if result["stderr"]:
+                    stderr.append(result["stderr"])
+                returncode = result["returncode"]
+        return self._result(returncode, b"".join(stdout), "\n".join(stderr))
+
+    def _pipeline(self, device: SimDevice, text: str, env: dict) -> dict:
+        result = None
+        for i, command in enumerate(split_shell(text, "|")):
+            expanded = self._expand(device, command, env).strip()
+            if not expanded:
+                continue
+            try:
+                argv = shlex.split(expanded)
+            except ValueError as e:
+                return self._result(2, stderr=f"/system/bin/sh: syntax error: {str(e)}")
+            if result is None:
+                result = self._shell(device, argv, env)
+            else:
+                result = self._filter(argv, result)
+        return result or self._result()
+
+    def _expand(self, device: SimDevice, text: str, env: dict) -> str:
+        """展开 $(...) 与 $var / ${var}（单引号内不展开）"""
+        output, i, quote = [], 0, None
+        while i < len(text):
+            char = text[i]
+            if char == "'" and quote != '"':
+                quote = None if quote == "'" else "'"
+            elif char == '"' and quote != "'":
+                quote = None if quote == '"' else '"'
+            elif char == "$" and quote != "'":
+                if text.startswith("$(", i):
+                    end = _find_closing_paren(text, i + 2)
+                    inner = self._shell_line(device, text[i + 2:end])
+                    output.append(inner["stdout"].decode("utf-8", "replace").strip())
+                    i = end + 1
+                    continue
+                match = VARIABLE_PATTERN.match(text, i)
+                if match:
+                    output.append(env.get(match.group(1) or match.group(2), ""))
+                    i = match.end()
+                    continue
+            output.append(char)
+            i += 1
+        return "".join(output)
+
+    def _filter(self, argv: list[str], result: dict) -> dict:
+        """管道过滤命令（grep -m N -E / sed -E 's/a/b/' / head -n N）"""
+        program, lines = argv[0], result["stdout"].decode("utf-8", "replace").splitlines()
+        options, args = [], []
+        arg_iter = iter(argv[1:])
+        for arg in arg_iter:
+            if arg in ("-m", "-n"):
+                options.append((arg, int(next(arg_iter, "0"))))
+            elif arg.startswith("-") and len(arg) > 1:
+                options.append((arg, None))
+            else:
+                args.append(arg)
+        limit = next((value for name, value in options if name in ("-m", "-n")), None)
+        if program == "grep" and args:
+            pattern = re.compile(args[0], re.IGNORECASE if ("-i", None) in options else 0)
+            lines = [line for line in lines if pattern.search(line)][:limit]
+        elif program == "sed" and args and args[0].startswith("s") and len(args[0]) > 1:
+            parts = _split_sed_expression(args[0])
+            if len(parts) < 2:
+                return self._result(1, stderr=f"sed: bad expression: {args[0]}")
+            pattern, replacement = re.compile(parts[0]), parts[1]
+            count = 0 if len(parts) > 2 and "g" in parts[2] else 1
+            lines = [pattern.sub(replacement, line, count=count) for line in lines]
+        elif program == "head":
+            lines = lines[:limit or 10]
+        else:
+            return self._result(127, stderr=f"/system/bin/sh: {program}: not found")
+        stdout = "".join(f"{line}\n" for line in lines).encode()
+        return self._result(0 if lines or program != "grep" else 1, stdout, result["stderr"])
+
+    def _shell(self, device: SimDevice, argv: list[str], env: Optional[dict] = None) -> dict:
+        program = argv[0]
+        if "=" in program and not program.startswith("="):
+            name, _, value = program.partition("=")  # 变量赋值
+            if env is not None:
+                env[name] = value
+            return self._result()
+        if program == "[":
+            operands = argv[1:-1] if argv[-1:] == ["]"] else argv[1:]
+            if operands[:1] == ["-n"]:
+                return self._result(0 if len(operands) > 1 and operands[1] else 1)
+            if operands[:1] == ["-z"]:
+                return self._result(1 if len(operands) > 1 and operands[1] else 0)
+            return self._result(0 if operands and operands[0] else 1)
+        if program == "dumpsys":
+            return self._dumpsys(device, argv[1:])
+        if program == "echo":
+            return self._result(stdout=(" ".join(argv[1:]) + "\n").encode())
+        if program == "input":
+            with device.lock:
+                device.action_count += 1
+                if argv[1:3] == ["keyevent", "224"]:
+                    device.screen_on = True
+                elif argv[1:3] == ["keyevent", "3"]:
+                    device.foreground = SIM_PACKAGE
+            return self._result()
+        if program == "am":
+            return self._am(device, argv[1:])
+        if program == "pm" and argv[1:2] == ["clear"] and len(argv) > 2:
+            with device.lock:
+                device.running_packages.discard(argv[2])
+            return self._result(stdout=b"Success\n")
+        if program == "cmd" and argv[1:3] == ["package", "resolve-activity"]:
+            package = argv[-1]
+            return self._result(stdout=(
+                f"priority=0 preferredOrder=0 match=0x108000 specificIndex=-1 isDefault=true\n{package}/.MainActivity\n"
+            ).encode())
+        if program == "monkey" and "-p" in argv:
+            package = argv[argv.index("-p") + 1]
+            with device.lock:
+                device.running_packages.add(package)
+                device.foreground = package
+            return self._result(stdout=b"Events injected: 1\n")
+        if program == "uiautomator" and argv[1:2] == ["dump"]:
+            path = argv[2] if len(argv) > 2 else "/sdcard/window_dump.xml"
+            with device.lock:
+                device.files[path] = self.get_hierarchy()
+            return self._result(stdout=f"UI hierchary dumped to: {path}\n".encode())
+        if program == "screencap":
+            paths = [arg for arg in argv[1:] if not arg.startswith("-")]
+            # -p 或 .png 文件输出PNG，否则为原始帧缓冲格式
+            png = "-p" in argv[1:] or bool(paths and paths[0].endswith(".png"))
+            data = self.get_screen(device, png)
+            if not paths:
+                return self._result(stdout=data)
+            with device.lock:
+                device.files[paths[0]] = data
+            return self._result()
+        if program in ("cat", "head") and argv[-1:] == ["/proc/stat"]:
+            with device.lock:
+                device.cpu_jiffies += 100
+                busy = device.cpu_jiffies // 4
+            return self._result(stdout=f"cpu  {busy} 0 {busy} {device.cpu_jiffies * 2} 0 0 0 0 0 0\n".encode())
+        if program == "cat" and len(argv) > 1:
+            data = device.files.get(argv[1])
+            if data is None:
+                return self._result(1, stderr=f"cat: {argv[1]}: No such file or directory")
+            return self._result(stdout=data)
+        if program == "rm":
+            with device.lock:
+                for path in argv[1:]:
+                    device.files.pop(path, None)
+            return self._result()
+        if program.endswith("atx-agent") and argv[1:2] == ["version"]:
+            return self._result(stdout=f"{ATX_AGENT_VERSION}\n".encode())
+        return self._result(127, stderr=f"/system/bin/sh: {program}: not found")
+
+
+    def _am(self, device: SimDevice, argv: list[str]) -> dict:
+        """am start [-W] [-S] -n 包名/Activity、am force-stop 包名"""
+        if argv[:1] == ["force-stop"] and len(argv) > 1:
+            with device.lock:
+                device.running_packages.discard(argv[1])
+                if device.foreground == argv[1]:
+                    device.foreground = SIM_PACKAGE
+            return self._result()
+        if argv[:1] != ["start"] or "-n" not in argv:
+            return self._result(1, stderr=f"Error: unsupported am command: {' '.join(argv)}")
+        component = argv[argv.index("-n") + 1]
+        package = component.split("/")[0]
+        with device.lock:
+            if "-S" in argv:
+                device.running_packages.discard(package)
+            launch_state = "HOT" if package in device.running_packages else "COLD"
+            device.running_packages.add(package)
+            device.foreground = package
+            device.activities[package] = component.split("/", 1)[1]
+        total_ms = self.app_start_ms[0 if launch_state == "COLD" else 1]
+        if "-W" in argv:
+            time.sleep(total_ms / 1000)
+        lines = [f"Starting: Intent {{ cmp={component} }}"]
+        if "-W" in argv:
+            lines += ["Status: ok", f"LaunchState: {launch_state}", f"Activity: {component}",
+                      f"TotalTime: {total_ms}", f"WaitTime: {total_ms + 5}", "Complete"]
+        return self._result(stdout=("\n".join(lines) + "\n").encode())
+
+    def _dumpsys(self, device: SimDevice, argv: list[str]) -> dict:
+        """dumpsys activity/meminfo/gfxinfo（只输出框架解析用到的行）"""
+        service = argv[0] if argv else ""
+        if service == "activity":
+            return self._result(stdout=(
+                f"  mResumedActivity: ActivityRecord{{5e1c2f u0 "
+                f"{device.foreground}/{device.activities.get(device.foreground, '.MainActivity')} t12}}\n"
+            ).encode())
+        if service == "meminfo" and argv[1:]:
+            pss = 85000 + device.action_count * 16
+            return self._result(stdout=f"           TOTAL PSS:    {pss}            TOTAL RSS:   {pss * 2}\n".encode())
+        if service == "gfxinfo" and argv[1:]:
+            with device.lock:
+                device.frames += 60
+                frames = device.frames
+            return self._result(stdout=(
+                f"Total frames rendered: {frames}\nJanky frames: {frames // 20} (5.00%)\n90th percentile: 12ms\n"
+            ).encode())
+        return self._result(stdout=f"Can't find service: {service}\n".encode())
+
+
+class _AdbRequestHandler(BaseHTTPRequestHandler):
+    farm: DeviceFarm = None
+
+    def do_POST(self):
+        if self.path != "/adb":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        result = self.farm.handle(body.get("args", []))
+        payload = {
+            "returncode": result["returncode"],
+            "stdout": base64.b64encode(result["stdout"]).decode(),
+            "stderr": result["stderr"]
+        }
+        if "pull" in result:
+            payload["pull"] = {
+                "local": result["pull"]["local"],
+                "data": base64.b64encode(result["pull"]["data"]).decode()
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # 压测时不输出访问日志
+
+
+class DeviceSimServer:
+    """模拟设备HTTP服务（后台线程运行，port=0 时自动分配端口）"""
+
+    def __init__(self, farm: DeviceFarm, host: str = "127.0.0.1", port: int = 0):
+        handler = type("AdbRequestHandler", (_AdbRequestHandler,), {"farm": farm})
+        self.farm = farm
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "DeviceSimServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="device-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def write_adb_launcher(dir_path: str) -> str:
+    """生成调用 core/fake_adb.py 的可执行文件，作为 adb_path 使用"""
+    fake_adb = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_adb.py")
+    if os.name == "nt":
+        launcher = os.path.join(dir_path, "adb.bat")
+        with open(launcher, "w", encoding="utf-8") as f:
+            f.write(f'@"{sys.executable}" "{fake_adb}" %*\n')
+        return launcher
+    launcher = os.path.join(dir_path, "adb")
+    with open(launcher, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake_adb}" "$@"\n')
+    os.chmod(launcher, os.stat(launcher).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return launcher
+
+
+def start_device_sim(config: Optional[dict] = None, farm: Optional[DeviceFarm] = None) -> DeviceSimServer:
+    """
+    启动模拟设备服务，并把本进程（及之后启动的子进程）的 adb 指向模拟客户端
+    :param config: device_sim 配置段（默认取 GlobalConfig）
+    :param farm: 直接指定设备集合（基准测试使用，优先于 config）
+    :return: 已启动的服务
+    """
+    global _sim_server, _original_adb_path
+    if _sim_server is not None:
+        return _sim_server
+    config = config if config is not None else GlobalConfig.get("device_sim", {})
+    farm = farm or DeviceFarm.from_config(config)
+    server = DeviceSimServer(farm, config.get("host", "127.0.0.1"), config.get("port", 0)).start()
+    launcher = write_adb_launcher(tempfile.mkdtemp(prefix="uitest_adb_sim_"))
+    os.environ[SIM_URL_ENV] = server.url
+    os.environ[ADB_PATH_ENV] = launcher
+    _original_adb_path = GlobalConfig["device"]["adb_path"]
+    GlobalConfig["device"]["adb_path"] = launcher
+    _sim_server = server
+    return server
+
+
+def get_device_sim() -> Optional[DeviceSimServer]:
+    return _sim_server
+
+
+def stop_device_sim() -> None:
+    global _sim_server
+    server, _sim_server = _sim_server, None
+    if server is None:
+        return
+    server.stop()
+    launcher = os.environ.pop(ADB_PATH_ENV, None)
+    os.environ.pop(SIM_URL_ENV, None)
+    if launcher and GlobalConfig["device"]["adb_path"] == launcher:
+        GlobalConfig["device"]["adb_path"] = _original_adb_path
+    if launcher:
+        try:
+            os.remove(launcher)
+            os.rmdir(os.path.dirname(launcher))
+        except OSError:
+            pass
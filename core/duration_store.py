@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import threading
+from statistics import median
+from typing import Optional
+from conf import GlobalConfig
+from util.allure_util import load_raw_results, get_test_key, get_duration_ms
+from util.log_util import TempLog
+
+# 仅统计有真实执行耗时的状态（skipped耗时为0，会拉低均值）
+TIMED_STATUSES = ("passed", "failed", "broken")
+# 基线耗时过短的用例（毫秒级）波动比例过大，不参与设备趋势计算
+MIN_TREND_BASELINE_MS = 100
+
+
+def normalize_suite_path(suite_path: str) -> str:
+    """统一用例路径写法（同一用例文件在pytest与Web端得到相同的键）"""
+    return os.path.normcase(os.path.abspath(suite_path))
+
+
+class DurationStore:
+    """
+    用例耗时历史库（SQLite）
+    - 每次 TestExecutor.execute 结束后从 allure_raw 写入用例耗时
+    - 提供按历史耗时倒序的执行顺序、任务ETA预估、设备变慢趋势
+    """
+    _schema_lock = threading.Lock()
+    _schema_ready = set()
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.history_config = GlobalConfig.get("history", {})
+        self.db_path = db_path or GlobalConfig["path"]["history_db"]
+        self._ensure_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self) -> None:
+        """建表（同一进程内每个库文件只执行一次）"""
+        with DurationStore._schema_lock:
+            if self.db_path in DurationStore._schema_ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS test_duration (
+                        task_id     TEXT    NOT NULL,
+                        device_id   TEXT    NOT NULL,
+                        suite_path  TEXT    NOT NULL,
+                        test_key    TEXT    NOT NULL,
+                        full_name   TEXT    NOT NULL,
+                        status      TEXT    NOT NULL,
+                        start_ms    INTEGER NOT NULL,
+                        duration_ms INTEGER NOT NULL,
+                        PRIMARY KEY (task_id, full_name, start_ms)
+                    )
+                    """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_duration_suite ON test_duration(suite_path, test_key, start_ms)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_duration_device ON test_duration(device_id, start_ms)"
+                )
+            DurationStore._schema_ready.add(self.db_path)
+
+    # ------------------- 写入 -------------------
+    def record_task(self, task_id: str, device_id: str, suite_path: str, raw_dir: str) -> int:
+        """
+        从Allure原始结果写入本次任务的用例耗时
+        :return: 写入的用例数
+        """
+        suite_key = normalize_suite_path(suite_path)
+        rows = []
+        for result in load_raw_results(raw_dir):
+            status = result.get("status", "unknown")
+            if status not in TIMED_STATUSES or result.get("start") is None:
+                continue
+            rows.append((
+                task_id, device_id, suite_key, get_test_key(result),
+                result.get("fullName") or result.get("name", ""), status,
+                int(result["start"]), get_duration_ms(result)
+            ))
+
+        if rows:
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO test_duration VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+        return len(rows)
+
+    # ------------------- 查询 -------------------
+    def get_test_durations(self, suite_path: str, device_id: Optional[str] = None) -> dict[str, float]:
+        """
+        获取用例最近N次的平均耗时（毫秒）
+        :param suite_path: 用例文件路径
+        :param device_id: 指定设备时只统计该设备的历史
+        :return: {test_key: 平均耗时ms}
+        """
+        recent_runs = self.history_config.get("recent_runs", 20)
+        sql = "SELECT test_key, duration_ms FROM test_duration WHERE suite_path = ?"
+        params = [normalize_suite_path(suite_path)]
+        if device_id:
+            sql += " AND device_id = ?"
+            params.append(device_id)
+        sql += " ORDER BY start_ms DESC"
+
+        samples: dict[str, list[int]] = {}
+        with self._connect() as conn:
+            for row in conn.execute(sql, params):
+                durations = samples.setdefault(row["test_key"], [])
+                if len(durations) < recent_runs:
+                    durations.append(row["duration_ms"])
+        return {key: sum(values) / len(values) for key, values in samples.items()}
+
+    def estimate_suite_seconds(self, suite_path: str, device_id: Optional[str] = None) -> Optional[float]:
+        """
+        预估用例文件执行耗时（秒）：历史均值求和，再乘以设备变慢系数
+        :return: 无历史数据时返回None
+        """
+        durations = self.get_test_durations(suite_path)
+        if not durations:
+            return None
+        total_seconds = sum(durations.values()) / 1000
+        if device_id:
+            trend = self.get_device_trend(device_id)
+            if trend["recent_ratio"] and len(trend["points"]) >= self.history_config.get("trend_tasks", 5):
+                total_seconds *= trend["recent_ratio"]
+        return round(total_seconds, 2)
+
+    def get_device_trend(self, device_id: str) -> dict:
+        """
+        设备变慢趋势：每个任务内，用例耗时 / 该设备同一用例历史中位数，取平均得到任务系数
+        最近若干任务系数的均值超过阈值时标记为性能退化
+        :return: {"device_id", "points": [{task_id, start_ms, ratio}], "recent_ratio", "degrading"}
+        """
+        trend_tasks = self.history_config.get("trend_tasks", 5)
+        threshold = self.history_config.get("slowdown_threshold", 1.3)
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT task_id, suite_path, test_key, start_ms, duration_ms FROM test_duration "
+                "WHERE device_id = ? AND status = 'passed' ORDER BY start_ms",
+                (device_id,)
+            ).fetchall()
+
+        # 基线：同一用例在该设备上的历史耗时中位数（按时间滚动，只用之前的数据）
+        history: dict[tuple, list[int]] = {}
+        task_ratios: dict[str, list[float]] = {}
+        task_start: dict[str, int] = {}
+        for row in rows:
+            key = (row["suite_path"], row["test_key"])
+            previous = history.setdefault(key, [])
+            if previous:
+                baseline = median(previous)
+                if baseline >= MIN_TREND_BASELINE_MS:
+                    task_ratios.setdefault(row["task_id"], []).append(row["duration_ms"] / baseline)
+                    task_start.setdefault(row["task_id"], row["start_ms"])
+            previous.append(row["duration_ms"])
+
+        points = sorted(
+            (
+                {"task_id": task_id, "start_ms": task_start[task_id], "ratio": round(sum(r) / len(r), 3)}
+                for task_id, r in task_ratios.items()
+            ),
+            key=lambda p: p["start_ms"]
+        )
+        recent = points[-trend_tasks:]
+        recent_ratio = round(sum(p["ratio"] for p in recent) / len(recent), 3) if recent else None
+        return {
+            "device_id": device_id,
+            "points": points,
+            "recent_ratio": recent_ratio,
+            "threshold": threshold,
+            "degrading": bool(recent_ratio and len(recent) >= trend_tasks and recent_ratio >= threshold)
+        }
+
+
+def record_task_durations(task_id: str, device_id: str, suite_path: str, raw_dir: str, log=None) -> int:
+    """写入任务耗时历史（失败只记录日志，不影响任务结果）"""
+    log = log or TempLog()
+    try:
+        count = DurationStore().record_task(task_id, device_id, suite_path, raw_dir)
+        log.info(f"用例耗时历史已写入：{count}条")
+        return count
+    except Exception as e:
+        log.error(f"用例耗时历史写入失败：{str(e)}", exc_info=True)
+        return 0
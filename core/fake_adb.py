@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+adb 替身（模拟设备客户端）：参数与 adb 相同，转发到 DeviceSimServer 并按 adb 的方式输出
+用法：python core/fake_adb.py -s SIM0001 shell input tap 100 200
+服务地址取环境变量 DEVICE_SIM_URL（如 http://127.0.0.1:5037）
+只依赖标准库；每次调用都要启动Python解释器，开销明显高于真实adb客户端（基准测试会单独测量并扣除）
+"""
+import base64
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+SIM_URL_ENV = "DEVICE_SIM_URL"
+
+
+def _request(url: str, argv: list) -> dict:
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/adb", data=json.dumps({"args": argv}).encode(),
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def _interactive_shell(url: str, prefix: list) -> int:
+    """交互式 adb shell：逐行读取stdin，每行作为一条shell命令执行（stderr 与 stdout 一并输出）"""
+    for line in sys.stdin:
+        line = line.rstrip("\n")
+        if line.strip() == "exit":
+            break
+        if not line.strip():
+            continue
+        result = _request(url, prefix + ["shell", line])
+        sys.stdout.buffer.write(base64.b64decode(result["stdout"]))
+        if result.get("stderr"):
+            sys.stdout.write(result["stderr"] + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+def main(argv: list) -> int:
+    url = os.getenv(SIM_URL_ENV)
+    if not url:
+        sys.stderr.write(f"fake adb: 未设置环境变量 {SIM_URL_ENV}\n")
+        return 1
+    try:
+        prefix = argv[:2] if argv[:1] == ["-s"] else []
+        if argv[len(prefix):] == ["shell"]:
+            return _interactive_shell(url, prefix)
+        result = _request(url, argv)
+    except (urllib.error.URLError, OSError) as e:
+        sys.stderr.write(f"adb: cannot connect to daemon ({e})\n")
+        return 1
+
+    pull = result.get("pull")
+    if pull:
+        local = pull["local"]
+        if os.path.isdir(local):
+            local = os.path.join(local, os.path.basename(argv[argv.index("pull") + 1]))
+        with open(local, "wb") as f:
+            f.write(base64.b64decode(pull["data"]))
+    sys.stdout.buffer.write(base64.b64decode(result["stdout"]))
+    sys.stdout.flush()
+    if result.get("stderr"):
+        sys.stderr.write(result["stderr"] + "\n")
+    return result["returncode"]
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
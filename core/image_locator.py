@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+图像定位：在截图中查找模板图片，返回中心坐标（替代随分辨率变化的硬编码坐标）
+- 归一化互相关（NCC）：分子用 FFT 一次算出所有位置的相关值，分母用积分图求窗口方差，全部 numpy 向量化
+- 金字塔：先在缩小后的截图上按多个缩放比例粗搜，再在原图的峰值附近小窗口内精确匹配
+- 缓存：模板按（路径, 修改时间）缓存各缩放比例的灰度图、零均值模板与频谱；截图的灰度金字塔、积分图与频谱
+  缓存在 Screenshot 上，同一截图上的多次查询只预处理一次
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+from conf import GlobalConfig
+from core.screenshot import Screenshot, block_mean
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # 可选依赖：未安装时不支持图像定位
+    np = None
+
+# 粗搜时模板短边缩到约该像素数（越小越快，过小会丢失细节）
+COARSE_TEMPLATE_SIZE = 16
+MAX_PYRAMID_FACTOR = 8
+# 小模板也至少缩小到该倍数粗搜（粗搜截图面积决定FFT耗时），此时粗搜模板短边不小于 MIN_COARSE_TEMPLATE_SIZE
+MIN_PYRAMID_FACTOR = 4
+MIN_COARSE_TEMPLATE_SIZE = 6
+# 粗搜每个缩放比例取前N个候选位置做精确匹配
+COARSE_CANDIDATES = 3
+# 小模板粗搜区分度低，多取候选（精搜窗口小，逐个精搜代价低）
+SMALL_COARSE_CANDIDATES = 64
+EPSILON = 1e-6
+
+
+def get_locator_config() -> dict:
+    return GlobalConfig.get("image_locator", {})
+
+
+def get_template_path(name: str) -> str:
+    """模板图片路径（绝对路径直接使用，否则相对 path.image_template_dir，可省略 .png）"""
+    if os.path.isabs(name):
+        return name
+    base_dir = GlobalConfig["path"].get(
+        "image_template_dir", os.path.join(GlobalConfig["path"]["test_suite_dir"], "images")
+    )
+    return os.path.join(base_dir, name if os.path.splitext(name)[1] else f"{name}.png")
+
+
+def _fast_len(n: int) -> int:
+    """不小于 n 的 2/3/5 光滑数（FFT在这些长度上最快）"""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+def _resize_bilinear(gray, height: int, width: int):
+    if gray.shape == (height, width):
+        return gray
+    ys = np.linspace(0, gray.shape[0] - 1, height, dtype=np.float32)
+    xs = np.linspace(0, gray.shape[1] - 1, width, dtype=np.float32)
+    y0, x0 = ys.astype(np.int32), xs.astype(np.int32)
+    y1, x1 = np.minimum(y0 + 1, gray.shape[0] - 1), np.minimum(x0 + 1, gray.shape[1] - 1)
+    wy, wx = (ys - y0)[:, None], (xs - x0)[None, :]
+    top = gray[y0][:, x0] * (1 - wx) + gray[y0][:, x1] * wx
+    bottom = gray[y1][:, x0] * (1 - wx) + gray[y1][:, x1] * wx
+    return (top * (1 - wy) + bottom * wy).astype(np.float32)
+
+
+def _integrals(image) -> tuple:
+    """积分图与平方积分图（float64 避免累加误差）"""
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1), dtype=np.float64)
+    integral_sq = np.zeros_like(integral)
+    integral[1:, 1:] = image.cumsum(0, dtype=np.float64).cumsum(1)
+    integral_sq[1:, 1:] = (image.astype(np.float64) ** 2).cumsum(0).cumsum(1)
+    return integral, integral_sq
+
+
+def _window_variance(integrals: tuple, height: int, width: int):
+    """每个窗口（height×width）的像素方差之和（= 平方和 - 和²/n）"""
+    def _sums(table):
+        return table[height:, width:] - table[:-height, width:] - table[height:, :-width] + table[:-height, :-width]
+
+    integral, integral_sq = integrals
+    sums = _sums(integral)
+    return np.maximum(_sums(integral_sq) - sums ** 2 / (height * width), 0)
+
+
+class TemplateFeatures:
+    """模板在某个缩放比例、金字塔层级下的预处理结果"""
+
+    def __init__(self, gray, factor: int, candidates: int = COARSE_CANDIDATES):
+        self.factor = factor
+        self.candidates = candidates  # 粗搜取的候选数
+        self.full = gray
+        self.full_zero, self.full_norm = self._zero_mean(gray)
+        self.coarse = block_mean(gray, factor) if factor > 1 else gray
+        self.coarse_zero, self.coarse_norm = self._zero_mean(self.coarse)
+        self.spectra: dict[tuple, object] = {}  # FFT尺寸 -> 翻转后零均值模板的频谱
+
+    @staticmethod
+    def _zero_mean(gray):
+        zero = gray - gray.mean()
+        return zero, float(np.sqrt((zero.astype(np.float64) ** 2).sum()))
+
+    def spectrum(self, shape: tuple):
+        if shape not in self.spectra:
+            self.spectra[shape] = np.fft.rfft2(self.coarse_zero[::-1, ::-1], shape)
+        return self.spectra[shape]
+
+
+class TemplateCache:
+    """模板缓存（LRU）：{(路径, 修改时间): {缩放比例: TemplateFeatures}}"""
+
+    def __init__(self, max_templates: int = 64):
+        self.max_templates = max_templates
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, scale: float) -> TemplateFeatures:
+        key = (path, os.path.getmtime(path))
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                entry = self._items[key] = {"gray": Screenshot.load(path).gray(), "scales": {}}
+                while len(self._items) > self.max_templates:
+                    self._items.popitem(last=False)
+            self._items.move_to_end(key)
+            features = entry["scales"].get(scale)
+            if features is None:
+                features = entry["scales"][scale] = build_template_features(entry["gray"], scale)
+            return features
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+def build_template_features(gray, scale: float) -> TemplateFeatures:
+    height, width = max(int(round(gray.shape[0] * scale)), 1), max(int(round(gray.shape[1] * scale)), 1)
+    scaled = _resize_bilinear(gray, height, width)
+    factor = 1
+    while factor * 2 <= MAX_PYRAMID_FACTOR and min(height, width) // (factor * 2) >= COARSE_TEMPLATE_SIZE:
+        factor *= 2
+    candidates = COARSE_CANDIDATES
+    # 小模板：放宽粗搜模板尺寸，保证粗搜截图足够小，同时多取候选弥补区分度
+    while factor * 2 <= MIN_PYRAMID_FACTOR and min(height, width) // (factor * 2) >= MIN_COARSE_TEMPLATE_SIZE:
+        factor *= 2
+        candidates = SMALL_COARSE_CANDIDATES
+    features = TemplateFeatures(scaled, factor, candidates)
+    if features.full_norm < EPSILON:
+        raise ValueError("模板图片为纯色，无法定位")
+    return features
+
+
+template_cache = TemplateCache()
+
+
+def _coarse_candidates(screen: Screenshot, features: TemplateFeatures, count: int) -> list[tuple]:
+    """粗搜：在缩小的截图上用FFT计算NCC，返回前 count 个候选 [(分数, 原图y, 原图x)]"""
+    factor = features.factor
+    image = screen.gray(factor)
+    height, width = features.coarse.shape
+    if image.shape[0] < height or image.shape[1] < width:
+        return []
+    shape = (_fast_len(image.shape[0] + height - 1), _fast_len(image.shape[1] + width - 1))
+    image_spectrum = screen.cached(("spectrum", factor, shape), lambda: np.fft.rfft2(image, shape))
+    correlation = np.fft.irfft2(image_spectrum * features.spectrum(shape), shape)
+    numerator = correlation[height - 1:image.shape[0], width - 1:image.shape[1]]
+    variance = _window_variance(screen.cached(("integrals", factor), lambda: _integrals(image)), height, width)
+    ncc = numerator / np.maximum(np.sqrt(variance) * features.coarse_norm, EPSILON)
+    ncc[variance < EPSILON] = 0  # 纯色区域不参与匹配
+
+    # 峰值附近的相邻位置分数相近，多取一些后去掉与已选候选相邻（1个粗搜像素内，精搜窗口可覆盖）的位置
+    flat = ncc.ravel()
+    pool = count * 4
+    top = np.argpartition(flat, -pool)[-pool:] if flat.size > pool else np.arange(flat.size)
+    candidates, kept = [], []
+    for index in top[np.argsort(flat[top])[::-1]]:
+        y, x = divmod(int(index), ncc.shape[1])
+        if any(abs(y - ky) <= 1 and abs(x - kx) <= 1 for ky, kx in kept):
+            continue
+        kept.append((y, x))
+        candidates.append((float(flat[index]), y * features.factor, x * features.factor))
+        if len(candidates) >= count:
+            break
+    return candidates
+
+
+def _refine(screen: Screenshot, features: TemplateFeatures, y: int, x: int) -> tuple:
+    """精搜：在原图上以粗搜位置为中心、±factor 范围内逐位置计算NCC，返回 (分数, y, x)"""
+    image = screen.gray()
+    height, width = features.full.shape
+    radius = features.factor
+    y0, x0 = max(y - radius, 0), max(x - radius, 0)
+    y1, x1 = min(y + radius, image.shape[0] - height), min(x + radius, image.shape[1] - width)
+    if y1 < y0 or x1 < x0:
+        return -1.0, y, x
+    region = image[y0:y1 + height, x0:x1 + width]
+    windows = sliding_window_view(region, (height, width))
+    numerator = np.einsum("ijkl,kl->ij", windows, features.full_zero, optimize=True)
+    variance = _window_variance(_integrals(region), height, width)
+    ncc = numerator / np.maximum(np.sqrt(variance) * features.full_norm, EPSILON)
+    ncc[variance < EPSILON] = 0
+    best_y, best_x = np.unravel_index(int(np.argmax(ncc)), ncc.shape)
+    return float(ncc[best_y, best_x]), y0 + int(best_y), x0 + int(best_x)
+
+
+def locate_template(screen: Screenshot, template: Union[str, Screenshot], threshold: Optional[float] = None,
+                    scales: Optional[list] = None) -> Optional[dict]:
+    """
+    在截图中查找模板
+    :param screen: 截图（灰度金字塔缓存在截图上，多次查询共享）
+    :param template: 模板名称/路径（按文件缓存预处理结果）或 Screenshot
+    :param threshold: 最低匹配分数（NCC，-1~1）
+    :param scales: 模板缩放比例（适配不同分辨率），默认取配置
+    :return: {"x", "y"（中心坐标）, "score", "scale", "bounds": [左, 上, 右, 下]}，未找到返回None
+    """
+    if np is None:
+        raise RuntimeError("图像定位需要安装numpy（pip install -r requirement/image.txt）")
+    config = get_locator_config()
+    threshold = threshold if threshold is not None else config.get("threshold", 0.85)
+    scales = scales or config.get("scales", [1.0])
+
+    if isinstance(template, Screenshot):
+        features_list = [(scale, build_template_features(template.gray(), scale)) for scale in scales]
+    else:
+        path = get_template_path(template)
+        features_list = [(scale, template_cache.get(path, scale)) for scale in scales]
+
+    # 各缩放比例粗搜，候选按粗搜分数排序后精搜；精搜分数已达 0.99 时提前结束
+    candidates = []
+    for scale, features in features_list:
+        if features.full.shape[0] > screen.height or features.full.shape[1] > screen.width:
+            continue
+        for score, y, x in _coarse_candidates(screen, features, features.candidates):
+            candidates.append((score, scale, features, y, x))
+    candidates.sort(key=lambda item: item[0], reverse=True)
+
+    best = None
+    limit = max((features.candidates for _, features in features_list), default=COARSE_CANDIDATES) * 2
+    for _, scale, features, y, x in candidates[:limit]:
+        score, top, left = _refine(screen, features, y, x)
+        if best is None or score > best[0]:
+            best = (score, scale, features, top, left)
+        if score >= 0.99:
+            break
+    if best is None or best[0] < threshold:
+        return None
+
+    score, scale, features, top, left = best
+    height, width = features.full.shape
+    return {
+        "x": left + width // 2,
+        "y": top + height // 2,
+        "score": round(score, 4),
+        "scale": scale,
+        "bounds": [left, top, left + width, top + height]
+    }
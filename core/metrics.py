@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+平台运行指标定义（/metrics 暴露）：
+- 事件类指标由 DeviceManager / TestExecutor / 报告流水线 / 路由在发生时更新
+- 瞬时值（任务数、报告队列、日志队列、设备操作汇总）在抓取时由采集回调刷新
+"""
+from typing import Callable, Optional
+from util.log_util import get_log_status
+from util.metrics_util import metrics_registry
+from util.timing_util import timing_registry, BUCKET_BOUNDS_MS
+
+PREFIX = "uitest"
+
+# ------------------- HTTP -------------------
+HTTP_REQUESTS = metrics_registry.counter(
+    f"{PREFIX}_http_requests_total", "HTTP请求数", ("method", "endpoint", "status")
+)
+HTTP_LATENCY = metrics_registry.histogram(
+    f"{PREFIX}_http_request_duration_seconds", "HTTP请求耗时（秒）", ("method", "endpoint"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# ------------------- 任务 -------------------
+TASKS_STARTED = metrics_registry.counter(f"{PREFIX}_tasks_started_total", "已启动任务数", ("device_id",))
+TASKS_FINISHED = metrics_registry.counter(
+    f"{PREFIX}_tasks_finished_total", "已结束任务数（按结果）", ("device_id", "result")
+)
+TASKS = metrics_registry.gauge(f"{PREFIX}_tasks", "当前任务数（按状态）", ("status",))
+TASKS_RUNNING = metrics_registry.gauge(f"{PREFIX}_device_tasks_running", "各设备运行中任务数", ("device_id",))
+EXECUTOR_STAGE_LATENCY = metrics_registry.histogram(
+    f"{PREFIX}_executor_stage_duration_seconds", "任务阶段耗时（秒）", ("device_id", "stage")
+)
+
+# ------------------- 设备 -------------------
+DEVICE_INIT_LATENCY = metrics_registry.histogram(
+    f"{PREFIX}_device_init_duration_seconds", "设备初始化耗时（秒）", ("device_id",),
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+DEVICE_INIT_FAILURES = metrics_registry.counter(
+    f"{PREFIX}_device_init_failures_total", "设备初始化失败次数", ("device_id",)
+)
+ADB_COMMANDS = metrics_registry.counter(f"{PREFIX}_adb_commands_total", "Web进程执行的adb命令数", ("command",))
+ADB_ERRORS = metrics_registry.counter(
+    f"{PREFIX}_adb_errors_total", "Web进程adb命令失败数（返回码非0/超时/异常）", ("command",)
+)
+DEVICE_ACTION_ERRORS = metrics_registry.gauge(
+    f"{PREFIX}_device_action_errors", "设备操作累计失败次数（含Pytest子进程上报）", ("device_id", "action")
+)
+# 分桶与 timing_registry 一致（毫秒换算为秒），抓取时直接载入汇总桶计数
+DEVICE_ACTION_SECONDS = metrics_registry.histogram(
+    f"{PREFIX}_device_action_seconds", "设备操作耗时（秒，含Pytest子进程上报）", ("device_id", "action"),
+    buckets=tuple(bound / 1000 for bound in BUCKET_BOUNDS_MS)
+)
+
+# ------------------- 报告流水线 -------------------
+REPORT_LATENCY = metrics_registry.histogram(
+    f"{PREFIX}_report_latency_seconds", "Pytest结束到报告可用的耗时（秒，含排队）", ("result",)
+)
+REPORT_QUEUE_DEPTH = metrics_registry.gauge(f"{PREFIX}_report_queue_depth", "报告流水线队列深度", ("stage",))
+REPORT_QUEUE_CAPACITY = metrics_registry.gauge(f"{PREFIX}_report_queue_capacity", "报告流水线队列容量")
+REPORT_ACTIVE = metrics_registry.gauge(f"{PREFIX}_report_active_jobs", "报告流水线处理中的任务数", ("stage",))
+REPORT_JOBS = metrics_registry.gauge(f"{PREFIX}_report_jobs", "报告流水线累计任务数（按结果）", ("result",))
+
+# ------------------- 日志 -------------------
+LOG_QUEUE_DEPTH = metrics_registry.gauge(f"{PREFIX}_log_queue_depth", "异步日志队列积压条数")
+LOG_QUEUE_CAPACITY = metrics_registry.gauge(f"{PREFIX}_log_queue_capacity", "异步日志队列容量")
+LOG_DROPPED = metrics_registry.gauge(f"{PREFIX}_log_dropped", "异步日志队列满时累计丢弃条数")
+LOG_HANDLERS = metrics_registry.gauge(f"{PREFIX}_log_handlers", "日志处理器池中的处理器数")
+
+
+def classify_task_status(status: Optional[str]) -> str:
+    """任务状态归类为有限的结果标签（失败原因不进入标签）"""
+    status = status or "unknown"
+    return "failed" if status.startswith("failed") else status
+
+
+def observe_adb(command: str, failed: bool) -> None:
+    ADB_COMMANDS.inc(command=command)
+    if failed:
+        ADB_ERRORS.inc(command=command)
+
+
+# ------------------- 采集回调 -------------------
+def collect_device_actions() -> None:
+    """设备操作耗时汇总（timing_registry）转为指标"""
+    for metric in (DEVICE_ACTION_ERRORS, DEVICE_ACTION_SECONDS):
+        metric.clear()
+    for device_id, actions in timing_registry.snapshot(prefix="ui.").items():
+        for action, data in actions.items():
+            DEVICE_ACTION_ERRORS.set(data["errors"], device_id=device_id, action=action)
+            DEVICE_ACTION_SECONDS.load(data["buckets"], data["sum_ms"] / 1000, data["count"],
+                                       device_id=device_id, action=action)
+
+
+def collect_log_status() -> None:
+    status = get_log_status()
+    LOG_HANDLERS.set(status["handler_pool"]["handlers"])
+    async_status = status["async"] or {"queue": 0, "capacity": 0, "dropped": 0}
+    LOG_QUEUE_DEPTH.set(async_status["queue"])
+    LOG_QUEUE_CAPACITY.set(async_status["capacity"])
+    LOG_DROPPED.set(async_status["dropped"])
+
+
+def make_task_collector(get_tasks: Callable[[], list]) -> Callable[[], None]:
+    """
+    任务状态采集回调
+    :param get_tasks: 返回当前任务信息列表（包含 status / device_id）
+    """
+    def collect() -> None:
+        TASKS.clear()
+        TASKS_RUNNING.clear()
+        for task in get_tasks():
+            status = classify_task_status(task.get("status"))
+            TASKS.inc(status=status)
+            if status == "running":
+                TASKS_RUNNING.inc(device_id=task.get("device_id", ""))
+    return collect
+
+
+def make_pipeline_collector(get_pipeline: Callable) -> Callable[[], None]:
+    """报告流水线采集回调（未启用时不输出）"""
+    def collect() -> None:
+        pipeline = get_pipeline()
+        if pipeline is None:
+            return
+        status = pipeline.status()
+        for stage in ("generate", "compress"):
+            REPORT_QUEUE_DEPTH.set(status["queue"][stage], stage=stage)
+            REPORT_ACTIVE.set(status["active"].get(stage, 0), stage=stage)
+        REPORT_QUEUE_CAPACITY.set(status["queue"]["capacity"])
+        for result in ("submitted", "rejected", "done", "failed"):
+            REPORT_JOBS.set(status.get(result, 0), result=result)
+    return collect
+
+
+metrics_registry.register_collector(collect_device_actions)
+metrics_registry.register_collector(collect_log_status)
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Pytest子进程资源画像（可选）：
+- 后台线程按固定间隔采样子进程树（pytest 及其启动的 adb/uiautomator2 等子进程）的CPU、RSS、磁盘IO
+  （优先使用 psutil，未安装时在 Linux 上直接读取 /proc）
+- 可选以 cProfile（确定性）或 py-spy（采样，需单独安装）运行 pytest
+- 产物写入任务目录，与 task_<id>.log 并列：
+  task_<id>.profile.json（汇总 + 时间序列）、task_<id>.pstats / task_<id>.profile.txt（cProfile）、
+  task_<id>.flame.svg（py-spy）
+"""
+import io
+import json
+import os
+import pstats
+import shutil
+import threading
+import time
+from typing import Optional
+from conf import GlobalConfig
+
+try:
+    import psutil
+except ImportError:  # 未安装时退化为读取 /proc（仅Linux）
+    psutil = None
+
+PROFILE_SUFFIXES = {
+    "summary": ".profile.json",
+    "pstats": ".pstats",
+    "text": ".profile.txt",
+    "flame": ".flame.svg"
+}
+PYTHON_PROFILERS = ("none", "cprofile", "py-spy")
+# 启用Python性能分析时pytest的入口脚本（以路径执行，不依赖子进程的工作目录）
+PROFILED_PYTEST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiled_pytest.py")
+MB = 1024 ** 2
+
+
+# ------------------- 进程树读取 -------------------
+def _read_proc_stats(pid: int) -> Optional[dict]:
+    """读取 /proc/<pid> 的CPU时间、RSS、IO（进程已退出返回None）"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            stat_line = f.read()
+        # comm 可能包含空格和括号，从最后一个右括号之后解析
+        name = stat_line[stat_line.index("(") + 1:stat_line.rindex(")")]
+        fields = stat_line[stat_line.rindex(")") + 2:].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        stats = {
+            "ppid": int(fields[1]),
+            "name": name,
+            "cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks,
+            "rss_bytes": int(fields[21]) * page_size,
+            "read_bytes": 0,
+            "write_bytes": 0
+        }
+    except (OSError, ValueError, IndexError):
+        return None
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("read_bytes", "write_bytes"):
+                    stats[key] = int(value)
+    except OSError:
+        pass  # 无权限读取io时只统计CPU/内存
+    return stats
+
+
+def _list_proc_tree(root_pid: int) -> dict[int, dict]:
+    """/proc 方式：扫描全部进程，按ppid找出root_pid的进程树"""
+    all_stats = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            stats = _read_proc_stats(int(entry))
+            if stats:
+                all_stats[int(entry)] = stats
+    tree, pending = {}, [root_pid]
+    children: dict[int, list] = {}
+    for pid, stats in all_stats.items():
+        children.setdefault(stats["ppid"], []).append(pid)
+    while pending:
+        pid = pending.pop()
+        if pid in all_stats and pid not in tree:
+            tree[pid] = all_stats[pid]
+            pending.extend(children.get(pid, []))
+    return tree
+
+
+def _list_psutil_tree(root_pid: int) -> dict[int, dict]:
+    tree = {}
+    try:
+        root = psutil.Process(root_pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return tree
+    for process in processes:
+        try:
+            with process.oneshot():
+                cpu = process.cpu_times()
+                stats = {
+                    "name": process.name(),
+                    "cpu_seconds": cpu.user + cpu.system,
+                    "rss_bytes": process.memory_info().rss,
+                    "read_bytes": 0,
+                    "write_bytes": 0
+                }
+                if hasattr(process, "io_counters"):
+                    try:
+                        io_counters = process.io_counters()
+                        stats["read_bytes"] = io_counters.read_bytes
+                        stats["write_bytes"] = io_counters.write_bytes
+                    except psutil.Error:
+                        pass
+        except psutil.Error:
+            continue
+        tree[process.pid] = stats
+    return tree
+
+
+def list_process_tree(root_pid: int) -> dict[int, dict]:
+    """
+    获取进程树各进程的资源统计
+    :return: {pid: {"name", "cpu_seconds", "rss_bytes", "read_bytes", "write_bytes"}}
+    """
+    if psutil is not None:
+        return _list_psutil_tree(root_pid)
+    if os.path.isdir("/proc"):
+        return _list_proc_tree(root_pid)
+    return {}
+
+
+def is_sampling_supported() -> bool:
+    return psutil is not None or os.path.isdir("/proc")
+
+
+# ------------------- 采样 -------------------
+class ProcessTreeSampler:
+    """
+    后台采样进程树资源
+    已退出进程的CPU时间/IO按最后一次采样值计入累计（采样间隔内退出的短命进程无法统计）
+    """
+
+    def __init__(self, root_pid: int, interval: float = 1.0):
+        self.root_pid = root_pid
+        self.interval = max(interval, 0.1)
+        # 时间序列：[相对秒, CPU%, RSS(MB), 累计读(MB), 累计写(MB), 进程数]
+        self.samples: list[list] = []
+        self._processes: dict[tuple, dict] = {}
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{root_pid}", daemon=True)
+        self._start_time = None
+
+    def start(self) -> "ProcessTreeSampler":
+        self._start_time = time.time()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=self.interval * 2 + 1)
+
+    def _totals(self) -> tuple[float, int, int]:
+        return (
+            sum(p["cpu_seconds"] for p in self._processes.values()),
+            sum(p["read_bytes"] for p in self._processes.values()),
+            sum(p["write_bytes"] for p in self._processes.values())
+        )
+
+    def sample_once(self) -> None:
+        tree = list_process_tree(self.root_pid)
+        now = time.time()
+        prev_cpu = self._totals()[0]
+        rss = 0
+        for pid, stats in tree.items():
+            # 按 pid+名称 区分进程（pid 被复用为其他程序时不会与旧进程合并）
+            record = self._processes.setdefault((pid, stats["name"]), {
+                "pid": pid, "name": stats["name"], "peak_rss_bytes": 0,
+                "cpu_seconds": 0.0, "read_bytes": 0, "write_bytes": 0
+            })
+            record["cpu_seconds"] = max(record["cpu_seconds"], stats["cpu_seconds"])
+            record["read_bytes"] = max(record["read_bytes"], stats["read_bytes"])
+            record["write_bytes"] = max(record["write_bytes"], stats["write_bytes"])
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"], stats["rss_bytes"])
+            rss += stats["rss_bytes"]
+        cpu, read_bytes, write_bytes = self._totals()
+        elapsed = now - self._start_time
+        last_time = self.samples[-1][0] if self.samples else 0
+        cpu_percent = (cpu - prev_cpu) / (elapsed - last_time) * 100 if elapsed > last_time else 0
+        self.samples.append([
+            round(elapsed, 2), round(cpu_percent, 1), round(rss / MB, 2),
+            round(read_bytes / MB, 2), round(write_bytes / MB, 2), len(tree)
+        ])
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.sample_once()
+            except Exception:
+                pass  # 采样失败不影响测试执行
+            self._stop_event.wait(self.interval)
+
+    def summary(self, top: int = 10) -> dict:
+        cpu, read_bytes, write_bytes = self._totals()
+        duration = (self.samples[-1][0] if self.samples else 0) or 0
+        rss_values = [s[2] for s in self.samples]
+        processes = sorted(self._processes.values(), key=lambda p: p["cpu_seconds"], reverse=True)
+        return {
+            "duration": duration,
+            "sample_count": len(self.samples),
+            "interval": self.interval,
+            "cpu_seconds": round(cpu, 2),
+            "avg_cpu_percent": round(cpu / duration * 100, 1) if duration else 0,
+            "peak_cpu_percent": max((s[1] for s in self.samples), default=0),
+            "peak_rss_mb": max(rss_values, default=0),
+            "avg_rss_mb": round(sum(rss_values) / len(rss_values), 2) if rss_values else 0,
+            "read_mb": round(read_bytes / MB, 2),
+            "write_mb": round(write_bytes / MB, 2),
+            "max_processes": max((s[5] for s in self.samples), default=0),
+            "process_count": len(self._processes),
+            "top_processes": [
+                {
+                    "pid": p["pid"],
+                    "name": p["name"],
+                    "cpu_seconds": round(p["cpu_seconds"], 2),
+                    "peak_rss_mb": round(p["peak_rss_bytes"] / MB, 2),
+                    "read_mb": round(p["read_bytes"] / MB, 2),
+                    "write_mb": round(p["write_bytes"] / MB, 2)
+                }
+                for p in processes[:top]
+            ]
+        }
+
+
+# ------------------- 任务画像 -------------------
+class TaskProfiler:
+    """
+    单个任务的画像：改写pytest命令（cProfile/py-spy），启动/停止进程树采样，写入产物
+    :param path_prefix: 产物路径前缀（如 result/<task_id>/task_<task_id>）
+    """
+
+    def __init__(self, path_prefix: str, log=None):
+        self.config = GlobalConfig.get("profile", {})
+        self.path_prefix = path_prefix
+        self.log = log
+        self.python_profiler = self.config.get("python_profiler", "none") or "none"
+        if self.python_profiler not in PYTHON_PROFILERS:
+            raise ValueError(f"不支持的Python性能分析方式：{self.python_profiler}（支持：{PYTHON_PROFILERS}）")
+        if self.python_profiler == "py-spy" and not shutil.which("py-spy"):
+            self._warn("未找到 py-spy，跳过采样式性能分析（pip install py-spy）")
+            self.python_profiler = "none"
+        self.sampler: Optional[ProcessTreeSampler] = None
+
+    def _warn(self, msg: str) -> None:
+        if self.log:
+            self.log.warning(msg)
+
+    def get_path(self, kind: str) -> str:
+        return self.path_prefix + PROFILE_SUFFIXES[kind]
+
+    def get_exit_code_path(self) -> str:
+        return self.path_prefix + ".exitcode"
+
+    def wrap_command(self, cmd: list) -> list:
+        """
+        按配置改写pytest命令
+        不使用 `python -m cProfile -m pytest`：cProfile 会吞掉 pytest 的 SystemExit，进程总是返回0，
+        改由 profiled_pytest.py 包住 pytest.main()，并把返回码写入文件（py-spy 不一定透传子进程返回码）
+        :param cmd: ["python", "-m", "pytest", ...]
+        """
+        if cmd[:3] != ["python", "-m", "pytest"] or self.python_profiler == "none":
+            return cmd
+        args = cmd[3:]
+        runner = [
+            "python", PROFILED_PYTEST_SCRIPT, "--exit-code-file", self.get_exit_code_path()
+        ]
+        if self.python_profiler == "cprofile":
+            return [*runner, "--pstats", self.get_path("pstats"), "--", *args]
+        return [
+            "py-spy", "record", "--subprocesses", "--rate", str(self.config.get("py_spy_rate", 100)),
+            "-o", self.get_path("flame"), "--", *runner, "--", *args
+        ]
+
+    def resolve_returncode(self, returncode: int) -> int:
+        """
+        pytest的真实返回码：优先取 profiled_pytest.py 写出的返回码（外层为py-spy时其返回码不可靠），
+        没有该文件（未改写命令、pytest异常退出）时使用进程返回码
+        """
+        path = self.get_exit_code_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return returncode
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def start(self, pid: int) -> None:
+        if not is_sampling_supported():
+            self._warn("当前环境无法采样进程资源（未安装psutil且无/proc）")
+            return
+        self.sampler = ProcessTreeSampler(pid, self.config.get("interval", 1.0)).start()
+
+    def stop(self) -> None:
+        if self.sampler:
+            self.sampler.stop()
+
+    def _write_pstats_text(self) -> Optional[str]:
+        """cProfile结果转为按累计耗时排序的文本"""
+        pstats_path = self.get_path("pstats")
+        if not os.path.exists(pstats_path):
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(pstats_path, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.config.get("top_functions", 30))
+        text_path = self.get_path("text")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(stream.getvalue())
+        return text_path
+
+    def save(self) -> dict:
+        """
+        写入画像产物
+        :return: {"summary": 资源汇总, "artifacts": {类型: 文件路径}}
+        """
+        artifacts = {}
+        summary = self.sampler.summary(self.config.get("top_processes", 10)) if self.sampler else {}
+        try:
+            text_path = self._write_pstats_text()
+        except Exception as e:
+            self._warn(f"cProfile结果解析失败：{str(e)[:300]}")
+            text_path = None
+        for kind in ("pstats", "flame"):
+            if os.path.exists(self.get_path(kind)):
+                artifacts[kind] = self.get_path(kind)
+        if text_path:
+            artifacts["text"] = text_path
+
+        summary_path = self.get_path("summary")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "python_profiler": self.python_profiler,
+                "summary": summary,
+                "artifacts": {kind: os.path.basename(path) for kind, path in artifacts.items()},
+                "columns": ["time", "cpu_percent", "rss_mb", "read_mb", "write_mb", "processes"],
+                "samples": self.sampler.samples if self.sampler else []
+            }, f, ensure_ascii=False)
+        artifacts["summary"] = summary_path
+        return {"summary": summary, "artifacts": artifacts}
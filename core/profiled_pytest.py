@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+启用Python性能分析时执行pytest的入口（由 TaskProfiler.wrap_command 以脚本路径调用）：
+- `python -m cProfile -m pytest` 会吞掉 pytest 的 SystemExit，进程总是返回0，
+  因此这里自行用 cProfile.Profile 包住 pytest.main()，写出pstats后按pytest返回码退出
+- 返回码同时写入 --exit-code-file（py-spy 等外层进程不一定透传子进程返回码）
+用法：python profiled_pytest.py [--pstats PATH] [--exit-code-file PATH] -- <pytest参数>
+不导入项目模块，避免影响被测用例的导入顺序
+"""
+import argparse
+import os
+import sys
+
+
+def main(argv: list) -> int:
+    separator = argv.index("--") if "--" in argv else len(argv)
+    parser = argparse.ArgumentParser(prog="profiled_pytest")
+    parser.add_argument("--pstats", default=None, help="cProfile结果输出路径（不传则不做确定性分析）")
+    parser.add_argument("--exit-code-file", default=None, help="pytest返回码输出路径")
+    options = parser.parse_args(argv[:separator])
+    pytest_args = argv[separator + 1:]
+
+    # 与 `python -m pytest` 一致：当前目录而不是脚本所在目录位于 sys.path 首位
+    sys.path[0] = os.getcwd()
+    import pytest
+
+    profile = None
+    if options.pstats:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        returncode = int(pytest.main(pytest_args))
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(options.pstats)
+    if options.exit_code_file:
+        with open(options.exit_code_file, "w", encoding="utf-8") as f:
+            f.write(str(returncode))
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+/* 轻量Allure报告查看页：读取 widgets/summary.json、data/suites.json、data/test-cases/<uid>.json 渲染 */
+(function () {
+    "use strict";
+
+    var STATUS_TEXT = {passed: "通过", failed: "失败", broken: "异常", skipped: "跳过", unknown: "未知"};
+    // 任务执行中报告为部分结果，定时刷新
+    var REFRESH_INTERVAL = 3000;
+
+    function escapeHtml(value) {
+        return String(value == null ? "" : value)
+            .replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;")
+            .replace(/"/g, "&quot;").replace(/'/g, "&#39;");
+    }
+
+    function formatDuration(ms) {
+        if (ms == null) return "-";
+        if (ms < 1000) return ms + "ms";
+        return (ms / 1000).toFixed(2) + "s";
+    }
+
+    function fetchJson(path) {
+        return fetch(path, {cache: "no-cache"}).then(function (resp) {
+            if (!resp.ok) throw new Error(path + " " + resp.status);
+            return resp.json();
+        });
+    }
+
+    function statusBadge(status) {
+        return '<span class="badge status-' + escapeHtml(status) + '">' +
+            escapeHtml(STATUS_TEXT[status] || status) + "</span>";
+    }
+
+    function renderSummary(summary) {
+        var stat = summary.statistic || {};
+        var html = ['<span class="total">共 ' + (stat.total || 0) + " 条</span>"];
+        ["passed", "failed", "broken", "skipped", "unknown"].forEach(function (status) {
+            if (stat[status]) html.push(statusBadge(status) + " " + stat[status]);
+        });
+        html.push('<span class="duration">耗时 ' + formatDuration((summary.time || {}).duration) + "</span>");
+        if (summary.running) html.push('<span class="running">执行中，当前为部分结果</span>');
+        document.getElementById("summary").innerHTML = html.join(" ");
+        if (summary.reportName) document.title = summary.reportName;
+    }
+
+    function renderNode(node) {
+        if (node.uid && !node.children) {
+            return '<li class="leaf" data-uid="' + escapeHtml(node.uid) + '">' + statusBadge(node.status) +
+                " " + escapeHtml(node.name) + ' <span class="muted">' +
+                formatDuration((node.time || {}).duration) + "</span></li>";
+        }
+        var children = (node.children || []).map(renderNode).join("");
+        return '<li class="group"><div class="group-name">' + escapeHtml(node.name) + "</div><ul>" +
+            children + "</ul></li>";
+    }
+
+    function renderAttachments(attachments) {
+        return (attachments || []).map(function (a) {
+            var url = "data/attachments/" + encodeURIComponent(a.source);
+            if ((a.type || "").indexOf("image/") === 0) {
+                return '<div class="attachment"><div>' + escapeHtml(a.name) + '</div><img src="' + url + '"></div>';
+            }
+            return '<div class="attachment"><a href="' + url + '" target="_blank">' + escapeHtml(a.name) +
+                "</a> <span class=\"muted\">" + (a.size || 0) + "B</span></div>";
+        }).join("");
+    }
+
+    function renderStage(stage, title) {
+        var steps = (stage.steps || []).map(function (step) { return renderStage(step); }).join("");
+        var message = stage.statusMessage ? '<pre class="message">' + escapeHtml(stage.statusMessage) + "</pre>" : "";
+        return '<div class="stage">' + statusBadge(stage.status) + " " + escapeHtml(title || stage.name) +
+            ' <span class="muted">' + formatDuration((stage.time || {}).duration) + "</span>" + message +
+            renderAttachments(stage.attachments) + (steps ? '<div class="steps">' + steps + "</div>" : "") + "</div>";
+    }
+
+    function renderDetail(testCase) {
+        var html = ["<h2>" + statusBadge(testCase.status) + " " + escapeHtml(testCase.name) + "</h2>"];
+        html.push('<div class="muted">' + escapeHtml(testCase.fullName) + " · " +
+            formatDuration((testCase.time || {}).duration) + "</div>");
+        if (testCase.description) html.push("<p>" + escapeHtml(testCase.description) + "</p>");
+        if (testCase.statusMessage) html.push('<pre class="message">' + escapeHtml(testCase.statusMessage) + "</pre>");
+        if (testCase.statusTrace) html.push('<pre class="trace">' + escapeHtml(testCase.statusTrace) + "</pre>");
+        html.push("<h3>前置</h3>" + (testCase.beforeStages || []).map(function (s) { return renderStage(s); }).join(""));
+        html.push("<h3>执行</h3>" + renderStage(testCase.testStage || {}, "用例主体"));
+        html.push("<h3>后置</h3>" + (testCase.afterStages || []).map(function (s) { return renderStage(s); }).join(""));
+        var detail = document.getElementById("detail");
+        detail.className = "";
+        detail.innerHTML = html.join("");
+    }
+
+    function bindTree() {
+        document.getElementById("suites").addEventListener("click", function (event) {
+            var leaf = event.target.closest(".leaf");
+            if (!leaf) return;
+            document.querySelectorAll(".leaf.active").forEach(function (el) { el.classList.remove("active"); });
+            leaf.classList.add("active");
+            fetchJson("data/test-cases/" + leaf.getAttribute("data-uid") + ".json").then(renderDetail);
+        });
+    }
+
+    function renderTree(tree) {
+        var container = document.getElementById("suites");
+        var active = container.querySelector(".leaf.active");
+        var activeUid = active ? active.getAttribute("data-uid") : null;
+        container.innerHTML = "<ul>" + (tree.children || []).map(renderNode).join("") + "</ul>";
+        if (activeUid) {
+            var leaf = container.querySelector('.leaf[data-uid="' + activeUid + '"]');
+            if (leaf) leaf.classList.add("active");
+        }
+    }
+
+    function load() {
+        fetchJson("widgets/summary.json").then(function (summary) {
+            renderSummary(summary);
+            if (summary.running) setTimeout(load, REFRESH_INTERVAL);
+        }).catch(function () {
+            // 报告数据尚未生成（任务刚启动），稍后重试
+            setTimeout(load, REFRESH_INTERVAL);
+        });
+        fetchJson("data/suites.json").then(renderTree).catch(function () {
+            document.getElementById("suites").innerHTML = '<div class="muted">暂无用例数据</div>';
+        });
+    }
+
+    bindTree();
+    load();
+})();
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import html
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+from util.allure_util import (
+    RESULT_SUFFIX, CONTAINER_SUFFIX, load_json_file, get_label, get_duration_ms
+)
+from util.log_util import TempLog
+from util.path_util import safe_join
+from core.blob_store import link_or_copy
+from core.report_static import NATIVE_ASSETS_DIR, NATIVE_ASSET_FILES, publish_native_assets, get_static_href
+
+STATUS_ORDER = ("failed", "broken", "skipped", "passed", "unknown")
+
+
+def _short_uid(value: str) -> str:
+    """生成16位uid（与Allure报告中test-case/attachment的uid长度一致）"""
+    return hashlib.md5(value.encode("utf-8")).hexdigest()[:16]
+
+
+def _time_info(item: dict) -> dict:
+    start, stop = item.get("start"), item.get("stop")
+    return {"start": start, "stop": stop, "duration": get_duration_ms(item)}
+
+
+def _dump_json(file_path: str, data) -> None:
+    """写入JSON（先写临时文件再替换，报告生成过程中查看页不会读到半个文件）"""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, file_path)
+
+
+class AllureReportBuilder:
+    """
+    进程内Allure报告生成器（替代 `allure generate` Java CLI）
+    读取 allure_raw 下的 *-result.json / *-container.json / 附件，
+    输出与Allure报告目录结构一致的 data/、widgets/ JSON 和静态查看页
+
+    支持增量生成：pytest运行期间反复调用 update() 只处理新增的结果/容器文件，
+    结束后调用 finalize() 收尾，无需再完整生成一遍
+    """
+
+    def __init__(self, raw_dir: str, html_dir: str, title: str = "Allure Report", log=None,
+                 report_root: Optional[str] = None):
+        """
+        :param raw_dir: allure_raw 目录
+        :param html_dir: 报告输出目录
+        :param title: 报告标题
+        :param report_root: 报告根目录（指定时前端资源引用共享目录，不再复制到任务目录）
+        """
+        self.raw_dir = raw_dir
+        self.html_dir = html_dir
+        self.title = title
+        self.report_root = report_root
+        self.log = log or TempLog()
+        self.data_dir = os.path.join(html_dir, "data")
+        self.test_case_dir = os.path.join(self.data_dir, "test-cases")
+        self.attachment_dir = os.path.join(self.data_dir, "attachments")
+        self.widgets_dir = os.path.join(html_dir, "widgets")
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        """清空增量状态"""
+        self._seen_files = set()     # 已处理的原始文件名
+        self._results = {}           # 用例uuid -> 原始结果
+        self._fixtures = {}          # 用例uuid -> {"befores": [...], "afters": [...]}
+        self._cases = {}             # 用例uuid -> 报告test-case
+        self._summary = {}
+        self._index_written = False
+
+    # ------------------- 原始数据读取 -------------------
+    def _scan_new_files(self) -> set:
+        """
+        读取新增的结果/容器文件
+        :return: 需要重新转换的用例uuid集合
+        """
+        changed = set()
+        with os.scandir(self.raw_dir) as entries:
+            names = sorted(e.name for e in entries if e.name not in self._seen_files)
+        for name in names:
+            file_path = os.path.join(self.raw_dir, name)
+            if name.endswith(CONTAINER_SUFFIX):
+                container = load_json_file(file_path)
+                if container is None:
+                    continue  # 文件仍在写入，下次再读
+                for child in container.get("children", []):
+                    stages = self._fixtures.setdefault(child, {"befores": [], "afters": []})
+                    stages["befores"].extend(container.get("befores", []))
+                    stages["afters"].extend(container.get("afters", []))
+                    changed.add(child)
+            elif name.endswith(RESULT_SUFFIX):
+                result = load_json_file(file_path)
+                if result is None:
+                    continue
+                self._results[result.get("uuid", name)] = result
+                changed.add(result.get("uuid", name))
+            self._seen_files.add(name)
+        # 容器可能先于结果出现，只保留已有结果的用例
+        return {uuid for uuid in changed if uuid in self._results}
+
+    # ------------------- 格式转换 -------------------
+    def _convert_attachments(self, attachments: list) -> list:
+        """链接（不支持时复制）附件到 data/attachments，返回报告格式的附件列表"""
+        converted = []
+        for attachment in attachments or []:
+            source = attachment.get("source", "")
+            if not source:
+                continue
+            try:
+                # source 来自结果JSON，防止 ../ 把任意文件复制进对外提供的报告
+                src_path = safe_join(self.raw_dir, source)
+            except ValueError:
+                self.log.warning(f"跳过非法附件路径：{source}")
+                continue
+            if not os.path.isfile(src_path):
+                continue
+            uid = _short_uid(source)
+            target_name = uid + os.path.splitext(source)[1]
+            target_path = os.path.join(self.attachment_dir, target_name)
+            if not os.path.exists(target_path):
+                # 原始附件已去重为数据文件的硬链接，报告中同样链接，不再复制
+                link_or_copy(src_path, target_path)
+            converted.append({
+                "uid": uid,
+                "name": attachment.get("name", source),
+                "source": target_name,
+                "type": attachment.get("type", "application/octet-stream"),
+                "size": os.path.getsize(src_path)
+            })
+        return converted
+
+    def _convert_stage(self, stage: dict) -> dict:
+        """转换步骤/前后置（递归处理子步骤）"""
+        details = stage.get("statusDetails") or {}
+        steps = [self._convert_stage(step) for step in stage.get("steps", [])]
+        attachments = self._convert_attachments(stage.get("attachments"))
+        return {
+            "name": stage.get("name", ""),
+            "time": _time_info(stage),
+            "status": stage.get("status", "unknown"),
+            "statusMessage": details.get("message"),
+            "statusTrace": details.get("trace"),
+            "steps": steps,
+            "attachments": attachments,
+            "parameters": stage.get("parameters", []),
+            "stepsCount": len(steps),
+            "attachmentsCount": len(attachments)
+        }
+
+    def _convert_result(self, result: dict) -> dict:
+        """将单条原始结果转换为报告 test-case JSON"""
+        details = result.get("statusDetails") or {}
+        stages = self._fixtures.get(result.get("uuid"), {"befores": [], "afters": []})
+        labels = result.get("labels", [])
+        description = result.get("description")
+        return {
+            "uid": _short_uid(result.get("uuid", "")),
+            "name": result.get("name", ""),
+            "fullName": result.get("fullName"),
+            "historyId": result.get("historyId"),
+            "time": _time_info(result),
+            "description": description,
+            "descriptionHtml": f"<p>{html.escape(description)}</p>\n" if description else None,
+            "status": result.get("status", "unknown"),
+            "statusMessage": details.get("message"),
+            "statusTrace": details.get("trace"),
+            "flaky": bool(details.get("flaky", False)),
+            "beforeStages": [self._convert_stage(s) for s in stages["befores"]],
+            "testStage": self._convert_stage(result),
+            "afterStages": [self._convert_stage(s) for s in stages["afters"]],
+            "labels": labels,
+            "parameters": result.get("parameters", []),
+            "links": result.get("links", []),
+            "extra": {
+                "severity": get_label(result, "severity", "normal"),
+                "tags": [label["value"] for label in labels if label.get("name") == "tag"]
+            }
+        }
+
+    # ------------------- 汇总数据 -------------------
+    @staticmethod
+    def _statistic(test_cases: list) -> dict:
+        statistic = {status: 0 for status in STATUS_ORDER}
+        for case in test_cases:
+            statistic[case["status"] if case["status"] in statistic else "unknown"] += 1
+        statistic["total"] = len(test_cases)
+        return statistic
+
+    @staticmethod
+    def _tree_leaf(case: dict) -> dict:
+        return {
+            "name": case["name"],
+            "uid": case["uid"],
+            "status": case["status"],
+            "time": case["time"],
+            "flaky": case["flaky"],
+            "parameters": [p.get("value") for p in case["parameters"]],
+            "tags": case["extra"]["tags"]
+        }
+
+    def _build_suites_tree(self, test_cases: list) -> dict:
+        """按 parentSuite -> suite -> subSuite 标签构建用例树"""
+        root = {"uid": _short_uid("suites"), "name": "suites", "children": []}
+        for case in sorted(test_cases, key=lambda c: c["time"]["start"] or 0):
+            node = root
+            for label_name in ("parentSuite", "suite", "subSuite"):
+                value = next((l["value"] for l in case["labels"] if l.get("name") == label_name), None)
+                if not value:
+                    continue
+                child = next((c for c in node["children"] if c.get("name") == value and "uid" not in c), None)
+                if child is None:
+                    child = {"name": value, "children": []}
+                    node["children"].append(child)
+                node = child
+            node["children"].append(self._tree_leaf(case))
+        return root
+
+    def _build_widgets(self, test_cases: list, running: bool) -> dict:
+        """生成 widgets/ 下的汇总JSON，返回summary内容"""
+        starts = [c["time"]["start"] for c in test_cases if c["time"]["start"] is not None]
+        stops = [c["time"]["stop"] for c in test_cases if c["time"]["stop"] is not None]
+        durations = [c["time"]["duration"] for c in test_cases]
+        summary = {
+            "reportName": self.title,
+            "running": running,
+            "testRuns": [],
+            "statistic": self._statistic(test_cases),
+            "time": {
+                "start": min(starts) if starts else None,
+                "stop": max(stops) if stops else None,
+                "duration": (max(stops) - min(starts)) if starts and stops else 0,
+                "minDuration": min(durations) if durations else 0,
+                "maxDuration": max(durations) if durations else 0,
+                "sumDuration": sum(durations)
+            }
+        }
+        chart = [
+            {"uid": c["uid"], "name": c["name"], "time": c["time"], "status": c["status"],
+             "severity": c["extra"]["severity"]}
+            for c in test_cases
+        ]
+        _dump_json(os.path.join(self.widgets_dir, "summary.json"), summary)
+        _dump_json(os.path.join(self.widgets_dir, "status-chart.json"), chart)
+        _dump_json(os.path.join(self.widgets_dir, "severity.json"), chart)
+        _dump_json(os.path.join(self.widgets_dir, "duration.json"), chart)
+        _dump_json(os.path.join(self.widgets_dir, "environment.json"), [])
+        _dump_json(os.path.join(self.widgets_dir, "executors.json"), [])
+        return summary
+
+    def _write_index(self) -> None:
+        """写入报告入口页（共享资源模式只写入口页，否则复制前端资源到任务目录）"""
+        if self.report_root:
+            static_href = get_static_href(self.html_dir, publish_native_assets(self.report_root))
+        else:
+            static_href = "."
+            for asset in NATIVE_ASSET_FILES:
+                shutil.copyfile(os.path.join(NATIVE_ASSETS_DIR, asset), os.path.join(self.html_dir, asset))
+
+        with open(os.path.join(NATIVE_ASSETS_DIR, "index.html"), "r", encoding="utf-8") as f:
+            index_html = f.read()
+        index_html = index_html.replace("{{title}}", html.escape(self.title)).replace("{{static}}", static_href)
+        with open(os.path.join(self.html_dir, "index.html"), "w", encoding="utf-8") as f:
+            f.write(index_html)
+
+    def _write_aggregates(self, running: bool) -> dict:
+        test_cases = list(self._cases.values())
+        _dump_json(os.path.join(self.data_dir, "suites.json"), self._build_suites_tree(test_cases))
+        self._summary = self._build_widgets(test_cases, running)
+        return self._summary
+
+    # ------------------- 对外接口 -------------------
+    def update(self, running: bool = True) -> int:
+        """
+        增量更新报告：只转换新增/变更的用例，并刷新汇总数据
+        :param running: 测试是否仍在执行（查看页据此提示部分结果并自动刷新）
+        :return: 本次新增/变更的用例数
+        """
+        with self._lock:
+            if not os.path.isdir(self.raw_dir):
+                return 0
+            for dir_path in (self.test_case_dir, self.attachment_dir, self.widgets_dir):
+                os.makedirs(dir_path, exist_ok=True)
+            if not self._index_written:
+                self._write_index()
+                self._index_written = True
+
+            changed = self._scan_new_files()
+            for uuid in changed:
+                case = self._convert_result(self._results[uuid])
+                _dump_json(os.path.join(self.test_case_dir, f"{case['uid']}.json"), case)
+                self._cases[uuid] = case
+            if changed or not running:
+                self._write_aggregates(running)
+            return len(changed)
+
+    def finalize(self) -> dict:
+        """
+        收尾：处理剩余文件（如session级容器），写入最终汇总
+        :return: summary（含用例统计与耗时）
+        """
+        if not os.path.isdir(self.raw_dir):
+            raise FileNotFoundError(f"Allure原始报告目录不存在：{self.raw_dir}")
+        start_time = time.time()
+        self.update(running=False)
+        self.log.info(
+            f"报告生成完成：{len(self._cases)}条用例（耗时：{round(time.time() - start_time, 3)}秒）"
+        )
+        return self._summary
+
+    def build(self, clean: bool = True) -> dict:
+        """
+        完整生成报告
+        :param clean: 生成前清空输出目录（对应 allure generate --clean）
+        :return: summary（含用例统计与耗时）
+        """
+        if not os.path.isdir(self.raw_dir):
+            raise FileNotFoundError(f"Allure原始报告目录不存在：{self.raw_dir}")
+        with self._lock:
+            if clean and os.path.exists(self.html_dir):
+                shutil.rmtree(self.html_dir)
+            self._reset_state()
+        return self.finalize()
+
+
+class IncrementalReportWatcher:
+    """pytest运行期间定时轮询 allure_raw，增量更新报告"""
+
+    def __init__(self, builder: AllureReportBuilder, interval: float = 2.0, log=None):
+        self.builder = builder
+        self.interval = interval
+        self.log = log or TempLog()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_mtime = None
+
+    def _poll(self) -> None:
+        try:
+            mtime = os.stat(self.builder.raw_dir).st_mtime_ns
+        except OSError:
+            return
+        # 目录mtime未变化说明没有新文件，跳过扫描
+        if mtime == self._last_mtime:
+            return
+        self._last_mtime = mtime
+        count = self.builder.update(running=True)
+        if count:
+            self.log.debug(f"报告增量更新：{count}条用例")
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._poll()
+            except Exception as e:
+                self.log.warning(f"报告增量更新失败：{str(e)}")
+
+    def start(self) -> "IncrementalReportWatcher":
+        self._thread = threading.Thread(target=self._run, name="report-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+
+
+def build_allure_report(raw_dir: str, html_dir: str, title: str = "Allure Report",
+                        clean: bool = True, log: Optional[object] = None,
+                        report_root: Optional[str] = None) -> dict:
+    """进程内生成Allure报告（便捷函数）"""
+    return AllureReportBuilder(
+        raw_dir, html_dir, title=title, log=log, report_root=report_root
+    ).build(clean=clean)
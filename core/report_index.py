@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+跨任务报告索引：后台扫描 result/<task_id>/report_meta.json 与 allure_raw，
+汇总为任务级/用例级的紧凑表（SQLite），供趋势看板按用例文件、设备、时间范围聚合查询
+"""
+import ntpath
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from conf import GlobalConfig
+from core.duration_store import normalize_suite_path
+from util.allure_util import load_json_file, load_raw_results, get_test_key, get_duration_ms
+from util.log_util import TempLog
+
+REPORT_META_NAME = "report_meta.json"
+RESULT_STATUSES = ("passed", "failed", "broken", "skipped")
+DAY_MS = 24 * 3600 * 1000
+
+
+def _parse_time_ms(time_str: str, default_ms: int) -> int:
+    try:
+        return int(datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+    except (TypeError, ValueError):
+        return default_ms
+
+
+class ReportIndex:
+    """
+    报告索引库（与用例耗时历史共用同一个SQLite文件）
+    - report_task：每个任务一行（用例文件、设备、时间、各状态数量、执行耗时）
+    - report_test：每个任务的每条用例结果（状态、耗时），用于不稳定用例统计
+    """
+    _schema_lock = threading.Lock()
+    _schema_ready = set()
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.index_config = GlobalConfig.get("report_index", {})
+        self.db_path = db_path or GlobalConfig["path"]["history_db"]
+        self._ensure_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self) -> None:
+        """建表（同一进程内每个库文件只执行一次）"""
+        with ReportIndex._schema_lock:
+            if self.db_path in ReportIndex._schema_ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS report_task (
+                        task_id       TEXT    PRIMARY KEY,
+                        device_id     TEXT    NOT NULL,
+                        suite_path    TEXT    NOT NULL,
+                        suite_name    TEXT    NOT NULL,
+                        generate_ms   INTEGER NOT NULL,
+                        report_status TEXT    NOT NULL,
+                        total         INTEGER NOT NULL,
+                        passed        INTEGER NOT NULL,
+                        failed        INTEGER NOT NULL,
+                        broken        INTEGER NOT NULL,
+                        skipped       INTEGER NOT NULL,
+                        duration_ms   INTEGER NOT NULL,
+                        meta_mtime_ns INTEGER NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS report_test (
+                        task_id     TEXT    NOT NULL,
+                        test_key    TEXT    NOT NULL,
+                        status      TEXT    NOT NULL,
+                        duration_ms INTEGER NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_report_task_suite ON report_task(suite_path, device_id, generate_ms)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_report_task_time ON report_task(generate_ms)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_report_test_task ON report_test(task_id)"
+                )
+            ReportIndex._schema_ready.add(self.db_path)
+
+    # ------------------- 写入 -------------------
+    def get_indexed_mtimes(self) -> dict[str, int]:
+        """已入库任务的 report_meta.json 修改时间（用于增量扫描）"""
+        with self._connect() as conn:
+            return {row["task_id"]: row["meta_mtime_ns"] for row in conn.execute(
+                "SELECT task_id, meta_mtime_ns FROM report_task"
+            )}
+
+    def index_task(self, task_dir: str, meta_mtime_ns: Optional[int] = None) -> bool:
+        """
+        解析单个任务目录并写入索引（已存在则覆盖）
+        :return: 是否写入（report_meta.json 缺失或不完整时返回False）
+        """
+        meta_path = os.path.join(task_dir, REPORT_META_NAME)
+        meta = load_json_file(meta_path)
+        if not meta or not meta.get("task_id"):
+            return False
+        if meta_mtime_ns is None:
+            meta_mtime_ns = os.stat(meta_path).st_mtime_ns
+
+        task_id = meta["task_id"]
+        counts = dict.fromkeys(RESULT_STATUSES, 0)
+        tests = []
+        starts, stops = [], []
+        for result in load_raw_results(os.path.join(task_dir, "allure_raw")):
+            status = result.get("status", "unknown")
+            if status in counts:
+                counts[status] += 1
+            tests.append((task_id, get_test_key(result), status, get_duration_ms(result)))
+            if result.get("start") is not None and result.get("stop") is not None:
+                starts.append(int(result["start"]))
+                stops.append(int(result["stop"]))
+
+        suite_path = meta.get("suite_path", "")
+        report_info = meta.get("report_info") or {}
+        row = (
+            task_id,
+            meta.get("device_id", ""),
+            normalize_suite_path(suite_path) if suite_path else "",
+            ntpath.basename(suite_path),
+            _parse_time_ms(meta.get("generate_time"), meta_mtime_ns // 1_000_000),
+            report_info.get("status", "unknown"),
+            len(tests), counts["passed"], counts["failed"], counts["broken"], counts["skipped"],
+            max(stops) - min(starts) if starts else 0,
+            meta_mtime_ns
+        )
+        with self._connect() as conn:
+            conn.execute("DELETE FROM report_test WHERE task_id = ?", (task_id,))
+            conn.execute("INSERT OR REPLACE INTO report_task VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            conn.executemany("INSERT INTO report_test VALUES (?, ?, ?, ?)", tests)
+        return True
+
+    def scan(self, report_root: Optional[str] = None) -> dict:
+        """
+        增量扫描报告根目录：只解析新增或 report_meta.json 有变化的任务
+        任务目录被保留策略清理后索引仍保留，历史趋势不受影响
+        :return: {"indexed": 新增/更新数, "duration": 耗时秒}
+        """
+        start_time = time.time()
+        report_root = report_root or GlobalConfig["path"]["report_root_dir"]
+        indexed_mtimes = self.get_indexed_mtimes()
+        indexed = 0
+        if os.path.isdir(report_root):
+            with os.scandir(report_root) as entries:
+                for entry in entries:
+                    # 下划线开头的目录为共享资源（如 _static），不是任务目录
+                    if entry.name.startswith((".", "_")) or not entry.is_dir():
+                        continue
+                    try:
+                        mtime_ns = os.stat(os.path.join(entry.path, REPORT_META_NAME)).st_mtime_ns
+                    except OSError:
+                        continue
+                    if indexed_mtimes.get(entry.name) == mtime_ns:
+                        continue
+                    if self.index_task(entry.path, mtime_ns):
+                        indexed += 1
+        return {"indexed": indexed, "duration": round(time.time() - start_time, 3)}
+
+    # ------------------- 查询 -------------------
+    def _build_filter(self, suite: Optional[str], device_id: Optional[str], days: int) -> tuple[str, list]:
+        where = ["t.generate_ms >= ?"]
+        params = [int(time.time() * 1000) - days * DAY_MS]
+        if suite:
+            # 支持完整路径或文件名
+            where.append("(t.suite_path = ? OR t.suite_name = ?)")
+            params.extend([normalize_suite_path(suite), ntpath.basename(suite)])
+        if device_id:
+            where.append("t.device_id = ?")
+            params.append(device_id)
+        return " AND ".join(where), params
+
+    def get_trends(self, suite: Optional[str] = None, device_id: Optional[str] = None,
+                   days: Optional[int] = None) -> dict:
+        """
+        按用例文件+设备+日期聚合的趋势与不稳定用例
+        :param suite: 用例文件路径或文件名（为空表示全部）
+        :param device_id: 设备ID（为空表示全部）
+        :param days: 统计最近N天（默认取配置）
+        :return: {"series": [{suite_name, device_id, points: [...]}], "flaky": [...]}
+        """
+        days = days or self.index_config.get("default_days", 30)
+        flaky_min_runs = self.index_config.get("flaky_min_runs", 3)
+        where, params = self._build_filter(suite, device_id, days)
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT t.suite_path, t.suite_name, t.device_id,
+                       date(t.generate_ms / 1000, 'unixepoch', 'localtime') AS day,
+                       COUNT(*) AS tasks, SUM(t.total) AS total, SUM(t.passed) AS passed,
+                       SUM(t.failed) AS failed, SUM(t.broken) AS broken, SUM(t.skipped) AS skipped,
+                       AVG(t.duration_ms) AS avg_duration_ms, MAX(t.duration_ms) AS max_duration_ms
+                FROM report_task t WHERE {where}
+                GROUP BY t.suite_path, t.device_id, day
+                ORDER BY t.suite_path, t.device_id, day
+                """,
+                params
+            ).fetchall()
+            flaky_rows = conn.execute(
+                f"""
+                SELECT t.suite_name, r.test_key, COUNT(*) AS runs,
+                       SUM(r.status = 'passed') AS pass_count,
+                       SUM(r.status IN ('failed', 'broken')) AS fail_count,
+                       MAX(CASE WHEN r.status IN ('failed', 'broken') THEN t.generate_ms END) AS last_failed_ms
+                FROM report_test r JOIN report_task t ON t.task_id = r.task_id
+                WHERE {where}
+                GROUP BY t.suite_path, r.test_key
+                HAVING runs >= ? AND pass_count > 0 AND fail_count > 0
+                ORDER BY fail_count * 1.0 / runs DESC, runs DESC
+                """,
+                params + [flaky_min_runs]
+            ).fetchall()
+
+        series: dict[tuple, dict] = {}
+        for row in rows:
+            item = series.setdefault((row["suite_path"], row["device_id"]), {
+                "suite_name": row["suite_name"],
+                "suite_path": row["suite_path"],
+                "device_id": row["device_id"],
+                "points": []
+            })
+            executed = row["passed"] + row["failed"] + row["broken"]
+            item["points"].append({
+                "day": row["day"],
+                "tasks": row["tasks"],
+                "total": row["total"],
+                "passed": row["passed"],
+                "failed": row["failed"],
+                "broken": row["broken"],
+                "skipped": row["skipped"],
+                "pass_rate": round(row["passed"] / executed, 4) if executed else None,
+                "avg_duration_ms": int(row["avg_duration_ms"] or 0),
+                "max_duration_ms": row["max_duration_ms"]
+            })
+
+        flaky = [
+            {
+                "suite_name": row["suite_name"],
+                "test_key": row["test_key"],
+                "runs": row["runs"],
+                "passed": row["pass_count"],
+                "failed": row["fail_count"],
+                "fail_rate": round(row["fail_count"] / row["runs"], 4),
+                "last_failed_time": datetime.fromtimestamp(row["last_failed_ms"] / 1000).strftime("%Y-%m-%d %H:%M:%S")
+            }
+            for row in flaky_rows
+        ]
+        return {"days": days, "series": list(series.values()), "flaky": flaky}
+
+
+def scan_report_index(log=None) -> dict:
+    """后台索引任务入口（APScheduler定时调用，失败只记录日志）"""
+    log = log or TempLog()
+    try:
+        result = ReportIndex().scan()
+        if result["indexed"]:
+            log.info(f"报告索引已更新：新增/更新{result['indexed']}个（耗时：{result['duration']}秒）")
+        return result
+    except Exception as e:
+        log.error(f"报告索引更新失败：{str(e)}", exc_info=True)
+        return {"indexed": 0, "duration": 0}
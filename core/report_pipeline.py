@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+from typing import Callable, Optional
+from conf import GlobalConfig
+from core.metrics import REPORT_LATENCY
+from util.log_util import TempLog
+
+# 报告状态（任务字段 report_status）
+REPORT_STATUS_QUEUED = "queued"
+REPORT_STATUS_GENERATING = "generating"
+REPORT_STATUS_COMPRESSING = "compressing"
+REPORT_STATUS_DONE = "done"
+REPORT_STATUS_FAILED = "failed"
+
+
+class ReportJob:
+    """报告流水线任务：持有执行器和Pytest结果，各阶段依次处理"""
+
+    def __init__(self, executor, pytest_result: dict, on_update: Callable[[str, dict], None]):
+        """
+        :param executor: TestExecutor 实例（已完成 run_tests）
+        :param pytest_result: run_tests 返回的Pytest结果
+        :param on_update: 状态回调 on_update(task_id, 需要合并到任务的字段)
+        """
+        self.executor = executor
+        self.task_id = executor.task_id
+        self.pytest_result = pytest_result
+        self.on_update = on_update
+        self.report_result = None
+        self.submit_time = time.time()
+
+    def update(self, **fields) -> None:
+        try:
+            self.on_update(self.task_id, fields)
+        except Exception as e:
+            TempLog().error(f"任务{self.task_id}报告状态回调失败：{str(e)}")
+
+
+class ReportPipeline:
+    """
+    异步报告流水线：报告生成、压缩作为独立阶段在各自的工作线程池中执行，
+    Pytest结束后即可释放设备；队列有界，队列满时 submit 阻塞（背压），超时返回False
+    """
+
+    def __init__(self, generate_workers: int = 2, compress_workers: int = 1, queue_size: int = 16):
+        self.generate_queue = queue.Queue(maxsize=queue_size)
+        self.compress_queue = queue.Queue(maxsize=queue_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0}
+        self._active = {"generate": 0, "compress": 0}
+        self._workers = []
+        for i in range(max(generate_workers, 1)):
+            self._start_worker(f"report-generate-{i}", self.generate_queue, self._generate_stage, "generate")
+        for i in range(max(compress_workers, 1)):
+            self._start_worker(f"report-compress-{i}", self.compress_queue, self._compress_stage, "compress")
+
+    def _start_worker(self, name: str, job_queue: queue.Queue, handler: Callable, stage: str) -> None:
+        thread = threading.Thread(
+            target=self._worker_loop, args=(job_queue, handler, stage), name=name, daemon=True
+        )
+        thread.start()
+        self._workers.append(thread)
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _set_active(self, stage: str, delta: int) -> None:
+        with self._stats_lock:
+            self._active[stage] += delta
+
+    def _worker_loop(self, job_queue: queue.Queue, handler: Callable, stage: str) -> None:
+        while True:
+            job = job_queue.get()
+            self._set_active(stage, 1)
+            try:
+                handler(job)
+            except Exception as e:
+                self._fail(job, e)
+            finally:
+                self._set_active(stage, -1)
+                job_queue.task_done()
+
+    # ------------------- 阶段处理 -------------------
+    def _generate_stage(self, job: ReportJob) -> None:
+        job.update(report_status=REPORT_STATUS_GENERATING)
+        job.report_result = job.executor.generate_allure_report(compress=False)
+        if job.report_result["status"] == "success" and job.executor.allure_config["report_compress"]:
+            job.update(report_status=REPORT_STATUS_COMPRESSING)
+            # 压缩队列满时阻塞生成线程，形成阶段间背压
+            self.compress_queue.put(job)
+        else:
+            self._finish(job)
+
+    def _compress_stage(self, job: ReportJob) -> None:
+        job.executor.compress_report(job.report_result)
+        self._finish(job)
+
+    def _finish(self, job: ReportJob) -> None:
+        task_result = job.executor.build_task_result(job.pytest_result, job.report_result)
+        report_ok = job.report_result["status"] == "success"
+        task_result["report_status"] = REPORT_STATUS_DONE if report_ok else REPORT_STATUS_FAILED
+        task_result["report_pipeline_duration"] = round(time.time() - job.submit_time, 2)
+        REPORT_LATENCY.observe(time.time() - job.submit_time, result="done" if report_ok else "failed")
+        job.update(**task_result)
+        job.executor.close()
+        self._count("done" if report_ok else "failed")
+
+    def _fail(self, job: ReportJob, e: Exception) -> None:
+        error_msg = str(e)[:500]
+        job.executor.log.error(f"报告流水线处理失败：{error_msg}", exc_info=True)
+        job.update(
+            status="failed: report_generate_error",
+            report_status=REPORT_STATUS_FAILED,
+            report_error_msg=error_msg,
+            **job.pytest_result
+        )
+        job.executor.close()
+        REPORT_LATENCY.observe(time.time() - job.submit_time, result="failed")
+        self._count("failed")
+
+    # ------------------- 对外接口 -------------------
+    def submit(self, job: ReportJob, timeout: Optional[float] = None) -> bool:
+        """
+        提交报告任务
+        :param timeout: 队列满时最长等待秒数（None 表示一直等待）
+        :return: 是否提交成功（超时返回False，由调用方决定同步生成）
+        """
+        # 先更新状态再入队，避免工作线程已开始处理后状态被改回 queued
+        job.update(report_status=REPORT_STATUS_QUEUED)
+        try:
+            self.generate_queue.put(job, timeout=timeout)
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("submitted")
+        return True
+
+    def status(self) -> dict:
+        """流水线状态（队列深度、各阶段运行数、累计处理数）"""
+        with self._stats_lock:
+            return {
+                "queue": {
+                    "generate": self.generate_queue.qsize(),
+                    "compress": self.compress_queue.qsize(),
+                    "capacity": self.generate_queue.maxsize
+                },
+                "active": dict(self._active),
+                "workers": len(self._workers),
+                **self._stats
+            }
+
+
+_pipeline: Optional[ReportPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_report_pipeline() -> Optional[ReportPipeline]:
+    """获取全局报告流水线（配置未启用时返回None）"""
+    global _pipeline
+    pipeline_config = GlobalConfig.get("report_pipeline", {})
+    if not pipeline_config.get("enabled", False):
+        return None
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ReportPipeline(
+                generate_workers=pipeline_config.get("generate_workers", 2),
+                compress_workers=pipeline_config.get("compress_workers", 1),
+                queue_size=pipeline_config.get("queue_size", 16)
+            )
+        return _pipeline
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+报告共享静态资源：
+所有任务报告共用一份带版本号的前端资源（<report_root>/_static/<版本>/），
+任务目录下只写入 index.html 与 data/、widgets/ 等任务数据
+"""
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from functools import lru_cache
+from typing import Optional
+from conf import GlobalConfig
+from util.log_util import TempLog
+from util.precompress_util import precompress_dir
+
+SHARED_STATIC_DIRNAME = "_static"
+NATIVE_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_assets")
+NATIVE_ASSET_FILES = ("app.js", "styles.css")
+# Allure CLI 报告中与任务无关的前端资源
+ALLURE_SHARED_ENTRIES = ("app.js", "styles.css", "favicon.ico", "plugin")
+ALLURE_VERSION_PATTERN = re.compile(r"['\"]allureVersion['\"]\s*:\s*['\"]([\w.\-]+)['\"]")
+STATIC_REF_PATTERN = re.compile(rf"{SHARED_STATIC_DIRNAME}/([\w.\-]+)/")
+
+
+def get_static_root(report_root: str) -> str:
+    """共享静态资源根目录"""
+    return os.path.join(report_root, SHARED_STATIC_DIRNAME)
+
+
+def get_static_href(html_dir: str, version_dir: str) -> str:
+    """
+    计算报告入口页引用共享资源的相对路径
+    磁盘上 result/<task>/allure_html -> result/_static/<版本>，
+    URL 上 /api/report/files/<task>/ -> /api/report/_static/<版本>，两者相对关系一致
+    """
+    return os.path.relpath(version_dir, html_dir).replace(os.sep, "/")
+
+
+def get_referenced_static_dirs(html_dir: str, report_root: str) -> list[str]:
+    """解析 index.html 引用的共享资源版本目录（报告未使用共享资源时返回空列表）"""
+    index_path = os.path.join(html_dir, "index.html")
+    if not os.path.isfile(index_path):
+        return []
+    with open(index_path, "r", encoding="utf-8") as f:
+        versions = sorted(set(STATIC_REF_PATTERN.findall(f.read())))
+    static_root = get_static_root(report_root)
+    return [
+        os.path.join(static_root, version) for version in versions
+        if os.path.isdir(os.path.join(static_root, version))
+    ]
+
+
+def precompress_report_assets(dir_path: str) -> int:
+    """按配置为报告目录写入 gzip/brotli 预压缩文件（配置为空时不处理）"""
+    encodings = GlobalConfig["test"].get("report_precompress", [])
+    if not encodings:
+        return 0
+    return precompress_dir(dir_path, encodings, GlobalConfig["test"].get("report_precompress_min_size", 1024))
+
+
+def _publish_dir(build_func, version_dir: str) -> None:
+    """先写入临时目录再重命名，避免并发任务看到写了一半的资源目录"""
+    if os.path.isdir(version_dir):
+        return
+    static_root = os.path.dirname(version_dir)
+    os.makedirs(static_root, exist_ok=True)
+    tmp_dir = os.path.join(static_root, f".tmp-{uuid.uuid4().hex[:8]}")
+    try:
+        build_func(tmp_dir)
+        precompress_report_assets(tmp_dir)
+        os.rename(tmp_dir, version_dir)
+    except OSError:
+        # 其他任务已抢先发布同一版本
+        if not os.path.isdir(version_dir):
+            raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@lru_cache(maxsize=1)
+def get_native_assets_version() -> str:
+    """内置查看页资源版本号（资源内容哈希，资源变更后自动生成新版本目录）"""
+    digest = hashlib.sha1()
+    for name in NATIVE_ASSET_FILES:
+        with open(os.path.join(NATIVE_ASSETS_DIR, name), "rb") as f:
+            digest.update(f.read())
+    return f"native-{digest.hexdigest()[:12]}"
+
+
+def publish_native_assets(report_root: str) -> str:
+    """
+    发布内置查看页资源到共享目录（已存在则跳过）
+    :return: 版本目录绝对路径
+    """
+    version_dir = os.path.join(get_static_root(report_root), get_native_assets_version())
+
+    def _build(tmp_dir: str) -> None:
+        os.makedirs(tmp_dir)
+        for name in NATIVE_ASSET_FILES:
+            shutil.copyfile(os.path.join(NATIVE_ASSETS_DIR, name), os.path.join(tmp_dir, name))
+
+    _publish_dir(_build, version_dir)
+    return version_dir
+
+
+def share_allure_cli_assets(html_dir: str, report_root: str, log=None) -> Optional[str]:
+    """
+    将 allure generate 输出中的前端资源移入共享目录，并改写 index.html 的引用路径
+    :return: 版本目录绝对路径（无法识别Allure版本时返回None，保留原报告不变）
+    """
+    log = log or TempLog()
+    index_path = os.path.join(html_dir, "index.html")
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "r", encoding="utf-8") as f:
+        index_html = f.read()
+
+    match = ALLURE_VERSION_PATTERN.search(index_html)
+    if not match:
+        log.warning("未识别到Allure版本号，报告保留独立静态资源")
+        return None
+    version_dir = os.path.join(get_static_root(report_root), f"allure-{match.group(1)}")
+
+    def _build(tmp_dir: str) -> None:
+        os.makedirs(tmp_dir)
+        for entry in ALLURE_SHARED_ENTRIES:
+            src = os.path.join(html_dir, entry)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(tmp_dir, entry))
+            elif os.path.isfile(src):
+                shutil.copyfile(src, os.path.join(tmp_dir, entry))
+
+    _publish_dir(_build, version_dir)
+
+    # 改写引用路径后删除任务目录下的重复资源
+    href = get_static_href(html_dir, version_dir)
+    for entry in ALLURE_SHARED_ENTRIES:
+        index_html = re.sub(
+            rf'(src|href)="{re.escape(entry)}', rf'\1="{href}/{entry}', index_html
+        )
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write(index_html)
+    for entry in ALLURE_SHARED_ENTRIES:
+        path = os.path.join(html_dir, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+    log.info(f"Allure前端资源已共享：{version_dir}")
+    return version_dir
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+报告/日志保留策略：定期清理 result/<task_id>/ 与 logs/<设备ID>/<日期>/
+- 报告：超过保留天数、同一用例文件超过保留数量、总大小超过预算或磁盘剩余空间不足时，从最旧的开始删除
+- 日志：按日期目录的保留天数删除
+- 删除在后台定时任务中逐个进行并限速，删除记录写入SQLite（与耗时历史同库）
+"""
+import ntpath
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from conf import GlobalConfig
+from core.blob_store import BlobStore
+from core.report_index import scan_report_index
+from util.allure_util import load_json_file
+from util.log_util import TempLog
+from util.path_util import get_path_bytes, scan_path_links
+
+GB = 1024 ** 3
+
+
+class RetentionCandidate:
+    """
+    可清理的目录
+    :param size_bytes: 独占大小（删除目录即释放的字节数）
+    :param shared: 与其他目录共享的硬链接文件 {inode: [大小, 目录内链接数, 总链接数]}（去重附件）
+    """
+    __slots__ = ("path", "kind", "task_id", "suite_path", "time_ms", "size_bytes", "shared", "reason")
+
+    def __init__(self, path: str, kind: str, task_id: str, suite_path: str, time_ms: int, size_bytes: int,
+                 shared: Optional[dict] = None):
+        self.path = path
+        self.kind = kind
+        self.task_id = task_id
+        self.suite_path = suite_path
+        self.time_ms = time_ms
+        self.size_bytes = size_bytes
+        self.shared = shared or {}
+        self.reason = None
+
+
+class RetentionService:
+    """
+    保留策略执行器
+    :param get_active_task_ids: 返回正在执行/生成报告的任务ID集合（这些任务目录不会被删除）
+    :param get_active_device_ids: 返回有任务正在执行的设备ID集合（这些设备的日志目录即使为空也不删除）
+    """
+    _schema_lock = threading.Lock()
+    _schema_ready = set()
+
+    def __init__(self, get_active_task_ids: Optional[Callable[[], set]] = None, log=None,
+                 get_active_device_ids: Optional[Callable[[], set]] = None):
+        self.config = GlobalConfig.get("retention", {})
+        self.report_root = GlobalConfig["path"]["report_root_dir"]
+        self.log_root = GlobalConfig["path"]["log_root_dir"]
+        self.db_path = GlobalConfig["path"]["history_db"]
+        self.get_active_task_ids = get_active_task_ids or set
+        self.get_active_device_ids = get_active_device_ids or set
+        self.log = log or TempLog()
+        self._run_lock = threading.Lock()
+        self.last_run: dict = {}
+        self._ensure_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self) -> None:
+        with RetentionService._schema_lock:
+            if self.db_path in RetentionService._schema_ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS retention_removed (
+                        path        TEXT    NOT NULL,
+                        kind        TEXT    NOT NULL,
+                        task_id     TEXT    NOT NULL,
+                        suite_path  TEXT    NOT NULL,
+                        reason      TEXT    NOT NULL,
+                        size_bytes  INTEGER NOT NULL,
+                        data_ms     INTEGER NOT NULL,
+                        removed_ms  INTEGER NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_retention_removed_time ON retention_removed(removed_ms)"
+                )
+            RetentionService._schema_ready.add(self.db_path)
+
+    # ------------------- 扫描 -------------------
+    def _scan_reports(self) -> list[RetentionCandidate]:
+        """扫描报告根目录下的任务目录（跳过共享目录、正在执行和最近修改的任务）"""
+        active = self.get_active_task_ids()
+        protect_ms = int(time.time() * 1000) - self.config.get("protect_recent_minutes", 60) * 60 * 1000
+        candidates = []
+        if not os.path.isdir(self.report_root):
+            return candidates
+        with os.scandir(self.report_root) as entries:
+            for entry in entries:
+                # 下划线/点开头为共享资源（_static 等），不属于任何任务
+                if entry.name.startswith((".", "_")) or not entry.is_dir(follow_symlinks=False):
+                    continue
+                if entry.name in active:
+                    continue
+                meta = load_json_file(os.path.join(entry.path, "report_meta.json")) or {}
+                mtime_ms = int(entry.stat().st_mtime * 1000)
+                try:
+                    time_ms = int(datetime.strptime(meta["generate_time"], "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+                except (KeyError, TypeError, ValueError):
+                    time_ms = mtime_ms
+                if max(time_ms, mtime_ms) >= protect_ms:
+                    continue
+                size_bytes, shared = scan_path_links(entry.path)
+                candidates.append(RetentionCandidate(
+                    entry.path, "report", entry.name, meta.get("suite_path", ""), time_ms, size_bytes, shared
+                ))
+        return candidates
+
+    def _scan_logs(self) -> list[RetentionCandidate]:
+        """扫描超过保留天数的设备日志日期目录（logs/<设备ID>/<YYYYMMDD>）"""
+        max_age_days = self.config.get("log_max_age_days", 30)
+        candidates = []
+        if not max_age_days or not os.path.isdir(self.log_root):
+            return candidates
+        cutoff = datetime.now() - timedelta(days=max_age_days)
+        with os.scandir(self.log_root) as devices:
+            for device in devices:
+                if not device.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(device.path) as dates:
+                    for date_dir in dates:
+                        try:
+                            day = datetime.strptime(date_dir.name, "%Y%m%d")
+                        except ValueError:
+                            continue
+                        if day >= cutoff or not date_dir.is_dir(follow_symlinks=False):
+                            continue
+                        candidate = RetentionCandidate(
+                            date_dir.path, "log", "", "", int(day.timestamp() * 1000), get_path_bytes(date_dir.path)
+                        )
+                        candidate.reason = f"age>{max_age_days}d"
+                        candidates.append(candidate)
+        return candidates
+
+    # ------------------- 策略 -------------------
+    def plan(self, reports: list[RetentionCandidate]) -> list[RetentionCandidate]:
+        """
+        计算需要删除的报告目录（按数据时间从旧到新）：
+        1. 超过保留天数；2. 同一用例文件超过保留数量；3. 总大小超过预算/磁盘剩余空间不足时继续删除最旧的
+        """
+        now_ms = int(time.time() * 1000)
+        max_age_days = self.config.get("max_age_days", 30)
+        max_per_suite = self.config.get("max_tasks_per_suite", 50)
+        reports = sorted(reports, key=lambda c: c.time_ms)
+
+        if max_age_days:
+            for c in reports:
+                if now_ms - c.time_ms > max_age_days * 24 * 3600 * 1000:
+                    c.reason = f"age>{max_age_days}d"
+
+        if max_per_suite:
+            by_suite: dict[str, list[RetentionCandidate]] = {}
+            for c in reports:
+                if c.reason is None:
+                    by_suite.setdefault(ntpath.basename(c.suite_path), []).append(c)
+            for suite_reports in by_suite.values():
+                for c in suite_reports[:-max_per_suite]:
+                    c.reason = f"suite_count>{max_per_suite}"
+
+        # 大小预算：统计剩余任务总大小（共享的去重附件只计一次），超出部分从最旧的开始删除
+        max_total_bytes = int(self.config.get("max_total_size_gb", 0) * GB)
+        min_free_bytes = int(self.config.get("min_free_gb", 0) * GB)
+        # 共享文件剩余链接数：降到1（只剩去重存储自身）时由 BlobStore.gc 释放
+        remaining_links = {}
+        shared_sizes = {}
+        for c in reports:
+            for inode, (size, _, nlink) in c.shared.items():
+                remaining_links.setdefault(inode, nlink)
+                shared_sizes[inode] = size
+
+        def _release(candidate: RetentionCandidate) -> int:
+            freed = candidate.size_bytes
+            for inode, (size, inside, _) in candidate.shared.items():
+                remaining_links[inode] -= inside
+                if remaining_links[inode] <= 1 < remaining_links[inode] + inside:
+                    freed += size
+            return freed
+
+        kept_bytes = sum(c.size_bytes for c in reports) + sum(shared_sizes.values())
+        released = 0
+        for c in reports:
+            if c.reason:
+                released += _release(c)
+        kept_bytes -= released
+        need_free = 0
+        if min_free_bytes and os.path.isdir(self.report_root):
+            free_after_plan = shutil.disk_usage(self.report_root).free + released
+            need_free = max(min_free_bytes - free_after_plan, 0)
+        for c in reports:
+            if c.reason:
+                continue
+            over_budget = max_total_bytes and kept_bytes > max_total_bytes
+            if not over_budget and need_free <= 0:
+                break
+            c.reason = f"total_size>{self.config.get('max_total_size_gb')}GB" if over_budget else f"free<{self.config.get('min_free_gb')}GB"
+            freed = _release(c)
+            kept_bytes -= freed
+            need_free -= freed
+
+        return [c for c in reports if c.reason]
+
+    # ------------------- 执行 -------------------
+    def _remove(self, candidate: RetentionCandidate) -> bool:
+        try:
+            shutil.rmtree(candidate.path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            self.log.warning(f"清理目录失败：{candidate.path}（{str(e)}）")
+            return False
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO retention_removed VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (candidate.path, candidate.kind, candidate.task_id, candidate.suite_path, candidate.reason,
+                 candidate.size_bytes, candidate.time_ms, int(time.time() * 1000))
+            )
+        return True
+
+    def _remove_empty_device_dirs(self) -> None:
+        """
+        删除空的设备日志目录：跳过有任务在执行的设备；
+        与 LogUtil 创建新任务日志目录存在竞争（目录非空/已被删除），单个目录失败直接跳过，不中断清理
+        """
+        if not os.path.isdir(self.log_root):
+            return
+        active_devices = self.get_active_device_ids()
+        with os.scandir(self.log_root) as devices:
+            for device in devices:
+                if device.name in active_devices or not device.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    if not os.listdir(device.path):
+                        os.rmdir(device.path)
+                except OSError:
+                    continue
+
+    def run(self) -> dict:
+        """
+        执行一次清理（同一时间只允许一个清理在运行）
+        删除之间按 delete_interval 休眠，避免集中删除大量文件抢占磁盘IO
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {"skipped": True}
+        try:
+            start_time = time.time()
+            dry_run = self.config.get("dry_run", False)
+            delete_interval = self.config.get("delete_interval", 0.2)
+            candidates = self.plan(self._scan_reports()) + self._scan_logs()
+            if candidates and not dry_run and GlobalConfig.get("report_index", {}).get("enabled", False):
+                # 删除前确保任务已写入报告索引，趋势数据不随报告目录丢失
+                scan_report_index(self.log)
+
+            removed, freed = 0, 0
+            for c in candidates:
+                if dry_run:
+                    self.log.info(f"[dry_run] 待清理：{c.path}（{c.reason}，{c.size_bytes / 1024 ** 2:.2f}MB）")
+                    continue
+                if self._remove(c):
+                    removed += 1
+                    freed += c.size_bytes
+                    self.log.info(f"已清理：{c.path}（{c.reason}，{c.size_bytes / 1024 ** 2:.2f}MB）")
+                    time.sleep(delete_interval)
+            if not dry_run:
+                self._remove_empty_device_dirs()
+                # 任务目录删除后，无人引用的附件数据文件一并清理
+                blob_stats = BlobStore().gc()
+                freed += blob_stats["freed_bytes"]
+
+            self.last_run = {
+                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "candidates": len(candidates),
+                "removed": removed,
+                "freed_mb": round(freed / 1024 ** 2, 2),
+                "dry_run": dry_run,
+                "duration": round(time.time() - start_time, 2)
+            }
+            if candidates:
+                self.log.info(f"保留策略执行完成：{self.last_run}")
+            return self.last_run
+        finally:
+            self._run_lock.release()
+
+    def get_removed(self, limit: int = 100) -> list[dict]:
+        """最近的删除记录"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM retention_removed ORDER BY removed_ms DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+_service: Optional[RetentionService] = None
+
+
+def init_retention_service(get_active_task_ids: Callable[[], set],
+                           get_active_device_ids: Optional[Callable[[], set]] = None) -> RetentionService:
+    """创建全局保留策略服务（create_app 中调用）"""
+    global _service
+    _service = RetentionService(get_active_task_ids, get_active_device_ids=get_active_device_ids)
+    return _service
+
+
+def get_retention_service() -> Optional[RetentionService]:
+    return _service
+
+
+def run_retention(log=None) -> dict:
+    """定时任务入口（失败只记录日志）"""
+    log = log or TempLog()
+    if _service is None:
+        return {}
+    try:
+        return _service.run()
+    except Exception as e:
+        log.error(f"保留策略执行失败：{str(e)}", exc_info=True)
+        return {}
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+设备截图：
+- 通过 `adb exec-out screencap`（不带 -p）直接取回原始帧缓冲，设备端不做PNG压缩，数据只在内存中传递
+- PNG编码在线程池中执行（encode_async 立即返回 Future），不阻塞用例
+- 缩放与感知差异比较基于 numpy 向量化计算（可选依赖，未安装时只能截图/保存原图）
+- ScreenDiffRecorder：收集用例执行期间的截图比较结果，用例失败时由 conftest 附加到Allure
+"""
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from conf import GlobalConfig
+from util.image_util import encode_png, decode_png, PNG_SIGNATURE
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：未安装时不支持缩放与比较
+    np = None
+
+# screencap 原始格式的像素格式（android PixelFormat），值为 (每像素字节数, 是否需要交换R/B)
+RAW_PIXEL_FORMATS = {1: (4, False), 2: (4, False), 3: (3, False), 5: (4, True)}
+# Allure screen-diff 插件识别的附件类型
+SCREEN_DIFF_TYPE = "application/vnd.allure.image.diff"
+# 亮度权重（ITU-R BT.601）
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+_encode_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_screenshot_config() -> dict:
+    return GlobalConfig.get("screenshot", {})
+
+
+def _get_encode_executor() -> ThreadPoolExecutor:
+    global _encode_executor
+    with _executor_lock:
+        if _encode_executor is None:
+            _encode_executor = ThreadPoolExecutor(
+                max_workers=get_screenshot_config().get("encode_workers", 2),
+                thread_name_prefix="screenshot-encode"
+            )
+        return _encode_executor
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("截图缩放/比较需要安装numpy（pip install -r requirement/image.txt）")
+
+
+class Screenshot:
+    """
+    一帧截图（内存中的原始像素，行优先，RGB或RGBA）
+    :param pixels: 像素数据
+    :param channels: 3（RGB）/ 4（RGBA）
+    """
+
+    def __init__(self, width: int, height: int, pixels: bytes, channels: int = 4,
+                 timestamp: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.channels = channels
+        self.timestamp = timestamp or time.time()
+        self._derived: dict = {}
+
+    @classmethod
+    def from_screencap(cls, data: bytes) -> "Screenshot":
+        """
+        解析 screencap 输出：原始格式为 宽/高/像素格式（Android 9起再加色彩空间）的头 + 像素；
+        也兼容 `screencap -p` 的PNG输出
+        """
+        if data.startswith(PNG_SIGNATURE):
+            return cls.from_array(decode_png(data))
+        if len(data) < 12:
+            raise ValueError(f"截图数据过短：{len(data)}字节")
+        width, height, pixel_format = struct.unpack("<III", data[:12])
+        if pixel_format not in RAW_PIXEL_FORMATS:
+            raise ValueError(f"不支持的截图像素格式：{pixel_format}")
+        bpp, swap_rb = RAW_PIXEL_FORMATS[pixel_format]
+        size = width * height * bpp
+        header_size = len(data) - size
+        if header_size not in (12, 16):
+            raise ValueError(f"截图数据长度与尺寸不符：{len(data)}字节（{width}x{height}）")
+        pixels = bytearray(data[header_size:])
+        if swap_rb:
+            # BGRA -> RGBA（扩展切片交换，C层面逐字节复制，无需numpy）
+            pixels[0::4], pixels[2::4] = pixels[2::4], pixels[0::4]
+        return cls(width, height, bytes(pixels), channels=bpp)
+
+    @classmethod
+    def from_array(cls, array) -> "Screenshot":
+        """从 numpy 数组（高, 宽, 通道）创建（单通道扩展为RGB）"""
+        if array.shape[2] == 1:
+            array = np.repeat(array, 3, axis=2)
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        return cls(array.shape[1], array.shape[0], array.tobytes(), channels=array.shape[2])
+
+    @classmethod
+    def load(cls, path: str) -> "Screenshot":
+        with open(path, "rb") as f:
+            return cls.from_array(decode_png(f.read()))
+
+    def to_array(self):
+        """numpy数组视图（高, 宽, 通道），不复制数据"""
+        _require_numpy()
+        return np.frombuffer(self.pixels, dtype=np.uint8).reshape(self.height, self.width, self.channels)
+
+    def cached(self, key, factory):
+        """截图派生数据缓存（灰度金字塔、积分图、频谱等），同一截图上的多次查询/比较共享"""
+        value = self._derived.get(key)
+        if value is None:
+            value = self._derived[key] = factory()
+        return value
+
+    def gray(self, factor: int = 1):
+        """
+        灰度图（float32，0~1），按缩小倍数（块均值）缓存
+        :param factor: 缩小倍数
+        """
+        if factor <= 1:
+            return self.cached(("gray", 1), lambda: _luminance(self.to_array()))
+        return self.cached(("gray", factor), lambda: block_mean(self.gray(1), factor))
+
+    def downscale(self, factor: int) -> "Screenshot":
+        """按整数倍缩小（factor×factor 块取均值），尺寸不整除的边缘舍弃"""
+        if factor <= 1:
+            return self
+        _require_numpy()
+        array = self.to_array()
+        height, width = self.height // factor, self.width // factor
+        blocks = array[:height * factor, :width * factor].reshape(height, factor, width, factor, self.channels)
+        return Screenshot.from_array(blocks.mean(axis=(1, 3)).astype(np.uint8))
+
+    def encode_png(self, scale: int = 1, level: Optional[int] = None) -> bytes:
+        """
+        编码为PNG（阻塞）
+        :param scale: 缩小倍数（未安装numpy时忽略，输出原图）
+        """
+        shot = self.downscale(scale) if scale > 1 and np is not None else self
+        level = level if level is not None else get_screenshot_config().get("png_level", 3)
+        return encode_png(shot.pixels, shot.width, shot.height, shot.channels, level)
+
+    def encode_async(self, scale: int = 1, level: Optional[int] = None) -> Future:
+        """在编码线程池中编码为PNG，立即返回 Future"""
+        return _get_encode_executor().submit(self.encode_png, scale, level)
+
+    def save(self, path: str, scale: int = 1) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = self.encode_png(scale)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return path
+
+
+# ------------------- 感知差异比较 -------------------
+def _luminance(array):
+    return array[:, :, :3].astype(np.float32) @ np.array(LUMA_WEIGHTS, dtype=np.float32) / 255
+
+
+def _resize_nearest(array, height: int, width: int):
+    rows = np.arange(height) * array.shape[0] // height
+    cols = np.arange(width) * array.shape[1] // width
+    return array[rows][:, cols]
+
+
+def block_mean(gray, block: int):
+    height, width = gray.shape[0] // block, gray.shape[1] // block
+    return gray[:height * block, :width * block].reshape(height, block, width, block).mean(axis=(1, 3))
+
+
+def difference_hash(gray, size: int = 8) -> int:
+    """差异哈希（dHash）：缩小到 (size, size+1) 后比较相邻像素亮度，得到 size*size 位整数"""
+    small = block_mean(gray, max(min(gray.shape[0] // size, gray.shape[1] // (size + 1)), 1))
+    small = _resize_nearest(small, size, size + 1)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def perceptual_diff(actual: Screenshot, expected: Screenshot, block: Optional[int] = None,
+                    threshold: Optional[float] = None, max_changed_ratio: Optional[float] = None) -> tuple[dict, Screenshot]:
+    """
+    感知差异比较：按块比较亮度均值（忽略抗锯齿、压缩噪点等像素级差异），同时计算 dHash 汉明距离
+    尺寸不同（分辨率不同的设备）时先把基准缩放到实际截图尺寸
+    :param block: 块边长（像素）
+    :param threshold: 块亮度差（0~1）超过该值视为变化
+    :param max_changed_ratio: 变化块比例不超过该值视为一致
+    :return: (比较结果, 差异图：实际截图变暗 + 变化块标红)
+    """
+    _require_numpy()
+    config = get_screenshot_config()
+    block = block or config.get("diff_block", 8)
+    threshold = threshold if threshold is not None else config.get("diff_threshold", 0.1)
+    max_changed_ratio = max_changed_ratio if max_changed_ratio is not None else config.get("max_changed_ratio", 0.01)
+
+    actual_array, expected_array = actual.to_array(), expected.to_array()
+    size_mismatch = actual_array.shape[:2] != expected_array.shape[:2]
+    if size_mismatch:
+        expected_array = _resize_nearest(expected_array, actual.height, actual.width)
+    actual_gray = actual.gray()
+    expected_gray = _luminance(expected_array) if size_mismatch else expected.gray()
+
+    block_diff = np.abs(block_mean(actual_gray, block) - block_mean(expected_gray, block))
+    changed = block_diff > threshold
+    changed_ratio = float(changed.mean()) if changed.size else 0.0
+    hash_distance = bin(difference_hash(actual_gray) ^ difference_hash(expected_gray)).count("1")
+    result = {
+        "match": changed_ratio <= max_changed_ratio,
+        "changed_ratio": round(changed_ratio, 5),
+        "mean_diff": round(float(np.abs(actual_gray - expected_gray).mean()), 5),
+        "max_block_diff": round(float(block_diff.max()) if block_diff.size else 0.0, 5),
+        "hash_distance": hash_distance,
+        "size_mismatch": size_mismatch,
+        "block": block,
+        "threshold": threshold
+    }
+
+    # 差异图：变化块按块放大回像素尺寸后叠加红色
+    diff_rgb = (actual_array[:, :, :3] * 0.4).astype(np.uint8)
+    mask = np.zeros(actual_gray.shape, dtype=bool)
+    mask[:changed.shape[0] * block, :changed.shape[1] * block] = np.repeat(np.repeat(changed, block, axis=0), block, axis=1)
+    diff_rgb[mask] = (diff_rgb[mask] // 2) + np.array([127, 0, 0], dtype=np.uint8)
+    return result, Screenshot.from_array(diff_rgb)
+
+
+def get_baseline_path(name: str) -> str:
+    """基准截图路径（path.screenshot_baseline_dir/<名称>.png）"""
+    base_dir = GlobalConfig["path"].get(
+        "screenshot_baseline_dir", os.path.join(GlobalConfig["path"]["test_suite_dir"], "baselines")
+    )
+    return os.path.join(base_dir, name if name.endswith(".png") else f"{name}.png")
+
+
+# ------------------- 用例内记录 -------------------
+class ScreenDiffRecorder:
+    """收集代码块执行期间的截图比较结果（每项含比较结果与 expected/actual/diff 的PNG编码Future）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._captures: list[list] = []
+
+    def record(self, item: dict) -> None:
+        with self._lock:
+            for items in self._captures:
+                items.append(item)
+
+    @property
+    def active(self) -> bool:
+        return bool(self._captures)
+
+    @contextmanager
+    def capture(self) -> Iterator[list]:
+        items = []
+        with self._lock:
+            self._captures.append(items)
+        try:
+            yield items
+        finally:
+            with self._lock:
+                self._captures.remove(items)
+
+
+screen_diff_recorder = ScreenDiffRecorder()
+
+
+def record_screen_diff(name: str, result: dict, expected: Screenshot, actual: Screenshot,
+                       diff: Screenshot) -> None:
+    """记录一次比较（只有用例正在收集时才提交编码任务）"""
+    if not screen_diff_recorder.active:
+        return
+    scale = get_screenshot_config().get("attach_scale", 2)
+    screen_diff_recorder.record({
+        "name": name,
+        "result": result,
+        "expected": expected.encode_async(scale),
+        "actual": actual.encode_async(scale),
+        "diff": diff.encode_async(scale)
+    })
+
+
+def build_screen_diff_attachment(item: dict, timeout: Optional[float] = None) -> bytes:
+    """Allure screen-diff 插件格式的附件内容（JSON，图片为data URI）"""
+    data = {
+        key: "data:image/png;base64," + base64.b64encode(item[key].result(timeout)).decode()
+        for key in ("expected", "actual", "diff")
+    }
+    return json.dumps(data).encode("utf-8")
@@ -6,15 +6,30 @@ import subprocess
 import shutil
 import time
 import json
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Tuple, Dict, Optional
 from util.log_util import LogUtil, TempLog
-from util.path_util import safe_join, ensure_dir_exists, get_file_size
+from util.path_util import safe_join, ensure_dir_exists, SizeTracker
+from core.blob_store import BlobStore
+from core.duration_store import record_task_durations
+from core.report_builder import AllureReportBuilder, IncrementalReportWatcher
+from core.report_static import (
+    share_allure_cli_assets, get_referenced_static_dirs, precompress_report_assets, SHARED_STATIC_DIRNAME
+)
+from util.archive_util import write_archive, get_archive_extension
+from util.precompress_util import is_precompressed_variant
+from core.metrics import EXECUTOR_STAGE_LATENCY
+from core.process_profiler import TaskProfiler
+from util.timing_util import stage_timer, timing_registry, load_timings, TIMING_FILE_NAME
 from conf import GlobalConfig
 
 
 class TestExecutor:
-    def __init__(self, task_id: str, device_id: str, suite_abs_path: str):
+    def __init__(self, task_id: str, device_id: str, suite_abs_path: str, profile: Optional[bool] = None):
+        """
+        :param profile: 是否采集Pytest子进程资源画像（None 表示按配置 profile.enabled）
+        """
         self.task_id = task_id
         self.device_id = device_id
         self.suite_abs_path = suite_abs_path
@@ -30,6 +45,7 @@ class TestExecutor:
         self.task_log_path = safe_join(self.task_report_dir, f"task_{task_id}.log")
         self.report_meta_path = safe_join(self.task_report_dir, "report_meta.json")
         self.allure_log_path = safe_join(self.task_report_dir, "allure_generate.log")
+        self.device_timings_path = safe_join(self.task_report_dir, TIMING_FILE_NAME)
 
         # 报告生成配置
         self.allure_config = {
@@ -37,8 +53,49 @@ class TestExecutor:
             "generate_timeout": GlobalConfig["test"].get("allure_generate_timeout", 300),
             "report_compress": GlobalConfig["test"].get("report_compress", False),
             "compress_format": GlobalConfig["test"].get("report_compress_format", "zip"),
-            "keep_raw_data": GlobalConfig["test"].get("keep_allure_raw", True)
+            "compress_level": GlobalConfig["test"].get("report_compress_level"),
+            "compress_threads": GlobalConfig["test"].get("report_compress_threads"),
+            "keep_raw_data": GlobalConfig["test"].get("keep_allure_raw", True),
+            "report_engine": GlobalConfig["test"].get("report_engine", "allure"),
+            "shared_assets": GlobalConfig["test"].get("shared_report_assets", False),
+            "incremental": GlobalConfig["test"].get("incremental_report", False),
+            "incremental_interval": GlobalConfig["test"].get("incremental_report_interval", 2)
         }
+        # 增量报告仅支持进程内生成方式
+        self.incremental_report = (
+            self.allure_config["incremental"] and self.allure_config["report_engine"] == "native"
+        )
+        self._report_builder: Optional[AllureReportBuilder] = None
+        # 路径大小记账（每个阶段只扫描一次，自己写入的文件直接登记大小）
+        self.sizes = SizeTracker()
+        # 阶段耗时（秒）与Pytest子进程上报的设备操作耗时汇总，写入 report_meta.json
+        self.stage_timings: Dict[str, float] = {}
+        self.device_timings: Dict = {}
+        # Pytest子进程资源画像（产物与 task_<id>.log 同目录）
+        self.profile_enabled = GlobalConfig.get("profile", {}).get("enabled", False) if profile is None else profile
+        self.profile_result: Optional[Dict] = None
+
+    def close(self) -> None:
+        """释放任务日志处理器（任务结束、报告生成完成后调用）"""
+        self.log.close()
+
+    def __enter__(self) -> "TestExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @contextmanager
+    def _timed_stage(self, stage: str):
+        """记录任务阶段耗时（进程内汇总 + 本任务元数据，异常时同样记录）"""
+        timing = {}
+        try:
+            with stage_timer(self.device_id, f"stage.{stage}", self.log) as timing:
+                yield
+        finally:
+            if timing.get("duration") is not None:
+                self.stage_timings[stage] = round(timing["duration"], 3)
+                EXECUTOR_STAGE_LATENCY.observe(timing["duration"], device_id=self.device_id, stage=stage)
 
     def prepare(self) -> None:
         """准备测试环境（清理旧目录、创建新目录）"""
@@ -46,11 +103,12 @@ class TestExecutor:
 
         # 清理旧报告
         if os.path.exists(self.task_report_dir):
-            old_dir_size = get_file_size(self.task_report_dir)
+            old_dir_size = self.sizes.get(self.task_report_dir, "MB")
             self.log.warning(
                 f"清理旧报告目录：{self.task_report_dir}（预估大小：{old_dir_size:.2f}MB）"
             )
             shutil.rmtree(self.task_report_dir)
+            self.sizes.invalidate(self.task_report_dir)
 
         # 创建新目录
         dirs_to_create = [self.allure_raw_dir, self.allure_html_dir]
@@ -68,7 +126,7 @@ class TestExecutor:
         if not os.access(self.suite_abs_path, os.R_OK):
             raise PermissionError(f"无读取权限：{self.suite_abs_path}")
         self.log.info(
-            f"测试用例校验通过：{self.suite_abs_path}（文件大小：{get_file_size(self.suite_abs_path):.2f}KB）"
+            f"测试用例校验通过：{self.suite_abs_path}（文件大小：{self.sizes.get(self.suite_abs_path):.2f}KB）"
         )
 
     def run_pytest(self) -> Tuple[int, str, str]:
@@ -86,23 +144,31 @@ class TestExecutor:
             "--tb=short",
             f"--timeout={GlobalConfig['test']['pytest_timeout']}"
         ]
+        if GlobalConfig.get("history", {}).get("order_by_duration", False):
+            pytest_cmd.append("--order_by_duration")
+
+        profiler = self._create_profiler()
+        if profiler:
+            pytest_cmd = profiler.wrap_command(pytest_cmd)
 
         # 执行命令
         start_time = time.time()
         try:
-            result = subprocess.run(
-                pytest_cmd,
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                timeout=GlobalConfig["test"]["pytest_timeout"] + 60
-            )
+            result = self._run_pytest_process(pytest_cmd, profiler)
             exec_duration = round(time.time() - start_time, 2)
-            self.log.info(f"Pytest执行完成（耗时：{exec_duration}秒，返回码：{result.returncode}）")
+            self.log.info(
+                f"Pytest执行完成（耗时：{exec_duration}秒，返回码：{result.returncode}）",
+                event="pytest_done", duration=exec_duration
+            )
         except subprocess.TimeoutExpired as e:
             exec_duration = round(time.time() - start_time, 2)
-            self.log.error(f"Pytest执行超时（耗时：{exec_duration}秒，超过{GlobalConfig['test']['pytest_timeout']}秒）")
+            self.log.error(
+                f"Pytest执行超时（耗时：{exec_duration}秒，超过{GlobalConfig['test']['pytest_timeout']}秒）",
+                event="pytest_timeout", duration=exec_duration
+            )
             raise
+        finally:
+            self._save_profile(profiler)
 
         # 保存执行日志
         with open(self.task_log_path, "w", encoding="utf-8") as f:
@@ -118,14 +184,75 @@ class TestExecutor:
                 result.stderr.strip() if result.stderr else "无错误输出"
             ]
             f.write("\n".join(log_content))
+            self.sizes.record(self.task_log_path, f.tell())
+        # pytest子进程写入了原始结果，之前的目录大小缓存失效
+        self.sizes.invalidate(self.allure_raw_dir)
 
         # 校验Allure原始数据
         if not os.listdir(self.allure_raw_dir):
             self.log.warning("Allure原始报告目录为空，可能Pytest未生成测试结果")
 
-        self.log.info(f"Pytest日志已保存：{self.task_log_path}（大小：{get_file_size(self.task_log_path):.2f}KB）")
+        self.log.info(f"Pytest日志已保存：{self.task_log_path}（大小：{self.sizes.get(self.task_log_path):.2f}KB）")
         return result.returncode, result.stdout, result.stderr
 
+    def _create_profiler(self) -> Optional[TaskProfiler]:
+        """创建资源画像（未启用或配置错误时返回None，不影响测试执行）"""
+        if not self.profile_enabled:
+            return None
+        try:
+            return TaskProfiler(os.path.splitext(self.task_log_path)[0], log=self.log)
+        except Exception as e:
+            self.log.warning(f"资源画像初始化失败，跳过：{str(e)}")
+            return None
+
+    def _run_pytest_process(self, pytest_cmd: list, profiler: Optional[TaskProfiler]) -> subprocess.CompletedProcess:
+        """执行pytest子进程（启用画像时采样其进程树），超时抛出 TimeoutExpired"""
+        timeout = GlobalConfig["test"]["pytest_timeout"] + 60
+        if profiler is None:
+            return subprocess.run(pytest_cmd, capture_output=True, text=True, encoding="utf-8", timeout=timeout)
+
+        with subprocess.Popen(
+            pytest_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8"
+        ) as process:
+            profiler.start(process.pid)
+            try:
+                stdout, stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise
+            finally:
+                profiler.stop()
+        return subprocess.CompletedProcess(pytest_cmd, profiler.resolve_returncode(process.returncode), stdout, stderr)
+
+    def _save_profile(self, profiler: Optional[TaskProfiler]) -> None:
+        """写入资源画像产物（超时同样保存，便于定位卡死/内存暴涨的用例）"""
+        if profiler is None:
+            return
+        try:
+            self.profile_result = profiler.save()
+            for path in self.profile_result["artifacts"].values():
+                self.sizes.invalidate(path)
+            summary = self.profile_result["summary"]
+            if summary:
+                self.log.info(
+                    f"资源画像已保存：{self.profile_result['artifacts']['summary']}"
+                    f"（CPU：{summary['cpu_seconds']}秒，峰值内存：{summary['peak_rss_mb']}MB，"
+                    f"读/写：{summary['read_mb']}/{summary['write_mb']}MB）"
+                )
+        except Exception as e:
+            self.log.warning(f"资源画像保存失败：{str(e)[:300]}")
+
+    def _get_profile_fields(self) -> dict:
+        """任务结果中的资源画像字段（未启用画像时为空）"""
+        if not self.profile_result:
+            return {}
+        return {
+            "profile_summary": self.profile_result["summary"],
+            "profile_path": self.profile_result["artifacts"]["summary"],
+            "profile_url": f"/api/report/{self.task_id}/profile"
+        }
+
     def _generate_allure_cmd(self) -> list:
         """构建Allure报告生成命令"""
         allure_cmd = [
@@ -137,7 +264,7 @@ class TestExecutor:
             allure_cmd.append("--clean")
             self.log.debug("Allure生成命令包含--clean参数")
         if GlobalConfig.get("allure", {}).get("report_title"):
-            report_title = GlobalConfig["allure"]["report_title"].replace("{{task_id}}", self.task_id)
+            report_title = self._get_report_title()
             allure_cmd.extend(["--title", report_title])
             self.log.debug(f"Allure报告标题：{report_title}")
         return allure_cmd
@@ -156,8 +283,52 @@ class TestExecutor:
         ]
         with open(self.allure_log_path, "w", encoding="utf-8") as f:
             f.write("\n".join(log_content))
+            self.sizes.record(self.allure_log_path, f.tell())
         self.log.info(f"Allure生成日志已保存：{self.allure_log_path}")
 
+    def _load_device_timings(self) -> None:
+        """读取Pytest子进程写入的设备操作耗时，合并到进程内汇总（供耗时API查询）"""
+        self.device_timings = load_timings(self.device_timings_path)
+        if self.device_timings:
+            timing_registry.merge(self.device_timings)
+
+    def _precompress_html_report(self) -> None:
+        """为HTML报告写入预压缩文件（失败不影响报告结果）"""
+        try:
+            start_time = time.time()
+            count = precompress_report_assets(self.allure_html_dir)
+            if count:
+                self.log.info(f"报告预压缩完成：{count}个文件（耗时：{round(time.time() - start_time, 2)}秒）")
+        except Exception as e:
+            self.log.warning(f"报告预压缩失败：{str(e)[:300]}")
+
+    def _dedup_attachments(self) -> None:
+        """Allure原始附件按内容去重（失败不影响任务结果）"""
+        if not GlobalConfig["test"].get("dedup_attachments", False):
+            return
+        try:
+            stats = BlobStore().dedup_dir(self.allure_raw_dir)
+            self.sizes.invalidate(self.allure_raw_dir)
+            self.log.info(
+                f"附件去重完成：{stats['files']}个附件，重复{stats['duplicates']}个"
+                f"（节省：{stats['saved_bytes'] / 1024 ** 2:.2f}MB）"
+            )
+        except Exception as e:
+            self.log.warning(f"附件去重失败：{str(e)[:300]}")
+
+    def _get_compress_sources(self) -> list:
+        """
+        压缩包内容：报告引用共享资源时一并打包，保持与 result/ 下相同的相对路径，解压即可离线打开
+        :return: [(源路径, 压缩包内路径前缀), ...]
+        """
+        static_dirs = get_referenced_static_dirs(self.allure_html_dir, self.report_root)
+        if not static_dirs:
+            return [(self.allure_html_dir, "")]
+        sources = [(self.allure_html_dir, f"{self.task_id}/allure_html")]
+        for static_dir in static_dirs:
+            sources.append((static_dir, f"{SHARED_STATIC_DIRNAME}/{os.path.basename(static_dir)}"))
+        return sources
+
     def _compress_html_report(self) -> Optional[str]:
         """压缩HTML报告"""
         if not self.allure_config["report_compress"]:
@@ -169,25 +340,32 @@ class TestExecutor:
             return None
 
         # 构建压缩包路径
-        compress_name = f"allure_html_{self.task_id}.{self.allure_config['compress_format']}"
+        fmt = self.allure_config["compress_format"]
+        compress_name = f"allure_html_{self.task_id}{get_archive_extension(fmt)}"
         compress_path = safe_join(self.task_report_dir, compress_name)
 
         try:
             start_time = time.time()
-            shutil.make_archive(
-                base_name=compress_path.replace(f".{self.allure_config['compress_format']}", ""),
-                format=self.allure_config["compress_format"],
-                root_dir=self.allure_html_dir
-            )
+            with self._timed_stage("compress"):
+                compress_bytes = write_archive(
+                    self._get_compress_sources(),
+                    compress_path,
+                    fmt=fmt,
+                    level=self.allure_config["compress_level"],
+                    workers=self.allure_config["compress_threads"],
+                    exclude=is_precompressed_variant
+                )
             compress_duration = round(time.time() - start_time, 2)
-            compress_size = get_file_size(compress_path)
+            self.sizes.record(compress_path, compress_bytes)
             self.log.info(
-                f"HTML报告压缩完成：{compress_path}（大小：{compress_size:.2f}MB，耗时：{compress_duration}秒）"
+                f"HTML报告压缩完成：{compress_path}"
+                f"（大小：{compress_bytes / 1024 / 1024:.2f}MB，耗时：{compress_duration}秒）"
             )
 
             # 压缩后删除原始HTML目录（可选）
             if not self.allure_config["keep_raw_data"]:
                 shutil.rmtree(self.allure_html_dir)
+                self.sizes.invalidate(self.allure_html_dir)
                 self.log.debug(f"已删除原始HTML目录：{self.allure_html_dir}")
 
             return compress_path
@@ -205,66 +383,140 @@ class TestExecutor:
             "report_config": self.allure_config,
             "report_info": report_info,
             "file_stats": {
-                "task_log_size_mb": round(get_file_size(self.task_log_path) / 1024, 4) if os.path.exists(self.task_log_path) else 0,
-                "allure_log_size_mb": round(get_file_size(self.allure_log_path) / 1024, 4) if os.path.exists(self.allure_log_path) else 0,
+                "task_log_size_mb": round(self.sizes.get_bytes(self.task_log_path) / 1024 ** 2, 4),
+                "allure_log_size_mb": round(self.sizes.get_bytes(self.allure_log_path) / 1024 ** 2, 4),
+                "report_size_mb": report_info.get("report_size_mb", 0),
+                "compress_size_mb": (
+                    round(self.sizes.get_bytes(report_info["compress_path"]) / 1024 ** 2, 4)
+                    if report_info.get("compress_path") else 0
+                ),
                 "raw_data_count": len(os.listdir(self.allure_raw_dir)) if os.path.exists(self.allure_raw_dir) else 0
-            }
+            },
+            # 阶段耗时（meta 为上一次保存元数据的耗时）与设备操作耗时直方图
+            "timings": {
+                "stages_ms": {stage: round(duration * 1000, 1) for stage, duration in self.stage_timings.items()},
+                "device_actions": self.device_timings.get(self.device_id, {})
+            },
+            "profile": self.profile_result["summary"] if self.profile_result else None
         }
 
         try:
-            with open(self.report_meta_path, "w", encoding="utf-8") as f:
+            with self._timed_stage("meta"), open(self.report_meta_path, "w", encoding="utf-8") as f:
                 json.dump(meta_data, f, ensure_ascii=False, indent=2)
             self.log.info(f"报告元数据已保存：{self.report_meta_path}")
         except Exception as e:
             self.log.error(f"报告元数据保存失败：{str(e)}", exc_info=True)
 
-    def generate_allure_report(self) -> Dict:
-        """生成Allure HTML报告"""
+    def _get_report_title(self) -> str:
+        """报告标题（支持 {{task_id}} 占位符）"""
+        report_title = GlobalConfig.get("allure", {}).get("report_title") or "Allure Report"
+        return report_title.replace("{{task_id}}", self.task_id)
+
+    def _run_allure_cli(self, report_result: Dict, start_time: float) -> None:
+        """调用 allure generate 命令生成报告（失败抛出异常）"""
+        allure_cmd = self._generate_allure_cmd()
+        self.log.debug(f"Allure生成命令：{' '.join(allure_cmd)}")
+        result = subprocess.run(
+            allure_cmd,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            timeout=self.allure_config["generate_timeout"],
+            shell=True
+        )
+        report_result["generate_duration"] = round(time.time() - start_time, 2)
+
+        # 保存Allure执行日志
+        self._save_allure_log(
+            cmd=allure_cmd,
+            stdout=result.stdout,
+            stderr=result.stderr,
+            duration=report_result["generate_duration"]
+        )
+
+        # 校验命令执行结果
+        if result.returncode != 0:
+            error_msg = f"Allure命令执行失败（返回码：{result.returncode}），错误详情：{result.stderr[:500]}"
+            report_result["error_msg"] = error_msg
+            raise RuntimeError(error_msg)
+
+        # 前端资源移入共享目录（失败不影响报告可用性）
+        if self.allure_config["shared_assets"]:
+            try:
+                share_allure_cli_assets(self.allure_html_dir, self.report_root, self.log)
+            except Exception as e:
+                self.log.warning(f"Allure前端资源共享失败，保留独立资源：{str(e)}")
+
+    def _create_report_builder(self) -> AllureReportBuilder:
+        return AllureReportBuilder(
+            self.allure_raw_dir,
+            self.allure_html_dir,
+            title=self._get_report_title(),
+            log=self.log,
+            report_root=self.report_root if self.allure_config["shared_assets"] else None
+        )
+
+    def _start_report_watcher(self) -> Optional[IncrementalReportWatcher]:
+        """启动增量报告监听（pytest执行期间查看页即可看到已完成用例）"""
+        if not self.incremental_report:
+            return None
+        self._report_builder = self._create_report_builder()
+        self.log.info(f"已启用增量报告（轮询间隔：{self.allure_config['incremental_interval']}秒）")
+        return IncrementalReportWatcher(
+            self._report_builder, interval=self.allure_config["incremental_interval"], log=self.log
+        ).start()
+
+    def _run_report_builder(self, report_result: Dict, start_time: float) -> None:
+        """进程内生成报告（无JVM、无shell；增量模式下只做收尾）"""
+        builder_cmd = ["report_builder", self.allure_raw_dir, "-o", self.allure_html_dir]
+        try:
+            if self._report_builder:
+                summary = self._report_builder.finalize()
+            else:
+                summary = self._create_report_builder().build(
+                    clean=self.allure_config["clean_before_generate"]
+                )
+        except Exception as e:
+            report_result["generate_duration"] = round(time.time() - start_time, 2)
+            self._save_allure_log(builder_cmd, "", str(e), report_result["generate_duration"])
+            raise
+        report_result["generate_duration"] = round(time.time() - start_time, 3)
+        self._save_allure_log(
+            cmd=builder_cmd,
+            stdout=json.dumps(summary["statistic"], ensure_ascii=False),
+            stderr="",
+            duration=report_result["generate_duration"]
+        )
+
+    def generate_allure_report(self, compress: bool = True) -> Dict:
+        """
+        生成Allure HTML报告
+        :param compress: 生成后立即压缩（报告流水线中压缩作为独立阶段执行，传False）
+        """
         self.log.info("开始生成Allure HTML报告...")
         report_result = {
             "status": "failed",
             "index_path": None,
             "compress_path": None,
+            "report_size_mb": 0,
             "error_msg": None,
             "generate_duration": 0
         }
 
-        # 构建Allure命令
-        allure_cmd = self._generate_allure_cmd()
-        self.log.debug(f"Allure生成命令：{' '.join(allure_cmd)}")
-
         # 校验Allure原始报告目录
         if not os.path.exists(self.allure_raw_dir):
             raise FileNotFoundError(f"Allure原始报告目录不存在：{self.allure_raw_dir}")
         if not os.access(self.allure_raw_dir, os.R_OK | os.W_OK):
             raise PermissionError(f"无权限读写Allure原始报告目录：{self.allure_raw_dir}")
 
-        # 执行Allure命令
+        # 生成报告（native：进程内生成；allure：调用Java CLI）
         start_time = time.time()
         try:
-            result = subprocess.run(
-                allure_cmd,
-                capture_output=True,
-                text=True,
-                encoding="utf-8",
-                timeout=self.allure_config["generate_timeout"],
-                shell=True
-            )
-            report_result["generate_duration"] = round(time.time() - start_time, 2)
-
-            # 保存Allure执行日志
-            self._save_allure_log(
-                cmd=allure_cmd,
-                stdout=result.stdout,
-                stderr=result.stderr,
-                duration=report_result["generate_duration"]
-            )
-
-            # 校验命令执行结果
-            if result.returncode != 0:
-                error_msg = f"Allure命令执行失败（返回码：{result.returncode}），错误详情：{result.stderr[:500]}"
-                report_result["error_msg"] = error_msg
-                raise RuntimeError(error_msg)
+            with self._timed_stage("generate"):
+                if self.allure_config["report_engine"] == "native":
+                    self._run_report_builder(report_result, start_time)
+                else:
+                    self._run_allure_cli(report_result, start_time)
 
             # 校验报告入口文件
             index_html = safe_join(self.allure_html_dir, "index.html")
@@ -273,17 +525,25 @@ class TestExecutor:
                 report_result["error_msg"] = error_msg
                 raise FileNotFoundError(error_msg)
 
+            # 预压缩文本资源（gzip/br），Web端按Accept-Encoding直接返回
+            self._precompress_html_report()
+
+            # 报告目录大小（生成完成后扫描一次，压缩可能删除原始目录，需在压缩前统计）
+            self.sizes.invalidate(self.allure_html_dir)
+            report_result["report_size_mb"] = self.sizes.get(self.allure_html_dir, "MB")
+
             # 压缩HTML报告
-            compress_path = self._compress_html_report()
-            if compress_path:
-                report_result["compress_path"] = compress_path
+            if compress:
+                compress_path = self._compress_html_report()
+                if compress_path:
+                    report_result["compress_path"] = compress_path
 
             # 更新报告结果状态
             report_result["status"] = "success"
             report_result["index_path"] = index_html
-            report_size = get_file_size(self.allure_html_dir)
             self.log.info(
-                f"Allure报告生成成功：{index_html}（目录大小：{report_size:.2f}MB，耗时：{report_result['generate_duration']}秒）"
+                f"Allure报告生成成功：{index_html}（目录大小：{report_result['report_size_mb']:.2f}MB，耗时：{report_result['generate_duration']}秒）",
+                event="report_generated", duration=report_result["generate_duration"]
             )
 
         except subprocess.TimeoutExpired:
@@ -293,50 +553,88 @@ class TestExecutor:
         except Exception as e:
             error_msg = str(e)[:500]
             report_result["error_msg"] = error_msg
-            self.log.error(f"Allure报告生成失败：{error_msg}", exc_info=True)
+            self.log.error(f"Allure报告生成失败：{error_msg}", exc_info=True, event="report_failed")
         finally:
             # 保存报告元数据
             self._save_report_meta(report_result)
 
         return report_result
 
-    def execute(self) -> dict:
-        """完整执行测试流程"""
-        try:
+    def compress_report(self, report_result: Dict) -> Dict:
+        """压缩已生成的报告并更新元数据（报告生成失败时跳过）"""
+        if report_result["status"] != "success":
+            return report_result
+        compress_path = self._compress_html_report()
+        if compress_path:
+            report_result["compress_path"] = compress_path
+            self._save_report_meta(report_result)
+        return report_result
+
+    def run_tests(self) -> dict:
+        """执行测试阶段（准备环境 + Pytest + 耗时历史），不生成报告，失败抛出异常"""
+        with self._timed_stage("prepare"):
             self.prepare()
 
-            # 执行Pytest
-            pytest_returncode, pytest_stdout, pytest_stderr = self.run_pytest()
+        # 执行Pytest（增量模式下同时监听原始结果，实时更新报告）
+        report_watcher = self._start_report_watcher()
+        try:
+            with self._timed_stage("pytest"):
+                pytest_returncode, pytest_stdout, pytest_stderr = self.run_pytest()
+        finally:
+            if report_watcher:
+                report_watcher.stop()
+            self._load_device_timings()
 
-            # 生成报告
-            report_result = self.generate_allure_report()
+        # 附件去重（重复的截图/日志替换为共享数据文件的硬链接）
+        self._dedup_attachments()
 
-            # 构建返回结果
-            return {
-                "status": "success" if (pytest_returncode == 0 and report_result["status"] == "success")
-                          else "success_with_failure" if report_result["status"] == "success"
-                          else "failed: report_generate_error",
-                "end_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "report_path": self.allure_html_dir,
-                "report_index_path": report_result["index_path"],
-                "report_compress_path": report_result["compress_path"],
-                "report_meta_path": self.report_meta_path,
-                "log_path": self.task_log_path,
-                "allure_log_path": self.allure_log_path,
-                "pytest_returncode": pytest_returncode,
-                "pytest_stdout": pytest_stdout,
-                "pytest_stderr": pytest_stderr,
-                "report_generate_duration": report_result["generate_duration"],
-                "report_error_msg": report_result["error_msg"]
-            }
-        except subprocess.TimeoutExpired:
+        # 记录用例耗时历史（供执行排序、ETA预估、设备趋势使用）
+        record_task_durations(self.task_id, self.device_id, self.suite_abs_path, self.allure_raw_dir, self.log)
+
+        return {
+            "pytest_returncode": pytest_returncode,
+            "pytest_stdout": pytest_stdout,
+            "pytest_stderr": pytest_stderr
+        }
+
+    def build_task_result(self, pytest_result: dict, report_result: Dict) -> dict:
+        """根据Pytest结果和报告结果构建任务结果"""
+        pytest_returncode = pytest_result["pytest_returncode"]
+        return {
+            "status": "success" if (pytest_returncode == 0 and report_result["status"] == "success")
+                      else "success_with_failure" if report_result["status"] == "success"
+                      else "failed: report_generate_error",
+            "end_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "report_path": self.allure_html_dir,
+            "report_index_path": report_result["index_path"],
+            "report_compress_path": report_result["compress_path"],
+            "report_meta_path": self.report_meta_path,
+            "log_path": self.task_log_path,
+            "allure_log_path": self.allure_log_path,
+            **pytest_result,
+            "report_generate_duration": report_result["generate_duration"],
+            "report_error_msg": report_result["error_msg"],
+            **self._get_profile_fields()
+        }
+
+    def handle_exception(self, e: Exception) -> dict:
+        """执行异常转换为失败结果"""
+        if isinstance(e, subprocess.TimeoutExpired):
             error_msg = f"测试执行超时（超过{GlobalConfig['test']['pytest_timeout']}秒）"
             self.log.error(error_msg)
             return self._fail_result(error_msg)
+        error_msg = str(e)[:500]
+        self.log.error(f"测试执行失败：{error_msg}", exc_info=True)
+        return self._fail_result(error_msg)
+
+    def execute(self) -> dict:
+        """完整执行测试流程（同步执行测试并生成报告）"""
+        try:
+            pytest_result = self.run_tests()
+            report_result = self.generate_allure_report()
+            return self.build_task_result(pytest_result, report_result)
         except Exception as e:
-            error_msg = str(e)[:500]
-            self.log.error(f"测试执行失败：{error_msg}", exc_info=True)
-            return self._fail_result(error_msg)
+            return self.handle_exception(e)
 
     def _fail_result(self, error_msg: str) -> dict:
         """生成失败结果字典"""
@@ -352,5 +650,6 @@ class TestExecutor:
             "error_msg": error_msg,** log_files,
             "report_path": self.allure_html_dir if os.path.exists(self.allure_html_dir) else None,
             "pytest_returncode": -1,
-            "report_generate_duration": 0
+            "report_generate_duration": 0,
+            **self._get_profile_fields()
         }
\ No newline at end of file
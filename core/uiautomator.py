@@ -1,19 +1,60 @@
 # -*- coding: utf-8 -*-
+import re
 import subprocess
 import time
 import os
+from typing import Optional, Union
 from conf import GlobalConfig
+from core.device_perf import FOREGROUND_PACKAGE_CMD
+from core.image_locator import locate_template
+from core.screenshot import Screenshot, perceptual_diff, get_baseline_path, record_screen_diff
 from util.log_util import TempLog
+from util.timing_util import timed, stage_timer, timing_registry
+
+# am start -W 输出字段（Status / LaunchState / Activity / TotalTime / WaitTime）
+AM_START_FIELD_PATTERN = re.compile(r"^(Status|LaunchState|Activity|TotalTime|WaitTime):\s*(.+)$", re.MULTILINE)
+# 当前位于前台（resumed）的Activity
+RESUMED_ACTIVITY_CMD = "dumpsys activity activities | grep -m1 -E 'mResumedActivity|topResumedActivity'"
+RESUMED_ACTIVITY_PATTERN = re.compile(r"\s([\w.]+/[\w.$]+)")
+
+
+def parse_am_start_output(output: str) -> dict:
+    """解析 `am start -W` 输出，数值字段转为int"""
+    fields = {key: value.strip() for key, value in AM_START_FIELD_PATTERN.findall(output)}
+    for key in ("TotalTime", "WaitTime"):
+        if key in fields and fields[key].isdigit():
+            fields[key] = int(fields[key])
+    return fields
+
+
+def normalize_component(component: str) -> str:
+    """Activity组件统一为完整类名形式（com.pkg/.Main -> com.pkg/com.pkg.Main）"""
+    package, _, activity = component.partition("/")
+    return f"{package}/{package}{activity}" if activity.startswith(".") else component
 
 
 class Uiautomator:
-    def __init__(self, device_id: str, log_util=None):
+    def __init__(self, device_id: str, log_util=None, install_agent: bool = True):
+        """
+        :param device_id: 设备ID
+        :param log_util: 日志工具（为空时输出到控制台）
+        :param install_agent: 是否执行 uiautomator2 init（安装/启动设备端服务）并等待 atx-agent 启动；
+                              模拟设备与基准测试传 False，只做在线检查与版本查询
+        """
         self.device_id = device_id
         self.log = log_util or TempLog()
         self.atx_version = GlobalConfig["device"]["atx_version"]  # 保留版本配置，用于后续校验
         self.initialized = False  # 初始化状态标记
+        self.foreground_package: Optional[str] = None  # 框架已知的前台应用（None表示未知）
+        self._app_states: dict[str, dict] = {}  # 包名 -> {"running", "known"（状态已知，可热启动复用）}
+        self._launch_components: dict[str, str] = {}  # 包名 -> 启动Activity（包名/Activity）
+        self.screen_awake = False  # 框架已知屏幕为亮屏（亮屏成功后置为True，状态未知时为False）
+        self.at_home = False  # 框架已知位于桌面（按Home后置为True，之后任何界面操作置为False）
+        self.last_input_time = 0.0  # 最近一次输入事件时间（输入会重置系统息屏计时）
+        self.install_agent = install_agent
         self._init_device()  # 初始化设备（失败则抛出异常）
 
+    @timed("ui.init")
     def _init_device(self) -> None:
         """
         初始化设备：基于 `python -m uiautomator2 init` 命令
@@ -26,8 +67,9 @@ class Uiautomator:
             if not self._is_device_online():
                 raise ConnectionError(f"设备{self.device_id}未在线（请检查ADB连接）")
 
-            # 2. 执行 uiautomator2 init 命令（核心初始化逻辑）
-            self._run_uiautomator2_init()
+            # 2. 执行 uiautomator2 init 命令（核心初始化逻辑，调用方可指定不安装设备端服务）
+            if self.install_agent:
+                self._run_uiautomator2_init()
 
             # 3. 校验 atx-agent 版本（确保初始化结果符合预期）
             self._verify_atx_agent_version()
@@ -38,6 +80,7 @@ class Uiautomator:
             self.log.error(f"设备{self.device_id}初始化失败：{str(e)}", exc_info=True)
             raise  # 向上抛出异常，避免返回未初始化的实例
 
+    @timed("ui.get_state")
     def _is_device_online(self) -> bool:
         """检查设备是否在线（复用原有逻辑）"""
         result = subprocess.run(
@@ -48,6 +91,7 @@ class Uiautomator:
         self.log.debug(f"设备{self.device_id}在线状态：{online}")
         return online
 
+    @timed("ui.u2_init")
     def _run_uiautomator2_init(self) -> None:
         """执行 `python -m uiautomator2 init` 命令，捕获输出日志"""
         init_cmd = [
@@ -79,10 +123,12 @@ class Uiautomator:
             )
         self.log.info("uiautomator2 init 命令执行完成")
 
+    @timed("ui.atx_version")
     def _verify_atx_agent_version(self) -> None:
         """校验 atx-agent 版本（复用原有逻辑，确保版本符合配置）"""
-        # 等待2秒确保 atx-agent 完全启动
-        time.sleep(2)
+        # 等待2秒确保 atx-agent 完全启动（未执行 uiautomator2 init 时无需等待）
+        if self.install_agent:
+            time.sleep(2)
         version_cmd = [
             GlobalConfig["device"]["adb_path"], "-s", self.device_id,
             "shell", "/data/local/tmp/atx-agent", "version"
@@ -107,6 +153,7 @@ class Uiautomator:
         # self.log.info(f"atx-agent 版本校验通过：{actual_version}")
 
     # ------------------- 原有设备控制接口（完全保留，确保功能兼容） -------------------
+    @timed("ui.screen_on")
     def screen_on(self) -> bool:
         if not self.initialized:
             raise RuntimeError(f"设备{self.device_id}未初始化，无法执行亮屏操作")
@@ -115,13 +162,16 @@ class Uiautomator:
                 GlobalConfig["device"]["adb_path"], "-s", self.device_id,
                 "shell", "input", "keyevent", "224"  # 224=KEYCODE_POWER
             ]
-            subprocess.run(cmd, capture_output=True)
+            result = subprocess.run(cmd, capture_output=True)
+            self.screen_awake = result.returncode == 0
+            self.last_input_time = time.time()
             self.log.info(f"设备{self.device_id}执行亮屏操作")
             return True
         except Exception as e:
             self.log.error(f"设备{self.device_id}亮屏失败：{str(e)}", exc_info=True)
             return False
 
+    @timed("ui.press")
     def press(self, key: str) -> bool:
         key_map = {"home": 3, "back": 4, "power": 224}
         if key not in key_map:
@@ -132,26 +182,33 @@ class Uiautomator:
                 GlobalConfig["device"]["adb_path"], "-s", self.device_id,
                 "shell", "input", "keyevent", str(key_map[key])
             ]
-            subprocess.run(cmd, capture_output=True)
+            result = subprocess.run(cmd, capture_output=True)
+            self.last_input_time = time.time()
+            self.at_home = key == "home" and result.returncode == 0
+            if key == "power":
+                self.screen_awake = result.returncode == 0
             self.log.info(f"设备{self.device_id}执行按键操作：{key}")
             return True
         except Exception as e:
             self.log.error(f"设备{self.device_id}按键{key}失败：{str(e)}", exc_info=True)
             return False
 
+    @timed("ui.check_text_exists")
     def check_text_exists(self, text: str) -> bool:
         try:
             cmd = [
                 GlobalConfig["device"]["adb_path"], "-s", self.device_id,
                 "shell", "uiautomator", "dump", "/sdcard/window_dump.xml"
             ]
-            subprocess.run(cmd, capture_output=True)
+            with stage_timer(self.device_id, "ui.dump_hierarchy"):
+                subprocess.run(cmd, capture_output=True)
 
             pull_cmd = [
                 GlobalConfig["device"]["adb_path"], "-s", self.device_id,
                 "pull", "/sdcard/window_dump.xml", "/tmp/"
             ]
-            subprocess.run(pull_cmd, capture_output=True)
+            with stage_timer(self.device_id, "ui.pull_hierarchy"):
+                subprocess.run(pull_cmd, capture_output=True)
 
             with open("/tmp/window_dump.xml", "r", encoding="utf-8") as f:
                 content = f.read()
@@ -162,6 +219,7 @@ class Uiautomator:
             self.log.error(f"设备{self.device_id}检查文本'{text}'失败：{str(e)}", exc_info=True)
             return False
 
+    @timed("ui.click")
     def click(self, x: int, y: int) -> bool:
         if not (isinstance(x, int) and isinstance(y, int)):
             self.log.error(f"点击坐标参数错误：x={x}（需int）, y={y}（需int）")
@@ -172,8 +230,268 @@ class Uiautomator:
                 "shell", "input", "tap", str(x), str(y)
             ]
             subprocess.run(cmd, capture_output=True)
+            self.last_input_time = time.time()
+            self.at_home = False
             self.log.info(f"设备{self.device_id}点击坐标：({x}, {y})")
             return True
         except Exception as e:
             self.log.error(f"设备{self.device_id}点击坐标({x},{y})失败：{str(e)}", exc_info=True)
-            return False
\ No newline at end of file
+            return False
+
+    @timed("ui.screenshot")
+    def screenshot(self) -> Optional[Screenshot]:
+        """
+        截图（exec-out 取回原始帧缓冲，不经过设备端PNG压缩与设备存储）
+        :return: Screenshot（内存像素，需要文件时调用 save / encode_async），失败返回None
+        """
+        try:
+            cmd = [GlobalConfig["device"]["adb_path"], "-s", self.device_id, "exec-out", "screencap"]
+            result = subprocess.run(
+                cmd, capture_output=True, timeout=GlobalConfig.get("screenshot", {}).get("capture_timeout", 30)
+            )
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.decode("utf-8", "replace").strip() or f"返回码{result.returncode}")
+            shot = Screenshot.from_screencap(result.stdout)
+            self.log.debug(f"设备{self.device_id}截图：{shot.width}x{shot.height}（{len(result.stdout)}字节）")
+            return shot
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}截图失败：{str(e)}", exc_info=True)
+            return None
+
+    @timed("ui.compare_screen")
+    def compare_screen(self, name: str, screenshot: Optional[Screenshot] = None, **options) -> dict:
+        """
+        当前屏幕与基准截图做感知比较（基准不存在或配置 update_baseline 时，保存当前截图为基准）
+        比较结果在用例失败时随 expected/actual/diff 图片附加到Allure
+        :param name: 基准名称（path.screenshot_baseline_dir/<名称>.png）
+        :param screenshot: 复用已有截图（为空时重新截图）
+        :param options: 透传 perceptual_diff（block / threshold / max_changed_ratio）
+        :return: {"match", "changed_ratio", "mean_diff", "hash_distance", ...}，失败时含 "error"
+        """
+        try:
+            actual = screenshot or self.screenshot()
+            if actual is None:
+                raise RuntimeError("截图失败")
+            baseline_path = get_baseline_path(name)
+            if not os.path.exists(baseline_path) or GlobalConfig.get("screenshot", {}).get("update_baseline", False):
+                actual.save(baseline_path)
+                self.log.info(f"设备{self.device_id}保存基准截图：{baseline_path}")
+                return {"name": name, "match": True, "baseline_created": True}
+
+            expected = Screenshot.load(baseline_path)
+            result, diff = perceptual_diff(actual, expected, **options)
+            result["name"] = name
+            record_screen_diff(name, result, expected, actual, diff)
+            self.log.info(
+                f"设备{self.device_id}截图比较'{name}'：{'一致' if result['match'] else '不一致'}"
+                f"（变化块{result['changed_ratio']:.2%}，哈希距离{result['hash_distance']}）"
+            )
+            return result
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}截图比较'{name}'失败：{str(e)}", exc_info=True)
+            return {"name": name, "match": False, "error": str(e)}
+
+    @timed("ui.find_image")
+    def find_image(self, template: Union[str, Screenshot], screenshot: Optional[Screenshot] = None,
+                   threshold: Optional[float] = None, scales: Optional[list] = None) -> Optional[dict]:
+        """
+        在屏幕中查找模板图片（多次查找可传入同一截图，共享截图及其预处理结果）
+        :param template: 模板名称（path.image_template_dir 下，可省略 .png）/ 路径 / Screenshot
+        :param screenshot: 复用已有截图（为空时重新截图）
+        :param threshold: 最低匹配分数（默认取配置 image_locator.threshold）
+        :param scales: 模板缩放比例（默认取配置 image_locator.scales）
+        :return: {"x", "y"（中心坐标）, "score", "scale", "bounds"}，未找到或失败返回None
+        """
+        try:
+            screen = screenshot or self.screenshot()
+            if screen is None:
+                raise RuntimeError("截图失败")
+            match = locate_template(screen, template, threshold=threshold, scales=scales)
+            name = template if isinstance(template, str) else "截图模板"
+            if match:
+                self.log.info(f"设备{self.device_id}找到图片'{name}'：({match['x']}, {match['y']})（匹配度{match['score']}）")
+            else:
+                self.log.info(f"设备{self.device_id}未找到图片'{name}'")
+            return match
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}查找图片失败：{str(e)}", exc_info=True)
+            return None
+
+    def find_images(self, templates: list, threshold: Optional[float] = None) -> dict:
+        """
+        截图一次，查找多个模板
+        :return: {模板名称: 匹配结果或None}
+        """
+        screen = self.screenshot()
+        if screen is None:
+            return {name: None for name in templates}
+        return {name: self.find_image(name, screenshot=screen, threshold=threshold) for name in templates}
+
+    @timed("ui.click_image")
+    def click_image(self, template: Union[str, Screenshot], screenshot: Optional[Screenshot] = None,
+                    threshold: Optional[float] = None) -> bool:
+        """查找模板图片并点击其中心（未找到返回False）"""
+        match = self.find_image(template, screenshot=screenshot, threshold=threshold)
+        if match is None:
+            return False
+        return self.click(match["x"], match["y"])
+
+    # ------------------- 应用生命周期 -------------------
+    def _adb_shell(self, *args: str, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [GlobalConfig["device"]["adb_path"], "-s", self.device_id, "shell", *args],
+            capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=timeout
+        )
+
+    def _resolve_launch_component(self, package: str) -> Optional[str]:
+        """解析应用的Launcher Activity（包名/Activity），按包名缓存"""
+        if package in self._launch_components:
+            return self._launch_components[package]
+        result = self._adb_shell(
+            "cmd", "package", "resolve-activity", "--brief", "-c", "android.intent.category.LAUNCHER", package,
+            timeout=30
+        )
+        lines = [line.strip() for line in result.stdout.splitlines() if line.strip().startswith(f"{package}/")]
+        if result.returncode != 0 or not lines:
+            return None
+        self._launch_components[package] = lines[-1]
+        return lines[-1]
+
+    def _resumed_activity(self) -> Optional[str]:
+        """设备当前前台Activity（包名/类名），查询失败返回None"""
+        result = self._adb_shell(RESUMED_ACTIVITY_CMD, timeout=30)
+        match = RESUMED_ACTIVITY_PATTERN.search(result.stdout)
+        return normalize_component(match.group(1)) if result.returncode == 0 and match else None
+
+    @timed("ui.app_start")
+    def app_start(self, package: str, activity: Optional[str] = None, stop: bool = False,
+                  warm: Optional[bool] = None) -> Optional[dict]:
+        """
+        启动应用（`am start -W`，返回系统统计的启动耗时）
+        :param package: 应用包名
+        :param activity: 启动Activity（为空时解析应用的Launcher Activity）
+        :param stop: 启动前结束应用（冷启动，`am start -S`）
+        :param warm: 热启动复用（默认取配置 app.warm_start）：stop=True 时，若应用由框架启动、之后没有用例失败，
+                     且设备前台仍是该启动Activity（应用停留在首页），不结束进程，直接切回前台；否则照常冷启动
+        :return: {"package", "component", "launch_state"(COLD/WARM/HOT), "total_time_ms", "wait_time_ms", "reused"}，
+                 失败返回None
+        """
+        app_config = GlobalConfig.get("app", {})
+        warm = app_config.get("warm_start", False) if warm is None else warm
+        reused = False
+        try:
+            if activity:
+                component = activity if "/" in activity else f"{package}/{activity}"
+            else:
+                component = self._resolve_launch_component(package)
+            if stop and warm and component and self._app_states.get(package, {}).get("known", False):
+                # “没有用例失败”不代表界面状态已知：上个用例可能停在任意页面，只有前台正是启动Activity时才复用
+                reused = self._resumed_activity() == normalize_component(component)
+            cold_stop = stop and not reused
+
+            timeout = app_config.get("launch_timeout", 60)
+            if component is None:
+                # 无法解析启动Activity（旧系统无 resolve-activity）：退化为 monkey 启动，不统计启动耗时
+                if cold_stop:
+                    self._adb_shell("am", "force-stop", package, timeout=timeout)
+                result = self._adb_shell(
+                    "monkey", "-p", package, "-c", "android.intent.category.LAUNCHER", "1", timeout=timeout
+                )
+                fields = {}
+                if result.returncode != 0 or "No activities found" in result.stdout:
+                    raise RuntimeError(result.stdout.strip() or result.stderr.strip())
+            else:
+                args = ["am", "start", "-W"] + (["-S"] if cold_stop else []) + ["-n", component]
+                result = self._adb_shell(*args, timeout=timeout)
+                fields = parse_am_start_output(result.stdout)
+                if result.returncode != 0 or "Error" in result.stdout or fields.get("Status", "ok") != "ok":
+                    raise RuntimeError(result.stdout.strip() or result.stderr.strip())
+
+            self._app_states[package] = {"running": True, "known": True}
+            self.foreground_package = package
+            self.at_home = False
+            launch = {
+                "package": package,
+                "component": component,
+                "launch_state": fields.get("LaunchState"),
+                "total_time_ms": fields.get("TotalTime"),
+                "wait_time_ms": fields.get("WaitTime"),
+                "reused": reused
+            }
+            if isinstance(launch["total_time_ms"], int):
+                state = (launch["launch_state"] or "unknown").lower()
+                timing_registry.observe(self.device_id, f"app.launch.{state}", launch["total_time_ms"] / 1000)
+            self.log.info(
+                f"设备{self.device_id}启动应用{package}（{'复用进程' if reused else '冷启动' if cold_stop else '启动'}，"
+                f"{launch['launch_state'] or '-'}，{launch['total_time_ms'] if launch['total_time_ms'] is not None else '-'}ms）"
+            )
+            return launch
+        except Exception as e:
+            self._app_states.pop(package, None)
+            self.log.error(f"设备{self.device_id}启动应用{package}失败：{str(e)}", exc_info=True)
+            return None
+
+    @timed("ui.app_stop")
+    def app_stop(self, package: str) -> bool:
+        """结束应用（`am force-stop`）"""
+        try:
+            result = self._adb_shell("am", "force-stop", package, timeout=30)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip())
+            self._app_states[package] = {"running": False, "known": False}
+            if self.foreground_package == package:
+                self.foreground_package = None
+            self.at_home = False
+            self.log.info(f"设备{self.device_id}结束应用{package}")
+            return True
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}结束应用{package}失败：{str(e)}", exc_info=True)
+            return False
+
+    @timed("ui.app_clear")
+    def app_clear(self, package: str) -> bool:
+        """清除应用数据（`pm clear`，同时结束应用）"""
+        try:
+            result = self._adb_shell("pm", "clear", package, timeout=60)
+            if result.returncode != 0 or "Success" not in result.stdout:
+                raise RuntimeError(result.stdout.strip() or result.stderr.strip())
+            self._app_states[package] = {"running": False, "known": False}
+            if self.foreground_package == package:
+                self.foreground_package = None
+            self.at_home = False
+            self.log.info(f"设备{self.device_id}清除应用数据：{package}")
+            return True
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}清除应用{package}数据失败：{str(e)}", exc_info=True)
+            return False
+
+    @timed("ui.app_current")
+    def app_current(self) -> Optional[str]:
+        """查询前台应用包名（同时更新 foreground_package），失败返回None"""
+        try:
+            result = self._adb_shell(FOREGROUND_PACKAGE_CMD, timeout=30)
+            package = result.stdout.strip() or None
+            self.foreground_package = package
+            return package
+        except Exception as e:
+            self.log.error(f"设备{self.device_id}查询前台应用失败：{str(e)}", exc_info=True)
+            return None
+
+    def is_screen_known_awake(self, ttl: float) -> bool:
+        """
+        屏幕是否确定为亮屏：亮屏成功后，距最近一次输入不超过 ttl 秒（小于系统息屏时间，输入会重置息屏计时）
+        :param ttl: 状态有效期（秒）
+        """
+        return self.screen_awake and time.time() - self.last_input_time <= ttl
+
+    def invalidate_app_state(self, package: Optional[str] = None) -> None:
+        """
+        标记应用与界面状态未知（用例失败后调用）：下次 app_start(stop=True) 时冷启动，前置/后置不再跳过
+        :param package: 包名（为空表示全部应用）
+        """
+        for name, state in self._app_states.items():
+            if package is None or name == package:
+                state["known"] = False
+        self.foreground_package = None
+        self.at_home = False
+        self.screen_awake = False
@@ -1,9 +1,25 @@
 # @Time     : 2025/9/15 18:00
 # @Author   : zyli3
 # -*- coding: utf-8 -*-
+import json
+import os
+import time
+import allure
 import pytest
+from core.blob_store import set_allure_dir, attach_bytes
 from core.device_manager import DeviceManager
+from core.device_perf import (
+    start_device_perf_sampler, get_device_perf_sampler, stop_device_perf_sampler, build_perf_attachments
+)
+from core.duration_store import DurationStore
+from core.screenshot import (
+    screen_diff_recorder, build_screen_diff_attachment, get_screenshot_config, SCREEN_DIFF_TYPE
+)
 from core.uiautomator import Uiautomator
+from conf import GlobalConfig
+from util.timing_util import timing_registry, dump_timings, TIMING_FILE_NAME
+
+SETUP_SCOPES = ("function", "class", "module", "package", "session")
 
 
 # 1. 注册命令行参数（供Web端传递设备ID和任务ID）
@@ -20,6 +36,75 @@ def pytest_addoption(parser):
         required=True,
         help="测试任务ID（用于日志和报告命名）"
     )
+    parser.addoption(
+        "--order_by_duration",
+        action="store_true",
+        default=False,
+        help="按历史耗时倒序执行用例（最慢的先跑）"
+    )
+    parser.addoption(
+        "--setup_scope",
+        action="store",
+        default=None,
+        choices=SETUP_SCOPES,
+        help="通用前置/后置夹具的作用域（默认取配置 test.setup_fixture_scope）"
+    )
+
+
+# allure-pytest 初始化之后记录结果目录，供附件去重接口直接链接到 allure_raw
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    set_allure_dir(config.getoption("--alluredir", default=None))
+
+
+# 设备操作耗时汇总写入任务目录（alluredir 的上级），由执行器合并到 report_meta.json 与Web端汇总
+def pytest_sessionfinish(session):
+    allure_dir = session.config.getoption("--alluredir", default=None)
+    if not allure_dir:
+        return
+    try:
+        dump_timings(os.path.join(os.path.dirname(os.path.abspath(allure_dir)), TIMING_FILE_NAME))
+    except OSError:
+        pass
+
+
+# 按历史耗时重排用例：模块 -> 类 -> 用例 逐层按历史耗时倒序（各层无历史的保持原顺序排在最后），
+# 同一模块/类的用例保持相邻，类/模块级夹具不会因交错执行而反复 setup/teardown
+def _get_item_test_key(item) -> str:
+    """与 get_test_key 一致：类名.用例函数名（模块级用例只有函数名）"""
+    name = getattr(item, "originalname", None) or item.name
+    return f"{item.cls.__name__}.{name}" if item.cls is not None else name
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption("--order_by_duration") or not items:
+        return
+
+    durations = {}
+    for suite_path in {str(item.fspath) for item in items}:
+        try:
+            durations[suite_path] = DurationStore().get_test_durations(suite_path)
+        except Exception:
+            durations[suite_path] = {}
+
+    # {模块: {类: [用例]}}，dict 保持首次出现的顺序
+    groups: dict[str, dict] = {}
+    for item in items:
+        module = str(item.fspath)
+        groups.setdefault(module, {}).setdefault(item.cls, []).append(item)
+
+    def _item_ms(item) -> float:
+        return durations[str(item.fspath)].get(_get_item_test_key(item), -1)
+
+    def _total_ms(group_items: list) -> float:
+        known = [ms for ms in map(_item_ms, group_items) if ms >= 0]
+        return sum(known) if known else -1
+
+    ordered = []
+    for classes in sorted(groups.values(), key=lambda c: -_total_ms([i for g in c.values() for i in g])):
+        for class_items in sorted(classes.values(), key=lambda g: -_total_ms(g)):
+            ordered.extend(sorted(class_items, key=lambda i: -_item_ms(i)))
+    items[:] = ordered
 
 
 # 2. 设备实例夹具（session级别，全局共享）
@@ -37,27 +122,127 @@ def task_id(request):
 def uiautomator_instance(device_id, task_id) -> Uiautomator:
     """
     设备实例夹具（session级别，确保非None）
+    启用 device_perf 时同时启动设备性能采样（独立adb shell，会话结束时停止）
     :return: Uiautomator实例（已初始化完成）
     """
     # 从DeviceManager获取实例（确保初始化成功，失败则抛出异常）
-    return DeviceManager.get_uiautomator_instance(device_id, task_id)
+    instance = DeviceManager.get_uiautomator_instance(device_id, task_id)
+    start_device_perf_sampler(device_id, log=instance.log)
+    yield instance
+    stop_device_perf_sampler(device_id)
 
 
-# 3. 测试用例前置/后置夹具（function级别）
-@pytest.fixture(scope="function")
+# 每个用例的设备操作耗时明细附加到Allure结果
+@pytest.fixture(autouse=True)
+def device_action_timings():
+    with timing_registry.capture() as samples:
+        yield
+    if not samples:
+        return
+    summary = {}
+    for _, action, duration_ms, error in samples:
+        item = summary.setdefault(action, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        item["count"] += 1
+        item["errors"] += int(error)
+        item["total_ms"] = round(item["total_ms"] + duration_ms, 1)
+        item["max_ms"] = max(item["max_ms"], duration_ms)
+    data = {
+        "summary": summary,
+        "samples": [{"action": a, "duration_ms": d, "error": e} for _, a, d, e in samples]
+    }
+    attach_bytes(
+        json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"),
+        name="device_action_timings", attachment_type=allure.attachment_type.JSON
+    )
+
+
+# 每个用例期间的设备性能时间序列（JSON）与图表（SVG）附加到Allure
+@pytest.fixture(autouse=True)
+def device_perf_capture(request):
+    start_ts = time.time()
+    yield
+    sampler = get_device_perf_sampler(request.config.getoption("--device_id"))
+    if sampler is None:
+        return
+    rows = sampler.get_samples(start_ts)
+    if not rows:
+        return
+    data, chart = build_perf_attachments(rows, start_ts)
+    attach_bytes(data, name="device_perf", attachment_type=allure.attachment_type.JSON)
+    attach_bytes(chart, name="device_perf_chart", attachment_type=allure.attachment_type.SVG)
+
+
+# 记录各阶段结果（item.rep_setup / item.rep_call）；用例失败时标记应用状态未知并立即截图，PNG编码交给线程池
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    setattr(item, f"rep_{report.when}", report)
+    instance = item.funcargs.get("uiautomator_instance")
+    if report.when == "teardown" or not report.failed or instance is None:
+        return
+    # 失败用例留下的应用状态未知，后续用例的 app_start(stop=True) 不再复用进程
+    instance.invalidate_app_state()
+    if not get_screenshot_config().get("attach_on_failure", True) or getattr(item, "failure_screenshot", None) is not None:
+        return
+    shot = instance.screenshot()
+    if shot is not None:
+        item.failure_screenshot = shot.encode_async(get_screenshot_config().get("attach_scale", 2))
+
+
+# 用例失败时附加失败截图与本用例的截图比较结果（expected/actual/diff，Allure screen-diff 格式）
+@pytest.fixture(autouse=True)
+def screen_capture(request):
+    with screen_diff_recorder.capture() as diffs:
+        yield
+    node = request.node
+    if not any(getattr(getattr(node, f"rep_{when}", None), "failed", False) for when in ("setup", "call")):
+        return
+    future = getattr(node, "failure_screenshot", None)
+    if future is not None:
+        attach_bytes(future.result(), name="failure_screenshot", attachment_type=allure.attachment_type.PNG)
+    for item in diffs:
+        attach_bytes(
+            build_screen_diff_attachment(item), name=f"screen_diff_{item['name']}",
+            attachment_type=SCREEN_DIFF_TYPE, extension="json"
+        )
+    if diffs:
+        results = [item["result"] for item in diffs]
+        attach_bytes(
+            json.dumps(results, ensure_ascii=False, indent=2).encode("utf-8"),
+            name="screen_diff_results", attachment_type=allure.attachment_type.JSON
+        )
+
+
+# 3. 测试用例前置/后置夹具（作用域可配置，默认function级别）
+def _setup_fixture_scope(fixture_name, config) -> str:
+    """前置/后置夹具作用域：命令行 --setup_scope > 配置 test.setup_fixture_scope > function"""
+    scope = config.getoption("--setup_scope") or GlobalConfig["test"].get("setup_fixture_scope", "function")
+    return scope if scope in SETUP_SCOPES else "function"
+
+
+@pytest.fixture(scope=_setup_fixture_scope)
 def setup_and_teardown_demo(uiautomator_instance):
     """
-    通用前置：亮屏
-    通用后置：回到主页面
+    通用前置：亮屏（已知亮屏时跳过）
+    通用后置：回到主页面（已知位于桌面时跳过）
+    设备状态记录在 Uiautomator 实例上（session级别，按设备），用例失败后状态置为未知，下一次前置/后置照常执行
     :param uiautomator_instance: Uiautomator实例（依赖注入）
     :return: Uiautomator实例
     """
+    elide = GlobalConfig["test"].get("elide_noop_setup", True)
     # 前置操作：亮屏
-    uiautomator_instance.screen_on()
+    if elide and uiautomator_instance.is_screen_known_awake(GlobalConfig["test"].get("screen_state_ttl", 15)):
+        uiautomator_instance.log.debug(f"设备{uiautomator_instance.device_id}已亮屏，跳过亮屏操作")
+    else:
+        uiautomator_instance.screen_on()
     yield uiautomator_instance
 
     # 后置操作：回到主页面
-    uiautomator_instance.press("home")
+    if elide and uiautomator_instance.at_home:
+        uiautomator_instance.log.debug(f"设备{uiautomator_instance.device_id}已在桌面，跳过回到主页面")
+    else:
+        uiautomator_instance.press("home")
 
 
 # 4. 简化用例调用的夹具（可选）
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Allure 原始结果（allure_raw）解析工具"""
+import json
+import os
+from typing import Optional
+
+RESULT_SUFFIX = "-result.json"
+CONTAINER_SUFFIX = "-container.json"
+
+
+def iter_result_files(raw_dir: str) -> list[str]:
+    """
+    列出Allure原始目录中的用例结果文件（*-result.json）
+    :param raw_dir: allure_raw 目录
+    :return: 结果文件绝对路径列表（目录不存在时返回空列表）
+    """
+    if not os.path.isdir(raw_dir):
+        return []
+    with os.scandir(raw_dir) as entries:
+        return [e.path for e in entries if e.is_file() and e.name.endswith(RESULT_SUFFIX)]
+
+
+def load_json_file(file_path: str) -> Optional[dict]:
+    """读取JSON文件，文件不完整或格式错误时返回None（pytest可能仍在写入）"""
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_raw_results(raw_dir: str) -> list[dict]:
+    """读取Allure原始目录下全部用例结果"""
+    results = []
+    for file_path in iter_result_files(raw_dir):
+        data = load_json_file(file_path)
+        if data:
+            results.append(data)
+    return results
+
+
+def get_test_key(result: dict) -> str:
+    """
+    获取用例标识（类名.用例函数名，不受@allure.title影响；模块级用例只有函数名）
+    fullName 形如 "test_suite.tmp_project#test_case03"、"test_suite.tmp_project.TestLogin#test_case03"
+    （package 标签为模块路径，fullName 中 # 之前多出的一段即类名）
+    """
+    full_name = result.get("fullName") or result.get("name") or ""
+    prefix, _, name = full_name.rpartition("#")
+    package = get_label(result, "package")
+    if package and prefix.startswith(f"{package}."):
+        return f"{prefix[len(package) + 1:]}.{name}"
+    return name
+
+
+def get_duration_ms(result: dict) -> int:
+    """计算用例耗时（毫秒）"""
+    start, stop = result.get("start"), result.get("stop")
+    if start is None or stop is None:
+        return 0
+    return max(int(stop) - int(start), 0)
+
+
+def get_label(result: dict, name: str, default: str = "") -> str:
+    """获取用例指定标签值（如 suite/severity/feature）"""
+    for label in result.get("labels", []):
+        if label.get("name") == name:
+            return label.get("value", default)
+    return default
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+流式并行归档工具（zip / tar / tar.gz / tar.zst）
+- 文件按顺序输出，压缩在线程池中并行进行（zlib/zstd 压缩时释放GIL，可利用多核）
+- 已压缩格式（图片、视频、压缩包）不再重复压缩
+- 以生成器形式逐块输出，可直接写入HTTP响应，无需落地临时文件；内存占用受并发窗口限制
+"""
+import os
+import struct
+import tarfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：仅 tar.zst 格式需要
+    zstandard = None
+
+ARCHIVE_FORMATS = ("zip", "tar", "tar.gz", "tar.zst")
+ARCHIVE_MIMETYPES = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+    "tar.zst": "application/zstd"
+}
+# 已压缩的文件类型，直接存储
+PRECOMPRESSED_EXTS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp4", ".webm", ".mkv",
+    ".zip", ".gz", ".tgz", ".zst", ".br", ".xz", ".bz2", ".7z", ".apk", ".woff", ".woff2"
+}
+# 超过该大小的文件不进入线程池，在输出线程中分块流式压缩（限制内存占用）
+PARALLEL_MAX_FILE_SIZE = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 1024 * 1024
+ZIP32_LIMIT = 0xFFFFFFFF
+
+
+class ArchiveEntry:
+    """待归档文件"""
+    __slots__ = ("abs_path", "arcname", "size", "mtime", "mode")
+
+    def __init__(self, abs_path: str, arcname: str, stat_result: os.stat_result):
+        self.abs_path = abs_path
+        self.arcname = arcname
+        self.size = stat_result.st_size
+        self.mtime = stat_result.st_mtime
+        self.mode = stat_result.st_mode & 0o777
+
+    @property
+    def precompressed(self) -> bool:
+        return os.path.splitext(self.arcname)[1].lower() in PRECOMPRESSED_EXTS
+
+
+def get_archive_extension(fmt: str) -> str:
+    """归档格式对应的文件扩展名（格式不支持或缺少依赖时抛出 ValueError）"""
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"不支持的归档格式：{fmt}（支持：{list(ARCHIVE_FORMATS)}）")
+    if fmt == "tar.zst" and zstandard is None:
+        raise ValueError("tar.zst 格式需要安装 zstandard（pip install zstandard）")
+    return f".{fmt}"
+
+
+def collect_entries(sources: list, exclude: Optional[Callable[[str], bool]] = None) -> list[ArchiveEntry]:
+    """
+    收集待归档文件（os.scandir 递归，按归档路径排序保证输出稳定）
+    :param sources: [(源目录或文件, 归档内路径前缀), ...]
+    :param exclude: 按文件绝对路径过滤，返回True的文件不归档
+    """
+    entries = []
+
+    def _walk(dir_path: str, prefix: str) -> None:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                arcname = f"{prefix}/{entry.name}" if prefix else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    _walk(entry.path, arcname)
+                elif entry.is_file() and not (exclude and exclude(entry.path)):
+                    entries.append(ArchiveEntry(entry.path, arcname, entry.stat()))
+
+    for src, prefix in sources:
+        prefix = prefix.strip("/")
+        if os.path.isdir(src):
+            _walk(src, prefix)
+        elif os.path.isfile(src):
+            entries.append(ArchiveEntry(src, prefix or os.path.basename(src), os.stat(src)))
+    entries.sort(key=lambda e: e.arcname)
+    return entries
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _iter_file_chunks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _parallel_map(entries: list, func, workers: int) -> Iterator[tuple]:
+    """
+    按顺序返回 (entry, func(entry))，并发窗口为 workers*2；大文件返回 (entry, None) 交由调用方流式处理
+    """
+    window = max(workers, 1) * 2
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="archive") as pool:
+        pending = []
+        index = 0
+        while index < len(entries) or pending:
+            while index < len(entries) and len(pending) < window:
+                entry = entries[index]
+                future = pool.submit(func, entry) if entry.size <= PARALLEL_MAX_FILE_SIZE else None
+                pending.append((entry, future))
+                index += 1
+            entry, future = pending.pop(0)
+            yield entry, (future.result() if future else None)
+
+
+# ------------------- ZIP -------------------
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _zip_compress(entry: ArchiveEntry, level: int) -> tuple:
+    """线程池任务：读取并压缩单个文件，返回 (crc, method, payload, 原始大小)"""
+    data = _read_file(entry.abs_path)
+    crc = zlib.crc32(data)
+    if not entry.precompressed and data:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        if len(payload) < len(data):
+            return crc, 8, payload, len(data)
+    return crc, 0, data, len(data)
+
+
+class _ZipStreamWriter:
+    """流式ZIP写入（小文件头部写入大小；大文件使用数据描述符边压缩边输出）"""
+    FLAG_UTF8 = 0x0800
+    FLAG_DESCRIPTOR = 0x0008
+
+    def __init__(self, level: int, workers: int):
+        self.level = level
+        self.workers = workers
+        self.offset = 0
+        self.central = []
+
+    def _local_header(self, name: bytes, flags: int, method: int, entry: ArchiveEntry,
+                      crc: int, csize: int, usize: int) -> bytes:
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 20, flags, method, dos_time, dos_date,
+            crc, csize, usize, len(name), 0
+        ) + name
+
+    def _add_central(self, name: bytes, flags: int, method: int, entry: ArchiveEntry,
+                     crc: int, csize: int, usize: int, header_offset: int) -> None:
+        if max(csize, usize, header_offset) >= ZIP32_LIMIT:
+            raise ValueError("归档超出ZIP 4GB限制，请使用tar格式")
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        self.central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 20, 20, flags, method, dos_time, dos_date,
+            crc, csize, usize, len(name), 0, 0, 0, 0, ((0o100000 | entry.mode) << 16), header_offset
+        ) + name)
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def _stream_large(self, entry: ArchiveEntry) -> Iterator[bytes]:
+        name = entry.arcname.encode("utf-8")
+        flags = self.FLAG_UTF8 | self.FLAG_DESCRIPTOR
+        method = 0 if entry.precompressed else 8
+        header_offset = self.offset
+        yield self._emit(self._local_header(name, flags, method, entry, 0, 0, 0))
+
+        crc, csize, usize = 0, 0, 0
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15) if method == 8 else None
+        for chunk in _iter_file_chunks(entry.abs_path):
+            crc = zlib.crc32(chunk, crc)
+            usize += len(chunk)
+            out = compressor.compress(chunk) if compressor else chunk
+            if out:
+                csize += len(out)
+                yield self._emit(out)
+        if compressor:
+            tail = compressor.flush()
+            csize += len(tail)
+            yield self._emit(tail)
+        yield self._emit(struct.pack("<IIII", 0x08074B50, crc, csize, usize))
+        self._add_central(name, flags, method, entry, crc, csize, usize, header_offset)
+
+    def iter_bytes(self, entries: list) -> Iterator[bytes]:
+        for entry, result in _parallel_map(entries, lambda e: _zip_compress(e, self.level), self.workers):
+            if result is None:
+                yield from self._stream_large(entry)
+                continue
+            crc, method, payload, usize = result
+            name = entry.arcname.encode("utf-8")
+            header_offset = self.offset
+            yield self._emit(
+                self._local_header(name, self.FLAG_UTF8, method, entry, crc, len(payload), usize)
+            )
+            yield self._emit(payload)
+            self._add_central(name, self.FLAG_UTF8, method, entry, crc, len(payload), usize, header_offset)
+
+        if len(self.central) > 0xFFFF:
+            raise ValueError("归档文件数超出ZIP限制（65535），请使用tar格式")
+        central_offset = self.offset
+        central_data = b"".join(self.central)
+        yield self._emit(central_data)
+        yield self._emit(struct.pack(
+            "<IHHHHIIH", 0x06054B50, 0, 0, len(self.central), len(self.central),
+            len(central_data), central_offset, 0
+        ))
+
+
+# ------------------- TAR（可选 gzip / zstd） -------------------
+class _FrameCodec:
+    """
+    分帧压缩：每个文件单独压缩为一个gzip成员/zstd帧，多个帧直接拼接仍是合法的压缩流，
+    因此可以在线程池中并行压缩；已压缩文件使用最低压缩级别
+    """
+
+    def __init__(self, fmt: str, level: Optional[int]):
+        self.fmt = fmt
+        if fmt == "tar.zst":
+            if zstandard is None:
+                raise ValueError("tar.zst 格式需要安装 zstandard（pip install zstandard）")
+            self.level = level if level is not None else 3
+        else:
+            self.level = level if level is not None else 6
+
+    def _gzip_compressor(self, store: bool):
+        return zlib.compressobj(0 if store else self.level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, store: bool = False) -> bytes:
+        if self.fmt == "tar":
+            return data
+        if self.fmt == "tar.zst":
+            return zstandard.ZstdCompressor(level=1 if store else self.level).compress(data)
+        compressor = self._gzip_compressor(store)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks: Iterator[bytes], store: bool = False) -> Iterator[bytes]:
+        """单帧流式压缩（大文件）"""
+        if self.fmt == "tar":
+            yield from chunks
+            return
+        if self.fmt == "tar.zst":
+            compressor = zstandard.ZstdCompressor(level=1 if store else self.level).compressobj()
+        else:
+            compressor = self._gzip_compressor(store)
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+
+
+def _tar_header(entry: ArchiveEntry) -> bytes:
+    info = tarfile.TarInfo(entry.arcname)
+    info.size = entry.size
+    info.mtime = int(entry.mtime)
+    info.mode = entry.mode
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def _tar_padding(size: int) -> bytes:
+    remainder = size % tarfile.BLOCKSIZE
+    return b"\0" * (tarfile.BLOCKSIZE - remainder) if remainder else b""
+
+
+def _tar_entry_bytes(entry: ArchiveEntry, codec: _FrameCodec) -> bytes:
+    """线程池任务：读取文件，拼接tar头+内容+填充，压缩为独立帧"""
+    data = _read_file(entry.abs_path)
+    # 读取时文件大小变化，以实际内容为准
+    if len(data) != entry.size:
+        entry.size = len(data)
+    return codec.compress(_tar_header(entry) + data + _tar_padding(len(data)), store=entry.precompressed)
+
+
+def _iter_tar(entries: list, fmt: str, level: Optional[int], workers: int) -> Iterator[bytes]:
+    codec = _FrameCodec(fmt, level)
+    for entry, frame in _parallel_map(entries, lambda e: _tar_entry_bytes(e, codec), workers):
+        if frame is not None:
+            yield frame
+            continue
+
+        def _large_chunks(e=entry) -> Iterator[bytes]:
+            yield _tar_header(e)
+            written = 0
+            for chunk in _iter_file_chunks(e.abs_path):
+                chunk = chunk[:e.size - written]
+                written += len(chunk)
+                yield chunk
+                if written >= e.size:
+                    break
+            # 文件在读取期间被截断时补零，保证tar结构正确
+            if written < e.size:
+                yield b"\0" * (e.size - written)
+            yield _tar_padding(e.size)
+
+        yield from codec.stream(_large_chunks(), store=entry.precompressed)
+    # 结束标记：两个空块，并补齐到记录大小
+    yield codec.compress(b"\0" * tarfile.RECORDSIZE)
+
+
+# ------------------- 对外接口 -------------------
+def stream_archive(sources: list, fmt: str = "zip", level: Optional[int] = None,
+                   workers: Optional[int] = None,
+                   exclude: Optional[Callable[[str], bool]] = None) -> Iterator[bytes]:
+    """
+    流式生成归档内容
+    :param sources: [(源目录或文件, 归档内路径前缀), ...]
+    :param fmt: zip / tar / tar.gz / tar.zst
+    :param level: 压缩级别（默认 zip/gzip=6，zstd=3）
+    :param workers: 并行压缩线程数（默认CPU核数）
+    :param exclude: 按文件绝对路径过滤，返回True的文件不归档
+    :return: 字节块生成器
+    """
+    get_archive_extension(fmt)
+    workers = workers or os.cpu_count() or 2
+    entries = collect_entries(sources, exclude)
+    if fmt == "zip":
+        return _ZipStreamWriter(level if level is not None else 6, workers).iter_bytes(entries)
+    return _iter_tar(entries, fmt, level, workers)
+
+
+def write_archive(sources: list, dest_path: str, fmt: str = "zip", level: Optional[int] = None,
+                  workers: Optional[int] = None, exclude: Optional[Callable[[str], bool]] = None) -> int:
+    """
+    生成归档文件（先写临时文件，完成后重命名）
+    :return: 归档文件大小（字节）
+    """
+    tmp_path = f"{dest_path}.part"
+    total = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in stream_archive(sources, fmt=fmt, level=level, workers=workers, exclude=exclude):
+                f.write(chunk)
+                total += len(chunk)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return total
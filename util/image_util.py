@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+PNG 编解码（不依赖图像库）：
+- encode_png：原始像素直接写PNG（每行过滤类型0，压缩交给zlib，zlib执行时释放GIL，可在线程池并行）
+- decode_png：解码8位 灰度/RGB/RGBA PNG 为 numpy 数组（需要numpy；None/Sub/Up 过滤向量化，
+  Avg/Paeth 过滤逐字节计算，较慢，安装了Pillow时整张图交给Pillow；调色板/16位/隔行扫描需要Pillow）
+"""
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：未安装时只能编码，不能解码
+    np = None
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# PNG颜色类型 -> 通道数（只支持8位无调色板格式）
+COLOR_TYPE_CHANNELS = {0: 1, 2: 3, 6: 4}
+CHANNELS_COLOR_TYPE = {channels: color_type for color_type, channels in COLOR_TYPE_CHANNELS.items()}
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(pixels: bytes, width: int, height: int, channels: int = 4, level: int = 6) -> bytes:
+    """
+    原始像素编码为PNG
+    :param pixels: 行优先的8位像素（长度 = width * height * channels）
+    :param channels: 1（灰度）/ 3（RGB）/ 4（RGBA）
+    :param level: zlib压缩级别（1最快，9最小）
+    """
+    if channels not in CHANNELS_COLOR_TYPE:
+        raise ValueError(f"不支持的通道数：{channels}")
+    stride = width * channels
+    if len(pixels) < stride * height:
+        raise ValueError(f"像素数据长度不足：{len(pixels)} < {stride * height}")
+    view = memoryview(pixels)
+    compressor = zlib.compressobj(level)
+    chunks = []
+    for y in range(height):
+        chunks.append(compressor.compress(b"\x00"))  # 每行前缀过滤类型0
+        chunks.append(compressor.compress(view[y * stride:(y + 1) * stride]))
+    chunks.append(compressor.flush())
+    header = struct.pack(">IIBBBBB", width, height, 8, CHANNELS_COLOR_TYPE[channels], 0, 0, 0)
+    return PNG_SIGNATURE + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", b"".join(chunks)) + _png_chunk(b"IEND", b"")
+
+
+def _load_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _decode_with_pillow(data: bytes):
+    Image = _load_pillow()
+    if Image is None:
+        raise ValueError("PNG为调色板/非8位/隔行扫描格式，需要安装Pillow解码")
+    from io import BytesIO
+    with Image.open(BytesIO(data)) as image:
+        if image.mode not in ("L", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        array = np.asarray(image)
+    return array if array.ndim == 3 else array[:, :, None]
+
+
+def decode_png(data: bytes):
+    """
+    解码PNG
+    :return: numpy数组（高, 宽, 通道），uint8
+    """
+    if np is None:
+        raise RuntimeError("PNG解码需要安装numpy（pip install -r requirement/image.txt）")
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("不是PNG数据")
+    pos, header, idat = len(PNG_SIGNATURE), None, []
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"IDAT":
+            idat.append(body)
+        elif kind == b"IEND":
+            break
+        pos += 12 + length
+    if header is None:
+        raise ValueError("PNG缺少IHDR")
+    width, height, bit_depth, color_type, _, _, interlace = header
+    channels = COLOR_TYPE_CHANNELS.get(color_type)
+    if bit_depth != 8 or channels is None or interlace:
+        return _decode_with_pillow(data)
+
+    stride = width * channels
+    raw = np.frombuffer(zlib.decompress(b"".join(idat)), dtype=np.uint8).reshape(height, stride + 1)
+    filters, rows = raw[:, 0], raw[:, 1:]
+    if np.any(filters > 4):
+        raise ValueError(f"PNG过滤类型错误：{int(filters.max())}")
+    if np.any(filters > 2):
+        if _load_pillow() is not None:
+            return _decode_with_pillow(data)
+        return _unfilter_rows(filters, rows, channels).reshape(height, width, channels)
+
+    pixels = rows.copy()
+    # Sub：行内按通道累加（uint8 溢出即为模256）
+    sub_rows = np.nonzero(filters == 1)[0]
+    if len(sub_rows):
+        sub = pixels[sub_rows].reshape(len(sub_rows), width, channels)
+        pixels[sub_rows] = np.cumsum(sub, axis=1, dtype=np.uint8).reshape(len(sub_rows), stride)
+    # Up：加上一行的解码结果（逐行处理，行内向量化；首行的上一行视为0）
+    for y in range(1, height):
+        if filters[y] == 2:
+            pixels[y] += pixels[y - 1]
+    return pixels.reshape(height, width, channels)
+
+
+def _unfilter_rows(filters, rows, bpp: int):
+    """
+    逐行反过滤（含 Avg/Paeth）：行间有依赖，按行顺序处理；None/Sub/Up 行用numpy，Avg/Paeth 行逐字节计算
+    :param bpp: 每像素字节数（左侧像素的偏移）
+    """
+    height, stride = rows.shape
+    pixels = np.empty_like(rows)
+    prev = np.zeros(stride, dtype=np.uint8)
+    for y in range(height):
+        kind = filters[y]
+        if kind == 0:
+            pixels[y] = rows[y]
+        elif kind == 1:
+            pixels[y] = np.cumsum(rows[y].reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(stride)
+        elif kind == 2:
+            pixels[y] = rows[y] + prev
+        else:
+            row, up = bytearray(rows[y].tobytes()), prev.tobytes()
+            if kind == 3:  # Avg：左侧与上方的平均值（向下取整）
+                for i in range(stride):
+                    left = row[i - bpp] if i >= bpp else 0
+                    row[i] = (row[i] + ((left + up[i]) >> 1)) & 0xFF
+            else:  # Paeth：左侧/上方/左上中与 左+上-左上 最接近的一个
+                for i in range(stride):
+                    a = row[i - bpp] if i >= bpp else 0
+                    b = up[i]
+                    c = up[i - bpp] if i >= bpp else 0
+                    pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+                    predictor = a if pa <= pb and pa <= pc else b if pb <= pc else c
+                    row[i] = (row[i] + predictor) & 0xFF
+            pixels[y] = np.frombuffer(bytes(row), dtype=np.uint8)
+        prev = pixels[y]
+    return pixels
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+结构化日志（JSONL）与分块索引：
+- 每个任务日志 logs/<设备ID>/<日期>/<任务ID>.log 旁写入 <任务ID>.<进程ID>.jsonl，每行一条记录
+  {"ts", "time", "level", "task_id", "device_id", "logger", "event", "duration_ms", "msg"}
+  （Web进程与pytest子进程会同时记录同一任务的日志，按进程分文件，各自的块偏移才准确）
+- 写入时每 N 条记录生成一个块索引写入 <任务ID>.<进程ID>.jsonl.idx：
+  {"offset", "length", "start", "end", "levels"(级别位掩码), "events"}
+- 查询时按设备/日期目录、任务文件名、块的时间范围/级别/事件过滤，只读取命中块的字节范围
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+JSONL_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".jsonl.idx"
+LEVEL_BITS = {"DEBUG": 1, "INFO": 2, "WARNING": 4, "ERROR": 8, "CRITICAL": 16}
+# 单个块内记录的事件类型超过该数量时不再逐个记录（查询时该块按可能命中处理）
+MAX_BLOCK_EVENTS = 32
+ANY_EVENT = "*"
+
+
+def get_jsonl_path(log_dir: str, task_id: str) -> str:
+    """当前进程写入的结构化日志路径"""
+    return os.path.join(log_dir, f"{task_id}.{os.getpid()}{JSONL_SUFFIX}")
+
+
+def _is_task_jsonl(name: str, task_id: Optional[str]) -> bool:
+    """是否为（指定任务的）结构化日志文件（兼容不带进程ID的旧文件名）"""
+    if not name.endswith(JSONL_SUFFIX):
+        return False
+    return not task_id or name == f"{task_id}{JSONL_SUFFIX}" or name.startswith(f"{task_id}.")
+
+
+def get_level_mask(min_level: Optional[str]) -> int:
+    """不低于指定级别的位掩码（为空表示全部级别）"""
+    if not min_level:
+        return sum(LEVEL_BITS.values())
+    min_no = logging.getLevelName(min_level.upper())
+    if not isinstance(min_no, int):
+        raise ValueError(f"不支持的日志级别：{min_level}")
+    return sum(bit for name, bit in LEVEL_BITS.items() if logging.getLevelName(name) >= min_no)
+
+
+class JsonlIndexHandler(logging.Handler):
+    """结构化日志处理器：写入JSONL并同步维护块索引"""
+
+    def __init__(self, jsonl_path: str, task_id: str, device_id: str, block_records: int = 256,
+                 flush_each: bool = True):
+        """
+        :param block_records: 每个索引块包含的记录数
+        :param flush_each: 每条记录后flush（同步模式）；异步模式由分发线程每批flush
+        """
+        super().__init__()
+        self.flush_each = flush_each
+        self.jsonl_path = jsonl_path
+        self.index_path = jsonl_path[:-len(JSONL_SUFFIX)] + INDEX_SUFFIX
+        self.task_id = task_id
+        self.device_id = device_id
+        self.block_records = block_records
+        self._stream = open(jsonl_path, "ab")
+        self._index_stream = open(self.index_path, "a", encoding="utf-8")
+        self._offset = self._stream.tell()
+        self._index_gap()
+        self._reset_block()
+
+    def _index_gap(self) -> None:
+        """文件中已有但未建索引的内容（如进程异常退出），补一个覆盖全部级别和事件的块"""
+        blocks = _load_index(self.index_path)
+        indexed_end = max((b["offset"] + b["length"] for b in blocks), default=0)
+        if self._offset > indexed_end:
+            self._index_stream.write(json.dumps({
+                "offset": indexed_end, "length": self._offset - indexed_end, "start": 0,
+                "end": time.time(), "levels": sum(LEVEL_BITS.values()), "events": [ANY_EVENT]
+            }) + "\n")
+
+    def _reset_block(self) -> None:
+        self._block_offset = self._offset
+        self._block_count = 0
+        self._block_start = None
+        self._block_end = None
+        self._block_levels = 0
+        self._block_events = set()
+
+    def _write_block_index(self) -> None:
+        if not self._block_count:
+            return
+        events = sorted(self._block_events) if len(self._block_events) <= MAX_BLOCK_EVENTS else [ANY_EVENT]
+        self._index_stream.write(json.dumps({
+            "offset": self._block_offset,
+            "length": self._offset - self._block_offset,
+            "start": self._block_start,
+            "end": self._block_end,
+            "levels": self._block_levels,
+            "events": events
+        }, ensure_ascii=False) + "\n")
+        self._reset_block()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            event = getattr(record, "event", None)
+            duration = getattr(record, "duration", None)
+            line = json.dumps({
+                "ts": round(record.created, 3),
+                "time": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S"),
+                "level": record.levelname,
+                "task_id": self.task_id,
+                "device_id": self.device_id,
+                "logger": record.name,
+                "event": event,
+                "duration_ms": round(duration * 1000, 1) if duration is not None else None,
+                "msg": record.getMessage() + (f"\n{self.formatException(record.exc_info)}" if record.exc_info else "")
+            }, ensure_ascii=False).encode("utf-8") + b"\n"
+            self._stream.write(line)
+            self._offset += len(line)
+
+            self._block_count += 1
+            self._block_start = record.created if self._block_start is None else self._block_start
+            self._block_end = record.created
+            self._block_levels |= LEVEL_BITS.get(record.levelname, 0)
+            if event:
+                self._block_events.add(event)
+            if self._block_count >= self.block_records:
+                self._write_block_index()
+            if self.flush_each:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def formatException(self, exc_info) -> str:
+        return logging.Formatter().formatException(exc_info)
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if not self._stream.closed:
+                self._stream.flush()
+                self._index_stream.flush()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if not self._stream.closed:
+                # 剩余记录生成最后一个块索引
+                self._write_block_index()
+                self._stream.close()
+                self._index_stream.close()
+        finally:
+            self.release()
+        super().close()
+
+
+# ------------------- 查询 -------------------
+def _iter_date_dirs(log_root: str, device_id: Optional[str], start_ts: Optional[float],
+                    end_ts: Optional[float]) -> Iterator[str]:
+    """按设备和日期范围筛选日志日期目录"""
+    if not os.path.isdir(log_root):
+        return
+    start_day = datetime.fromtimestamp(start_ts).strftime("%Y%m%d") if start_ts else None
+    end_day = datetime.fromtimestamp(end_ts).strftime("%Y%m%d") if end_ts else None
+    devices = [device_id] if device_id else sorted(os.listdir(log_root))
+    for device in devices:
+        device_dir = os.path.join(log_root, device)
+        if not os.path.isdir(device_dir):
+            continue
+        for day in sorted(os.listdir(device_dir)):
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            yield os.path.join(device_dir, day)
+
+
+def _load_index(index_path: str) -> list[dict]:
+    blocks = []
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    blocks.append(json.loads(line))
+                except ValueError:
+                    break  # 正在写入的最后一行
+    except OSError:
+        pass
+    return blocks
+
+
+def _iter_ranges(jsonl_path: str, level_mask: int, event: Optional[str],
+                 start_ts: Optional[float], end_ts: Optional[float]) -> Iterator[tuple[int, int]]:
+    """根据块索引计算需要读取的字节范围；索引之后尚未成块的尾部整体读取"""
+    indexed_end = 0
+    for block in _load_index(jsonl_path[:-len(JSONL_SUFFIX)] + INDEX_SUFFIX):
+        indexed_end = max(indexed_end, block["offset"] + block["length"])
+        if not block["levels"] & level_mask:
+            continue
+        if start_ts and block["end"] < start_ts:
+            continue
+        if end_ts and block["start"] > end_ts:
+            continue
+        if event and event not in block["events"] and ANY_EVENT not in block["events"]:
+            continue
+        yield block["offset"], block["length"]
+    size = os.path.getsize(jsonl_path)
+    if size > indexed_end:
+        yield indexed_end, size - indexed_end
+
+
+def search_logs(log_root: str, device_id: Optional[str] = None, task_id: Optional[str] = None,
+                min_level: Optional[str] = None, event: Optional[str] = None,
+                start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                keyword: Optional[str] = None, limit: int = 200) -> dict:
+    """
+    查询结构化日志
+    :return: {"records": [...], "truncated": 是否达到limit, "bytes_read": 读取字节数, "files": 命中文件数, "duration_ms"}
+    """
+    begin = time.time()
+    level_mask = get_level_mask(min_level)
+    records, bytes_read, files = [], 0, 0
+    truncated = False
+    for date_dir in _iter_date_dirs(log_root, device_id, start_ts, end_ts):
+        names = sorted(n for n in os.listdir(date_dir) if _is_task_jsonl(n, task_id))
+        for name in names:
+            jsonl_path = os.path.join(date_dir, name)
+            if not os.path.isfile(jsonl_path):
+                continue
+            files += 1
+            with open(jsonl_path, "rb") as f:
+                for offset, length in _iter_ranges(jsonl_path, level_mask, event, start_ts, end_ts):
+                    f.seek(offset)
+                    data = f.read(length)
+                    bytes_read += len(data)
+                    for line in data.splitlines():
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if not LEVEL_BITS.get(record["level"], 0) & level_mask:
+                            continue
+                        if event and record.get("event") != event:
+                            continue
+                        if (start_ts and record["ts"] < start_ts) or (end_ts and record["ts"] > end_ts):
+                            continue
+                        if keyword and keyword not in record["msg"]:
+                            continue
+                        records.append(record)
+                        if len(records) >= limit:
+                            truncated = True
+                            break
+                    if truncated:
+                        break
+            if truncated:
+                break
+        if truncated:
+            break
+    # 同一任务的多个进程文件各自有序，合并后按时间排序
+    records.sort(key=lambda r: r["ts"])
+    return {
+        "records": records,
+        "truncated": truncated,
+        "bytes_read": bytes_read,
+        "files": files,
+        "duration_ms": round((time.time() - begin) * 1000, 2)
+    }
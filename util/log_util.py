@@ -1,26 +1,255 @@
 # @Time     : 2025/9/15 18:00
 # @Author   : zyli3
 # -*- coding: utf-8 -*-
+import atexit
 import logging
 import os
+import queue
+import threading
 import traceback  # 新增：导入 traceback 模块，用于打印异常堆栈
+import weakref
 from datetime import datetime
+from logging.handlers import QueueHandler
+from typing import Optional
 from conf import GlobalConfig
+from util.log_index import JsonlIndexHandler, get_jsonl_path
 
 LOG_ROOT = GlobalConfig["path"]["log_root_dir"]
+LOG_CONFIG = GlobalConfig.get("log", {})
+CONSOLE_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
+FILE_FORMAT = "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class _BatchWriteMixin:
+    """emit 只写入缓冲区不立即flush，由异步分发线程每批统一flush一次"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchFileHandler(_BatchWriteMixin, logging.FileHandler):
+    pass
+
+
+class BatchStreamHandler(_BatchWriteMixin, logging.StreamHandler):
+    def _open(self):
+        return self.stream
+
+
+class AsyncLogDispatcher:
+    """
+    异步日志分发：调用方线程只把日志记录放入有界队列，后台线程批量写入各处理器
+    队列满时的策略（log.full_policy）：
+    - drop：丢弃 DEBUG/INFO 日志并计数，WARNING 及以上仍阻塞等待（最多 block_timeout 秒）
+    - block：所有级别都阻塞等待（背压），超时后丢弃
+    """
+    _STOP = object()
+
+    class _CloseRequest:
+        """关闭处理器请求：排在该处理器已入队的日志之后执行，保证日志写完再关闭文件"""
+        __slots__ = ("handler",)
+
+        def __init__(self, handler: logging.Handler):
+            self.handler = handler
+
+    def __init__(self, queue_size: int = 10000, full_policy: str = "drop", block_timeout: float = 1.0,
+                 batch_size: int = 200):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log-dispatcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, record: logging.LogRecord) -> None:
+        try:
+            if self.full_policy == "drop" and record.levelno < logging.WARNING:
+                self.queue.put_nowait(record)
+            else:
+                self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            touched = set()
+            stop = False
+            for record in batch:
+                if record is self._STOP:
+                    stop = True
+                    continue
+                if isinstance(record, self._CloseRequest):
+                    touched.discard(record.handler)
+                    record.handler.close()
+                    continue
+                for handler in record.log_targets:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+                        touched.add(handler)
+            for handler in touched:
+                try:
+                    handler.flush()
+                except Exception:
+                    pass
+            if stop:
+                return
+
+    def close_handler(self, handler: logging.Handler) -> None:
+        """在已入队的日志写完后关闭处理器（队列满且等待超时时直接关闭，该处理器尚未写入的日志丢弃）"""
+        if self._thread.is_alive():
+            try:
+                self.queue.put(self._CloseRequest(handler), timeout=self.block_timeout)
+                return
+            except queue.Full:
+                self.dropped += 1
+        handler.close()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """写完队列中剩余日志后停止（进程退出时自动调用）"""
+        if self._thread.is_alive():
+            try:
+                self.queue.put(self._STOP, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def status(self) -> dict:
+        return {"queue": self.queue.qsize(), "capacity": self.queue.maxsize, "dropped": self.dropped}
+
+
+class AsyncQueueHandler(QueueHandler):
+    """将日志记录交给异步分发线程，并记录该记录需要写入的处理器"""
+
+    def __init__(self, dispatcher: AsyncLogDispatcher, targets: tuple):
+        super().__init__(dispatcher.queue)
+        self.dispatcher = dispatcher
+        self.targets = targets
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 父类会在调用方线程格式化消息和异常堆栈，后台线程无需访问原始参数
+        record = super().prepare(record)
+        record.log_targets = self.targets
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.dispatcher.put(record)
+
+
+_dispatcher: Optional[AsyncLogDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_log_dispatcher() -> Optional[AsyncLogDispatcher]:
+    """获取全局异步日志分发器（配置未启用异步模式时返回None）"""
+    global _dispatcher
+    if not LOG_CONFIG.get("async", False):
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = AsyncLogDispatcher(
+                queue_size=LOG_CONFIG.get("queue_size", 10000),
+                full_policy=LOG_CONFIG.get("full_policy", "drop"),
+                block_timeout=LOG_CONFIG.get("block_timeout", 1.0),
+                batch_size=LOG_CONFIG.get("batch_size", 200)
+            )
+        return _dispatcher
+
+
+class _HandlerPool:
+    """
+    处理器池：同一个日志文件（设备+日期+任务）只打开一个文件处理器，控制台处理器全局共享一个，
+    按引用计数在最后一个使用者释放时关闭，避免文件句柄随任务数增长
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[tuple, list] = {}  # key -> [handler, 引用计数]
+
+    def acquire(self, key: tuple, factory) -> logging.Handler:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [factory(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, key: tuple) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[key]
+        handler = entry[0]
+        dispatcher = _dispatcher
+        if dispatcher is not None:
+            dispatcher.close_handler(handler)
+        else:
+            handler.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"handlers": len(self._entries), "refs": sum(e[1] for e in self._entries.values())}
+
+
+_handler_pool = _HandlerPool()
+
+
+def _release_logger(logger_name: str, handlers: list, handler_keys: list) -> None:
+    """释放日志器占用的处理器；日志器不再有处理器时从logging全局注册表移除"""
+    logger = logging.Logger.manager.loggerDict.get(logger_name)
+    if isinstance(logger, logging.Logger):
+        for handler in handlers:
+            logger.removeHandler(handler)
+        if not logger.handlers:
+            logging.Logger.manager.loggerDict.pop(logger_name, None)
+    for key in handler_keys:
+        _handler_pool.release(key)
+
+
+def get_log_status() -> dict:
+    """日志资源状态（处理器池、已注册日志器数量、异步队列）"""
+    dispatcher = _dispatcher
+    return {
+        "handler_pool": _handler_pool.status(),
+        "loggers": len(logging.Logger.manager.loggerDict),
+        "async": dispatcher.status() if dispatcher else None
+    }
 
 
 class LogUtil:
     def __init__(self, device_id: str, task_id: str, logger_name: str = "automation"):
         """
         初始化日志工具（按设备+日期分目录，按任务ID分文件）
+        处理器从处理器池获取，使用完毕调用 close()（或 with LogUtil(...) as log）释放
         :param device_id: 设备ID（用于日志目录分类）
         :param task_id: 任务ID（用于日志文件命名）
-        :param logger_name: 日志器名称
+        :param logger_name: 日志器名称（"." 替换为 "_"：logging 按 "." 建立层级，
+                            如 device_192.168.1.5:5555 会留下无法释放的父级占位日志器）
         """
+        logger_name = logger_name.replace(".", "_")
+        self.logger_name = logger_name
         self.logger = logging.getLogger(logger_name)
         self.logger.setLevel(logging.DEBUG)
-        self.logger.handlers.clear()  # 避免重复添加处理器
+        # 同名日志器由新实例接管（旧实例仍持有的池引用在其 close/回收时释放）
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
 
         # 日志目录：LOG_ROOT/设备ID/日期（如 logs/AF8YVB1805003480/20240520）
         date_str = datetime.now().strftime("%Y%m%d")
@@ -30,40 +259,84 @@ class LogUtil:
         # 日志文件：任务ID.log（如 20240520123456_abc1.log）
         log_file = os.path.join(log_dir, f"{task_id}.log")
 
-        # 控制台处理器（INFO级别）
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        console_handler.setLevel(logging.DEBUG)
-        console_formatter = logging.Formatter(
-            "[%(asctime)s] [%(levelname)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
-        console_handler.setFormatter(console_formatter)
-
-        # 文件处理器（DEBUG级别，含详细信息）
-        file_handler = logging.FileHandler(log_file, encoding="utf-8")
-        file_handler.setLevel(logging.DEBUG)
-        file_formatter = logging.Formatter(
-            "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S"
-        )
-        file_handler.setFormatter(file_formatter)
+        # 异步模式：调用方只入队，后台线程批量写入（处理器不在每条日志后flush）
+        dispatcher = get_log_dispatcher()
+        stream_cls = BatchStreamHandler if dispatcher else logging.StreamHandler
+        file_cls = BatchFileHandler if dispatcher else logging.FileHandler
+
+        def _console_factory() -> logging.Handler:
+            # 控制台处理器（级别可配置，默认INFO）
+            handler = stream_cls()
+            handler.setLevel(LOG_CONFIG.get("console_level", "INFO"))
+            handler.setFormatter(logging.Formatter(CONSOLE_FORMAT, datefmt=DATE_FORMAT))
+            return handler
+
+        def _file_factory() -> logging.Handler:
+            # 文件处理器（DEBUG级别，含详细信息）
+            handler = file_cls(log_file, encoding="utf-8")
+            handler.setLevel(LOG_CONFIG.get("file_level", "DEBUG"))
+            handler.setFormatter(logging.Formatter(FILE_FORMAT, datefmt=DATE_FORMAT))
+            return handler
+
+        def _jsonl_factory() -> logging.Handler:
+            # 结构化日志处理器（JSONL + 块索引，供 /api/logs/search 查询）
+            handler = JsonlIndexHandler(
+                get_jsonl_path(log_dir, task_id), task_id, device_id,
+                block_records=LOG_CONFIG.get("index_block_records", 256),
+                flush_each=dispatcher is None
+            )
+            handler.setLevel(LOG_CONFIG.get("file_level", "DEBUG"))
+            return handler
+
+        self._handler_keys = [("console", stream_cls.__name__), ("file", os.path.abspath(log_file))]
+        targets = [
+            _handler_pool.acquire(self._handler_keys[0], _console_factory),
+            _handler_pool.acquire(self._handler_keys[1], _file_factory)
+        ]
+        if LOG_CONFIG.get("jsonl", False):
+            self._handler_keys.append(("jsonl", os.path.abspath(log_file)))
+            targets.append(_handler_pool.acquire(self._handler_keys[2], _jsonl_factory))
 
         # 添加处理器
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
+        if dispatcher:
+            self._handlers = [AsyncQueueHandler(dispatcher, tuple(targets))]
+        else:
+            self._handlers = targets
+        for handler in self._handlers:
+            self.logger.addHandler(handler)
+
+        # 未显式 close 的实例被回收时同样释放处理器
+        self._finalizer = weakref.finalize(
+            self, _release_logger, logger_name, self._handlers, self._handler_keys
+        )
+
+    def close(self) -> None:
+        """释放处理器并从日志注册表移除日志器（可重复调用）"""
+        self._finalizer()
+
+    def __enter__(self) -> "LogUtil":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @staticmethod
+    def _extra(event: Optional[str], duration: Optional[float]) -> dict:
+        """结构化字段：事件类型、耗时（秒），写入JSONL日志"""
+        return {"event": event, "duration": duration}
 
-    def debug(self, msg: str) -> None:
-        self.logger.debug(msg)
+    def debug(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
+        self.logger.debug(msg, extra=self._extra(event, duration))
 
-    def info(self, msg: str) -> None:
-        self.logger.info(msg)
+    def info(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
+        self.logger.info(msg, extra=self._extra(event, duration))
 
-    def warning(self, msg: str) -> None:
-        self.logger.warning(msg)
+    def warning(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
+        self.logger.warning(msg, extra=self._extra(event, duration))
 
-    def error(self, msg: str, exc_info: bool = False) -> None:
-        self.logger.error(msg, exc_info=exc_info)  # exc_info=True时打印堆栈
+    def error(self, msg: str, exc_info: bool = False, event: Optional[str] = None,
+              duration: Optional[float] = None) -> None:
+        self.logger.error(msg, exc_info=exc_info, extra=self._extra(event, duration))  # exc_info=True时打印堆栈
 
 
 # 降级日志（LogUtil初始化失败时使用）
@@ -78,15 +351,17 @@ class TempLog:
             print(f"[异常堆栈]：")
             traceback.print_exc()  # 打印当前异常的堆栈信息
 
-    def debug(self, msg: str) -> None:
+    # event/duration 仅为兼容 LogUtil 的调用方式，控制台输出中忽略
+    def debug(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
         self._log("debug", msg)
 
-    def info(self, msg: str) -> None:
+    def info(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
         self._log("info", msg)
 
-    def warning(self, msg: str) -> None:
+    def warning(self, msg: str, event: Optional[str] = None, duration: Optional[float] = None) -> None:
         self._log("warning", msg)
 
-    def error(self, msg: str, exc_info: bool = False) -> None:
+    def error(self, msg: str, exc_info: bool = False, event: Optional[str] = None,
+              duration: Optional[float] = None) -> None:
         """新增 exc_info 参数，匹配 LogUtil 的调用方式"""
         self._log("error", msg, exc_info=exc_info)
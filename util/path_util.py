@@ -16,7 +16,8 @@ def safe_join(base_dir: str, *paths: str) -> str:
     target_path = os.path.abspath(os.path.join(base_abs, *paths))
 
     # 校验目标路径是否在基础目录内
-    if not target_path.startswith(base_abs):
+    # 按路径分隔符比较，避免 /a/raw2 被当作 /a/raw 的子路径
+    if target_path != base_abs and not target_path.startswith(base_abs.rstrip(os.sep) + os.sep):
         raise ValueError(f"非法路径：{os.path.join(*paths)}（超出基础目录{base_dir}）")
     return target_path
 
@@ -26,6 +27,76 @@ def ensure_dir_exists(dir_path: str) -> None:
     if not os.path.exists(dir_path):
         os.makedirs(dir_path, exist_ok=True)
 
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def get_path_bytes(path: str) -> int:
+    """
+    计算文件或目录大小（字节）
+    目录使用 os.scandir 递归，复用目录项缓存的stat结果，每个文件只stat一次
+    """
+    try:
+        if not os.path.isdir(path):
+            return os.stat(path).st_size
+    except OSError:
+        return 0
+
+    total_size = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total_size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue  # 扫描期间文件被删除
+        except OSError:
+            continue
+    return total_size
+
+
+def scan_path_links(path: str) -> tuple[int, dict]:
+    """
+    统计目录大小并区分硬链接：只在目录内被引用的文件计入独占大小（删除目录即释放），
+    与目录外共享的文件（如去重附件 _blobs 的硬链接）按inode单独返回，避免同一份数据在多个目录中重复计算
+    （Windows 的 scandir 不提供链接数，全部按独占计算）
+    :return: (独占字节数, {inode: [大小, 目录内链接数, 总链接数]})
+    """
+    unique_bytes, shared = 0, {}
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue  # 扫描期间文件被删除
+                    if stat_result.st_nlink <= 1:
+                        unique_bytes += stat_result.st_size
+                        continue
+                    item = shared.setdefault(stat_result.st_ino, [stat_result.st_size, 0, stat_result.st_nlink])
+                    item[1] += 1
+        except OSError:
+            continue
+    # 所有链接都在目录内的文件同样是独占的
+    for inode in [inode for inode, (_, inside, nlink) in shared.items() if inside >= nlink]:
+        unique_bytes += shared.pop(inode)[0]
+    return unique_bytes, shared
+
+
+def convert_size(size_bytes: int, unit: str = "KB") -> float:
+    """字节数转换为指定单位（B/KB/MB/GB，保留2位小数）"""
+    return round(size_bytes / SIZE_UNITS.get(unit, SIZE_UNITS["KB"]), 2)
+
+
 def get_file_size(path: str, unit: str = "KB") -> float:
     """
     计算文件或目录大小
@@ -33,20 +104,48 @@ def get_file_size(path: str, unit: str = "KB") -> float:
     :param unit: 单位（B/KB/MB/GB）
     :return: 大小（保留2位小数）
     """
-    if not os.path.exists(path):
-        return 0.0
+    return convert_size(get_path_bytes(path), unit)
 
-    total_size = 0
-    if os.path.isfile(path):
-        total_size = os.path.getsize(path)
-    else:
-        for root, _, files in os.walk(path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                total_size += os.path.getsize(file_path)
-
-    # 单位转换
-    unit_map = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
-    if unit not in unit_map:
-        unit = "KB"
-    return round(total_size / unit_map[unit], 2)
+
+class SizeTracker:
+    """
+    路径大小记账：
+    - 同一路径只扫描一次，后续直接返回缓存结果
+    - 自己写入的文件通过 record 登记大小，无需再次stat，已缓存的上级目录同步累加
+    - 外部进程修改的目录（如pytest写allure_raw）通过 invalidate 失效后重新扫描
+    """
+
+    def __init__(self):
+        self._sizes: dict[str, int] = {}
+
+    def _ancestors(self, path: str) -> list[str]:
+        return [p for p in self._sizes if path.startswith(p + os.sep)]
+
+    def get_bytes(self, path: str) -> int:
+        path = os.path.abspath(path)
+        if path not in self._sizes:
+            self._sizes[path] = get_path_bytes(path)
+        return self._sizes[path]
+
+    def get(self, path: str, unit: str = "KB") -> float:
+        """获取路径大小（首次扫描，之后使用缓存）"""
+        return convert_size(self.get_bytes(path), unit)
+
+    def record(self, path: str, size_bytes: int) -> None:
+        """登记写入的文件大小，并增量更新已缓存的上级目录"""
+        path = os.path.abspath(path)
+        old_size = self._sizes.get(path)
+        for ancestor in self._ancestors(path):
+            if old_size is None:
+                # 文件原大小未知，无法增量更新，上级目录重新扫描
+                del self._sizes[ancestor]
+            else:
+                self._sizes[ancestor] += size_bytes - old_size
+        self._sizes[path] = size_bytes
+
+    def invalidate(self, path: str) -> None:
+        """路径内容被外部修改或删除：清除该路径、其下级和上级目录的缓存"""
+        path = os.path.abspath(path)
+        for cached in list(self._sizes):
+            if cached == path or cached.startswith(path + os.sep) or path.startswith(cached + os.sep):
+                del self._sizes[cached]
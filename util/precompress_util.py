@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+静态文件预压缩：报告生成时为文本资源写入 .gz / .br 旁路文件（同 nginx gzip_static），
+请求时按 Accept-Encoding 直接返回预压缩内容，不在请求路径上压缩
+"""
+import gzip
+import os
+from typing import Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：未安装时只生成gzip
+    brotli = None
+
+# 值得压缩的文本类资源
+COMPRESSIBLE_EXTS = {".html", ".htm", ".js", ".css", ".json", ".svg", ".txt", ".csv", ".xml", ".log", ".map"}
+# 编码名 -> 旁路文件后缀（按优先级排列）
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+DEFAULT_MIN_SIZE = 1024
+
+
+def get_available_encodings(encodings: Iterable[str]) -> list[str]:
+    """过滤出当前环境可用的编码（br 需要安装 brotli）"""
+    return [enc for enc in encodings if enc in ENCODING_SUFFIXES and (enc != "br" or brotli is not None)]
+
+
+def is_precompressed_variant(path: str) -> bool:
+    """是否为预压缩旁路文件（原文件存在且可压缩），归档时跳过"""
+    for suffix in ENCODING_SUFFIXES.values():
+        if path.endswith(suffix):
+            original = path[:-len(suffix)]
+            return os.path.splitext(original)[1].lower() in COMPRESSIBLE_EXTS and os.path.exists(original)
+    return False
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=9)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress_file(path: str, encodings: Iterable[str], min_size: int = DEFAULT_MIN_SIZE) -> int:
+    """
+    为单个文件写入预压缩旁路文件（压缩后不变小时不写入，并删除过期的旧旁路文件）
+    :return: 写入的旁路文件数
+    """
+    stat_result = os.stat(path)
+    written = 0
+    data = None
+    for encoding in encodings:
+        variant_path = path + ENCODING_SUFFIXES[encoding]
+        if stat_result.st_size < min_size:
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+            continue
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        payload = _compress(data, encoding)
+        if len(payload) >= len(data):
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+            continue
+        tmp_path = f"{variant_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, variant_path)
+        # 旁路文件与原文件时间一致，便于判断是否过期
+        os.utime(variant_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns))
+        written += 1
+    return written
+
+
+def precompress_dir(dir_path: str, encodings: Iterable[str] = ("gzip", "br"),
+                    min_size: int = DEFAULT_MIN_SIZE) -> int:
+    """
+    递归预压缩目录下的文本资源
+    :param encodings: 需要生成的编码（gzip/br，br 未安装 brotli 时自动跳过）
+    :param min_size: 小于该字节数的文件不压缩
+    :return: 写入的旁路文件数
+    """
+    encodings = get_available_encodings(encodings)
+    if not encodings or not os.path.isdir(dir_path):
+        return 0
+    written = 0
+    for root, _, files in os.walk(dir_path):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTS:
+                written += precompress_file(os.path.join(root, name), encodings, min_size)
+    return written
+
+
+def parse_accept_encoding(header: Optional[str]) -> set[str]:
+    """解析 Accept-Encoding，返回客户端接受的编码（q=0 视为不接受）"""
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(token)
+    return accepted
+
+
+def select_variant(path: str, stat_result: os.stat_result,
+                   accept_encoding: Optional[str]) -> Tuple[str, Optional[str], os.stat_result]:
+    """
+    按 Accept-Encoding 选择预压缩旁路文件（旁路文件比原文件旧时视为过期，返回原文件）
+    :return: (实际发送的文件路径, Content-Encoding（无则None）, 该文件stat)
+    """
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTS:
+        return path, None, stat_result
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if encoding not in accepted and "*" not in accepted:
+            continue
+        try:
+            variant_stat = os.stat(path + suffix)
+        except OSError:
+            continue
+        if variant_stat.st_mtime_ns == stat_result.st_mtime_ns:
+            return path + suffix, encoding, variant_stat
+    return path, None, stat_result
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+耗时埋点：设备操作（Uiautomator）与任务阶段（TestExecutor）按 设备 + 动作 记录耗时直方图
+- @timed("click")：装饰实例方法，设备ID/日志取自 self.device_id / self.log
+- with stage_timer(device_id, "stage.pytest", log)：包裹任意代码块
+- 直方图在进程内汇总（TimingRegistry），可序列化后在进程间合并（Pytest子进程 -> Web进程）
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from util.metrics_util import HistogramState
+
+# 直方图桶上界（毫秒），最后一个桶为 +Inf
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
+
+class TimingHistogram(HistogramState):
+    """设备动作耗时直方图（毫秒，在分桶计数之外记录最值与失败次数；非线程安全，由 TimingRegistry 加锁）"""
+    __slots__ = ("min_ms", "max_ms", "errors")
+
+    def __init__(self):
+        super().__init__(BUCKET_BOUNDS_MS)
+        self.min_ms = None
+        self.max_ms = None
+        self.errors = 0
+
+    def observe(self, duration_ms: float, error: bool = False) -> None:
+        super().observe(duration_ms)
+        self.min_ms = duration_ms if self.min_ms is None else min(self.min_ms, duration_ms)
+        self.max_ms = duration_ms if self.max_ms is None else max(self.max_ms, duration_ms)
+        if error:
+            self.errors += 1
+
+    def merge(self, data: dict) -> None:
+        """合并另一个直方图的序列化结果（to_dict 的输出）"""
+        if not data.get("count"):
+            return
+        self.merge_counts(data["buckets"], data["sum_ms"], data["count"])
+        self.min_ms = data["min_ms"] if self.min_ms is None else min(self.min_ms, data["min_ms"])
+        self.max_ms = data["max_ms"] if self.max_ms is None else max(self.max_ms, data["max_ms"])
+        self.errors += data.get("errors", 0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（取命中桶的上界，不超过最大值）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, value in enumerate(self.counts):
+            seen += value
+            if seen >= rank and value:
+                bound = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+                return round(min(bound, self.max_ms), 1)
+        return round(self.max_ms, 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_ms": round(self.sum, 1),
+            "avg_ms": round(self.sum / self.count, 1) if self.count else None,
+            "min_ms": round(self.min_ms, 1) if self.min_ms is not None else None,
+            "max_ms": round(self.max_ms, 1) if self.max_ms is not None else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": list(self.counts)
+        }
+
+
+class TimingRegistry:
+    """进程内耗时汇总：{设备ID: {动作: TimingHistogram}}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, str], TimingHistogram] = {}
+        self._captures: list[list] = []
+
+    def observe(self, device_id: str, action: str, duration: float, error: bool = False) -> None:
+        """
+        记录一次耗时
+        :param duration: 耗时（秒）
+        :param error: 动作是否失败（抛出异常或返回False）
+        """
+        duration_ms = duration * 1000
+        with self._lock:
+            key = (device_id or "", action)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = TimingHistogram()
+            histogram.observe(duration_ms, error)
+            for samples in self._captures:
+                samples.append((device_id, action, round(duration_ms, 1), error))
+
+    @contextmanager
+    def capture(self) -> Iterator[list]:
+        """收集代码块执行期间的每条耗时记录（用于按用例附加到Allure）"""
+        samples = []
+        with self._lock:
+            self._captures.append(samples)
+        try:
+            yield samples
+        finally:
+            with self._lock:
+                self._captures.remove(samples)
+
+    def snapshot(self, device_id: Optional[str] = None, prefix: Optional[str] = None) -> dict:
+        """
+        :param device_id: 只返回指定设备（为空表示全部）
+        :param prefix: 只返回指定前缀的动作（如 "ui." / "stage."）
+        :return: {设备ID: {动作: 直方图字典}}
+        """
+        result: dict[str, dict] = {}
+        with self._lock:
+            for (device, action), histogram in self._histograms.items():
+                if device_id and device != device_id:
+                    continue
+                if prefix and not action.startswith(prefix):
+                    continue
+                result.setdefault(device, {})[action] = histogram.to_dict()
+        return result
+
+    def merge(self, snapshot: dict) -> None:
+        """合并其他进程的汇总结果（snapshot 的输出）"""
+        with self._lock:
+            for device, actions in (snapshot or {}).items():
+                for action, data in actions.items():
+                    histogram = self._histograms.get((device, action))
+                    if histogram is None:
+                        histogram = self._histograms[(device, action)] = TimingHistogram()
+                    histogram.merge(data)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+# 进程内全局汇总（Web进程供API查询；Pytest子进程结束时写入任务目录）
+timing_registry = TimingRegistry()
+
+
+@contextmanager
+def stage_timer(device_id: str, action: str, log=None, registry: Optional[TimingRegistry] = None) -> Iterator[dict]:
+    """
+    记录代码块耗时（异常时同样记录并标记失败）
+    :return: 字典，代码块结束后包含 duration（秒），便于调用方写入结果
+    """
+    registry = registry or timing_registry
+    result = {"duration": None}
+    start = time.perf_counter()
+    error = False
+    try:
+        yield result
+    except BaseException:
+        error = True
+        raise
+    finally:
+        result["duration"] = time.perf_counter() - start
+        registry.observe(device_id, action, result["duration"], error)
+        if log is not None:
+            log.debug(
+                f"[耗时] {device_id} {action}：{result['duration'] * 1000:.1f}ms{'（失败）' if error else ''}",
+                event=action, duration=result["duration"]
+            )
+
+
+def timed(action: str, registry: Optional[TimingRegistry] = None):
+    """
+    实例方法耗时装饰器（设备ID取 self.device_id，日志取 self.log）
+    返回 False 视为动作失败
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            target = registry or timing_registry
+            start = time.perf_counter()
+            error = True
+            try:
+                result = func(self, *args, **kwargs)
+                error = result is False
+                return result
+            finally:
+                duration = time.perf_counter() - start
+                device_id = getattr(self, "device_id", "")
+                target.observe(device_id, action, duration, error)
+                log = getattr(self, "log", None)
+                if log is not None:
+                    log.debug(
+                        f"[耗时] {device_id} {action}：{duration * 1000:.1f}ms{'（失败）' if error else ''}",
+                        event=action, duration=duration
+                    )
+        return wrapper
+    return decorator
+
+
+# ------------------- 跨进程传递 -------------------
+# Pytest子进程结束时写入任务目录（<report_root>/<task_id>/device_timings.json），由执行器读取合并
+TIMING_FILE_NAME = "device_timings.json"
+
+
+def dump_timings(path: str, registry: Optional[TimingRegistry] = None) -> None:
+    registry = registry or timing_registry
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_timings(path: str) -> dict:
+    """读取子进程写入的耗时汇总（文件不存在或格式错误返回空字典）"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}